@@ -0,0 +1,207 @@
+"""
+Per-stadium fleet aggregates, maintained incrementally.
+
+`FleetAggregates.observe(name, old, new)` is a DeviceManager state listener:
+each device-state change removes the old dict's contribution and adds the
+new one, so every update is O(1) and `summary(stadium)` never walks the
+fleet. Per stadium it keeps:
+
+* device / online counts
+* battery sum, count and 1 %-wide bucket sets (mean, min + which device,
+  10-bin histogram)
+* temperature 1 °C bucket sets (max + hottest device)
+* a log-bucketed latency sketch (relative error ~2 %), rotated so
+  percentiles cover the last one to two windows
+
+`_device_to_dict` defaults battery/temperature to 0 and latency to -1 when a
+device never reported them, so those values are treated as "not reported".
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+BATTERY_BINS = 10                       # histogram bins of 10 %
+TEMP_MIN, TEMP_MAX = -40, 150           # °C, clamped
+SKETCH_GAMMA = 1.04                     # bucket width → ~2 % relative error
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+
+
+class LatencySketch:
+    """Log-bucketed quantile sketch with two rotating windows."""
+
+    def __init__(self, window_s: float):
+        self.window_s = window_s
+        self._current: dict[int, int] = {}
+        self._previous: dict[int, int] = {}
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self, now: float) -> None:
+        if now - self._rotated_at >= 2 * self.window_s:
+            self._previous, self._current = {}, {}
+        elif now - self._rotated_at >= self.window_s:
+            self._previous, self._current = self._current, {}
+        else:
+            return
+        self._rotated_at = now
+
+    def add(self, value_ms: float, now: Optional[float] = None) -> None:
+        self._rotate(now if now is not None else time.monotonic())
+        key = math.ceil(math.log(value_ms) / _LOG_GAMMA) if value_ms > 0 else 0
+        self._current[key] = self._current.get(key, 0) + 1
+
+    def quantiles(self, qs: tuple[float, ...], now: Optional[float] = None) -> tuple[int, dict]:
+        self._rotate(now if now is not None else time.monotonic())
+        counts = dict(self._previous)
+        for k, c in self._current.items():
+            counts[k] = counts.get(k, 0) + c
+        total = sum(counts.values())
+        out: dict[str, Optional[float]] = {f"p{round(q * 100)}": None for q in qs}
+        if not total:
+            return 0, out
+        keys = sorted(counts)
+        for q in qs:
+            rank, seen = q * total, 0
+            for k in keys:
+                seen += counts[k]
+                if seen >= rank:
+                    # bucket midpoint: (γ^(k-1), γ^k]
+                    out[f"p{round(q * 100)}"] = round(2 * SKETCH_GAMMA ** k / (1 + SKETCH_GAMMA), 1) if k else 0.0
+                    break
+        return total, out
+
+
+class _StadiumAggregate:
+    def __init__(self, latency_window_s: float):
+        self.devices = 0
+        self.online = 0
+        self.battery_sum = 0.0
+        self.battery_n = 0
+        self.battery: dict[int, dict[str, float]] = {}      # 1 % bucket → {device: value}
+        self.temperature: dict[int, dict[str, float]] = {}  # 1 °C bucket → {device: value}
+        self.latency = LatencySketch(latency_window_s)
+        self.updated: Optional[float] = None
+
+    @staticmethod
+    def _bucket_put(buckets: dict, key: int, name: str, value: float) -> None:
+        buckets.setdefault(key, {})[name] = value
+
+    @staticmethod
+    def _bucket_drop(buckets: dict, key: int, name: str) -> None:
+        b = buckets.get(key)
+        if b is not None:
+            b.pop(name, None)
+            if not b:
+                del buckets[key]
+
+    def apply(self, name: str, d: dict, sign: int) -> None:
+        """Add (sign=1) or remove (sign=-1) one device dict's contribution."""
+        self.devices += sign
+        if d.get("wifiConnected"):
+            self.online += sign
+
+        battery = float(d.get("batteryCharge") or 0)
+        if battery > 0:
+            self.battery_sum += sign * battery
+            self.battery_n += sign
+            key = min(int(battery), 100)
+            if sign > 0:
+                self._bucket_put(self.battery, key, name, battery)
+            else:
+                self._bucket_drop(self.battery, key, name)
+
+        temp = float(d.get("temperature") or 0)
+        if temp != 0:
+            key = max(TEMP_MIN, min(TEMP_MAX, math.floor(temp)))
+            if sign > 0:
+                self._bucket_put(self.temperature, key, name, temp)
+            else:
+                self._bucket_drop(self.temperature, key, name)
+
+    def summary(self, stadium: str) -> dict:
+        # bucket dicts hold at most 101 / 191 keys, so min()/max() here is bounded
+        battery_min = battery_min_device = None
+        if self.battery:
+            bucket = self.battery[min(self.battery)]
+            battery_min_device = min(bucket, key=bucket.get)
+            battery_min = bucket[battery_min_device]
+        histogram = [0] * BATTERY_BINS
+        for key, bucket in self.battery.items():
+            histogram[min(key // (100 // BATTERY_BINS), BATTERY_BINS - 1)] += len(bucket)
+
+        temp_max = hottest = None
+        if self.temperature:
+            bucket = self.temperature[max(self.temperature)]
+            hottest = max(bucket, key=bucket.get)
+            temp_max = bucket[hottest]
+
+        samples, pct = self.latency.quantiles((0.5, 0.9, 0.99))
+        step = 100 // BATTERY_BINS
+        return {
+            "stadium": stadium,
+            "devices": self.devices,
+            "online": self.online,
+            "offline": self.devices - self.online,
+            "online_percent": round(100.0 * self.online / self.devices, 1) if self.devices else None,
+            "battery": {
+                "reported": self.battery_n,
+                "mean": round(self.battery_sum / self.battery_n, 1) if self.battery_n else None,
+                "min": battery_min,
+                "min_device": battery_min_device,
+                "histogram": {
+                    f"{i * step}-{(i + 1) * step}": histogram[i] for i in range(BATTERY_BINS)
+                },
+            },
+            "temperature": {
+                "reported": sum(len(b) for b in self.temperature.values()),
+                "max": temp_max,
+                "hottest_device": hottest,
+            },
+            "latency_ms": {"samples": samples, **pct},
+            "updated": self.updated,
+        }
+
+
+class FleetAggregates:
+    def __init__(self, latency_window_s: Optional[float] = None):
+        self.latency_window_s = latency_window_s or float(os.getenv("LATENCY_SKETCH_WINDOW_S", "900"))
+        self._lock = threading.Lock()
+        self._stadiums: dict[str, _StadiumAggregate] = {}
+        self.dirty: set[str] = set()            # stadiums changed since the last WS summary push
+
+    def _agg(self, stadium: str) -> _StadiumAggregate:
+        agg = self._stadiums.get(stadium)
+        if agg is None:
+            agg = self._stadiums[stadium] = _StadiumAggregate(self.latency_window_s)
+        return agg
+
+    def observe(self, name: str, old: Optional[dict], new: dict) -> None:
+        """DeviceManager state listener: device `name` went from `old` to `new`."""
+        now = time.time()
+        with self._lock:
+            if old is not None:
+                st = old.get("stadium") or ""
+                self._agg(st).apply(name, old, -1)
+                self.dirty.add(st)
+            st = new.get("stadium") or ""
+            agg = self._agg(st)
+            agg.apply(name, new, 1)
+            latency = float(new.get("latencyMs", -1))
+            if latency >= 0 and (old is None or float(old.get("latencyMs", -1)) != latency):
+                agg.latency.add(latency)
+            agg.updated = now
+            self.dirty.add(st)
+
+    def summary(self, stadium: str) -> dict:
+        with self._lock:
+            agg = self._stadiums.get(stadium)
+            if agg is None:
+                agg = _StadiumAggregate(self.latency_window_s)
+            return agg.summary(stadium)
+
+    def take_dirty(self) -> list[str]:
+        with self._lock:
+            dirty, self.dirty = self.dirty, set()
+        return sorted(dirty)
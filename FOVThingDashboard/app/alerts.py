@@ -0,0 +1,277 @@
+"""
+Outbound alerting: async queue + single worker, pluggable channels.
+
+Producers call `AlertDispatcher.submit()` (event loop) or
+`submit_threadsafe()` (MQTT threads) and return immediately. The worker
+batches whatever arrives within the digest window into one message per
+channel, so "5 relays offline" is one email rather than five, and a slow
+SMTP server only ever delays the worker - never the event loop.
+"""
+
+import abc
+import asyncio
+import os
+import smtplib
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.utils import formatdate
+from typing import Optional
+
+
+@dataclass
+class Alert:
+    kind: str        # groups alerts in a digest, e.g. "relay_offline"
+    target: str      # what the alert is about (relay id, device name, ...)
+    subject: str
+    body: str
+    label: str = ""  # plural digest label, e.g. "relays offline"
+    created: float = field(default_factory=time.time)
+
+
+# ---------- channels ------------------------------------------------------
+class AlertChannel(abc.ABC):
+    """Delivery backend. `send` may raise; the dispatcher retries."""
+    name = "channel"
+
+    @abc.abstractmethod
+    async def send(self, subject: str, body: str) -> None:
+        ...
+
+
+class LogChannel(AlertChannel):
+    name = "log"
+
+    async def send(self, subject: str, body: str) -> None:
+        print(f"[ALERT] {subject}\n{body}")
+
+
+class EmailChannel(AlertChannel):
+    """
+    SMTP delivery. smtplib is blocking, so each send runs in a thread.
+
+    User/password are optional and STARTTLS can be switched off, which lets
+    a local stand-in (`python -m aiosmtpd -n -l 127.0.0.1:1025`) receive
+    alerts during development.
+    """
+    name = "email"
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        to: str,
+        frm: Optional[str] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        timeout: float = 20,
+    ):
+        self.host = host
+        self.port = port
+        self.to = to
+        self.frm = frm or user or "fov-dashboard@localhost"
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> Optional["EmailChannel"]:
+        host = os.getenv("SMTP_HOST")
+        to = os.getenv("ALERT_EMAIL_TO")
+        if not host or not to:
+            return None
+        user = os.getenv("SMTP_USER")
+        return cls(
+            host=host,
+            port=int(os.getenv("SMTP_PORT", "587")),
+            to=to,
+            frm=os.getenv("ALERT_EMAIL_FROM", user),
+            user=user,
+            password=os.getenv("SMTP_PASS"),
+            starttls=os.getenv("SMTP_STARTTLS", "1") != "0",
+        )
+
+    def _send_sync(self, subject: str, body: str) -> None:
+        msg = EmailMessage()
+        msg["From"] = self.frm
+        msg["To"] = self.to
+        msg["Subject"] = subject
+        msg["Date"] = formatdate(localtime=True)
+        msg.set_content(body)
+
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as s:
+            if self.starttls:
+                s.starttls()
+            if self.user and self.password:
+                s.login(self.user, self.password)
+            s.send_message(msg)
+
+    async def send(self, subject: str, body: str) -> None:
+        await asyncio.to_thread(self._send_sync, subject, body)
+
+
+def default_channels() -> list[AlertChannel]:
+    """Always log; add email when SMTP is configured."""
+    channels: list[AlertChannel] = [LogChannel()]
+    email = EmailChannel.from_env()
+    if email:
+        channels.append(email)
+    else:
+        print("Email alerts disabled: SMTP_HOST / ALERT_EMAIL_TO not set")
+    return channels
+
+
+# ---------- rate limiting -------------------------------------------------
+class _TargetLimiter:
+    """Token bucket per alert target: `burst` alerts, refilled over `window_s`."""
+
+    def __init__(self, burst: int, window_s: float):
+        self.burst = burst
+        self.rate = burst / window_s if window_s > 0 else float("inf")
+        self._buckets: dict[str, tuple[float, float]] = {}   # target → (tokens, ts)
+
+    def allow(self, target: str, now: float) -> bool:
+        tokens, ts = self._buckets.get(target, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - ts) * self.rate)
+        if tokens < 1:
+            self._buckets[target] = (tokens, now)
+            return False
+        self._buckets[target] = (tokens - 1, now)
+        return True
+
+
+# ---------- dispatcher ----------------------------------------------------
+class AlertDispatcher:
+    def __init__(
+        self,
+        channels: list[AlertChannel],
+        digest_window_s: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        retry_base_s: Optional[float] = None,
+        rate_burst: Optional[int] = None,
+        rate_window_s: Optional[float] = None,
+        max_queue: int = 1000,
+    ):
+        self.channels = channels
+        self.digest_window_s = digest_window_s if digest_window_s is not None else float(os.getenv("ALERT_DIGEST_WINDOW_S", "30"))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv("ALERT_MAX_ATTEMPTS", "5"))
+        self.retry_base_s = retry_base_s if retry_base_s is not None else float(os.getenv("ALERT_RETRY_BASE_S", "2"))
+        rate_window_s = rate_window_s if rate_window_s is not None else float(os.getenv("ALERT_RATE_WINDOW_S", "600"))
+        self._limiter = _TargetLimiter(
+            burst=rate_burst if rate_burst is not None else int(os.getenv("ALERT_RATE_BURST", "3")),
+            window_s=rate_window_s,
+        )
+        # suppressed counts ride along with the next digest, or go out on their own after this long
+        self.suppressed_flush_s = rate_window_s
+        self._queue: asyncio.Queue[Optional[Alert]] = asyncio.Queue(maxsize=max_queue)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._suppressed: dict[str, int] = {}                 # target → count since last digest
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "suppressed": 0, "dropped": 0}
+
+    # ---------- lifecycle -----------------------------------------------
+    def start(self) -> None:
+        """Start the worker on the running loop (call from startup)."""
+        self._loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    # ---------- producers -----------------------------------------------
+    def submit(self, alert: Alert) -> None:
+        """Queue an alert; never blocks. Must be called on the event loop."""
+        if not self._limiter.allow(alert.target, alert.created):
+            if not self._suppressed and self._loop:
+                # if no digest carries them before then, report them on their own
+                self._loop.call_later(self.suppressed_flush_s, self._flush_suppressed)
+            self._suppressed[alert.target] = self._suppressed.get(alert.target, 0) + 1
+            self.stats["suppressed"] += 1
+            return
+        try:
+            self._queue.put_nowait(alert)
+            self.stats["queued"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"Alert queue full; dropped: {alert.subject}")
+
+    def submit_threadsafe(self, alert: Alert) -> None:
+        """Queue an alert from a non-loop thread (e.g. MQTT callbacks)."""
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.submit, alert)
+        else:
+            print(f"Alert dispatcher not running; dropped: {alert.subject}")
+
+    def _flush_suppressed(self) -> None:
+        """Timer: wake the worker with a marker so pending suppressed counts get sent."""
+        if self._suppressed:
+            try:
+                self._queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass            # the queue is busy; the next digest carries them
+
+    # ---------- worker --------------------------------------------------
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.digest_window_s
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [a for a in batch if a is not None]
+            if not batch and not self._suppressed:
+                continue        # flush marker, but a digest already reported them
+            subject, body = self._compose(batch)
+            await asyncio.gather(*(self._deliver(ch, subject, body) for ch in self.channels))
+
+    def _compose(self, batch: list[Alert]) -> tuple[str, str]:
+        suppressed, self._suppressed = self._suppressed, {}
+        if len(batch) == 1 and not suppressed:
+            return batch[0].subject, batch[0].body
+
+        groups: dict[str, list[Alert]] = {}
+        for alert in batch:
+            groups.setdefault(alert.kind, []).append(alert)
+
+        headline = ", ".join(
+            f"{len(alerts)} {alerts[0].label or kind}"
+            for kind, alerts in groups.items()
+        ) or f"{sum(suppressed.values())} alerts rate-limited"
+        sections = []
+        for alerts in groups.values():
+            for alert in alerts:
+                sections.append(f"* {alert.subject}\n  {alert.body.replace(chr(10), chr(10) + '  ')}")
+        if suppressed:
+            sections.append(
+                "Rate-limited (not sent individually): "
+                + ", ".join(f"{t} ×{n}" for t, n in sorted(suppressed.items()))
+            )
+        return f"[FOV] {headline}", "\n\n".join(sections)
+
+    async def _deliver(self, channel: AlertChannel, subject: str, body: str) -> None:
+        for attempt in range(self.max_attempts):
+            try:
+                await channel.send(subject, body)
+                self.stats["sent"] += 1
+                return
+            except Exception as e:
+                delay = min(self.retry_base_s * (2 ** attempt), 300)
+                print(f"Alert via {channel.name} failed (attempt {attempt + 1}/{self.max_attempts}): {e}")
+                if attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(delay)
+        self.stats["failed"] += 1
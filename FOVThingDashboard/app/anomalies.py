@@ -0,0 +1,275 @@
+"""
+Streaming anomaly detection on device telemetry.
+
+Threshold rules (rules.py) catch "battery < 15"; they miss a tablet whose
+temperature creeps up 3 °C an hour, or one draining twice as fast as the
+rest of its stadium. Two layers:
+
+* `observe()` - a DeviceManager metric listener, O(1) per message. Per
+  device and metric it keeps an EWMA level/variance and the smoothed rate
+  of change of that level: temperature z-score → `temperature_spike`,
+  temperature rate → `temperature_trend` (°C/h), battery rate → drain
+  (%/h; charging resets it). Rates come from the level, not raw samples,
+  so sensor noise and integer battery steps don't read as trends.
+* `run_peers()` - every ANOMALY_PEER_S, per stadium: drain rates and mean
+  temperatures go into NumPy arrays and each device gets a robust z-score
+  against its peers (median / MAD) → `battery_drain_peer`,
+  `temperature_peer`. Those scores are also stored as the
+  `battery_score` / `temperature_score` metrics, thinned by the storage
+  policies like any other metric. A device not heard from for
+  ANOMALY_MAX_AGE_S drops out of the comparison; its peer anomalies
+  clear, so do its own spike/trend ones (they otherwise only clear on a
+  new sample), and then it is forgotten.
+
+Anomalies fire at their threshold and clear below threshold × CLEAR_RATIO,
+so a noisy score doesn't flap.
+"""
+
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+
+ALPHA = 0.05            # EWMA weight per sample (level / variance)
+WARMUP = 20             # samples before a device's own z-score counts
+# a sensor that barely moves would make every small step many sigmas
+STD_FLOOR = {"battery": 1.0, "temperature": 0.5}         # %, °C
+TREND_STEP_S = 600      # rates of the EWMA level are measured over at least this long ...
+TREND_ALPHA = 0.3       # ... and smoothed with this weight
+CLEAR_RATIO = 0.5       # fire at the threshold, clear below threshold × this
+PEER_MIN_DEVICES = 5    # fewer devices with data → no peer comparison
+# peers that agree exactly would make any difference infinite; and a device must
+# also be this far above the median, not just many MADs
+MAD_FLOOR = {"battery": 0.5, "temperature": 1.0}         # %/h, °C
+PEER_MIN_GAP = {"battery": 2.0, "temperature": 5.0}      # %/h, °C
+SCORE_METRICS = {"battery": "battery_score", "temperature": "temperature_score"}
+OWN_KINDS = {"temperature_spike": "temperature", "temperature_trend": "temperature"}   # kind → metric
+
+
+@dataclass
+class AnomalyEvent:
+    kind: str           # temperature_spike | temperature_trend | battery_drain_peer | temperature_peer
+    device: str
+    stadium: Optional[str]
+    score: float
+    state: str          # "fired" | "cleared"
+    ts: float
+    detail: dict = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "device": self.device,
+            "stadium": self.stadium,
+            "score": round(self.score, 2),
+            "state": self.state,
+            "ts": self.ts,
+            **self.detail,
+        }
+
+
+class _Track:
+    """Streaming state of one metric of one device."""
+    __slots__ = ("n", "mean", "var", "anchor_v", "anchor_t", "rate", "seen")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.anchor_v: Optional[float] = None
+        self.anchor_t = 0.0
+        self.rate: Optional[float] = None      # per hour, smoothed
+        self.seen = 0.0                         # time of the last sample
+
+    def update_stats(self, x: float, std_floor: float = 0.0) -> Optional[float]:
+        """z-score of x against the state *before* it, then fold x in."""
+        z = None
+        if self.n >= WARMUP:
+            std = max(math.sqrt(self.var), std_floor)
+            z = (x - self.mean) / std if std > 0 else 0.0
+        if self.n == 0:
+            self.mean = x
+        else:
+            diff = x - self.mean
+            incr = ALPHA * diff
+            self.mean += incr
+            self.var = (1 - ALPHA) * (self.var + diff * incr)
+        self.n += 1
+        return z
+
+    def update_rate(self, now: float, sign: float = 1.0) -> bool:
+        """Smoothed change of the level per hour (× sign), over steps of at least TREND_STEP_S."""
+        if self.anchor_v is None:
+            self.anchor_v, self.anchor_t = self.mean, now
+            return False
+        dt = now - self.anchor_t
+        if dt < TREND_STEP_S:
+            return False
+        r = sign * (self.mean - self.anchor_v) / dt * 3600.0
+        self.rate = r if self.rate is None else self.rate + TREND_ALPHA * (r - self.rate)
+        self.anchor_v, self.anchor_t = self.mean, now
+        return True
+
+
+def _current(tr: Optional[_Track], attr: str, cutoff: float) -> float:
+    """tr.<attr> if the track has a value and was updated since `cutoff`, else NaN."""
+    if tr is None or tr.seen < cutoff:
+        return np.nan
+    value = getattr(tr, attr)
+    return np.nan if value is None else value
+
+
+def peer_scores(values: np.ndarray, mad_floor: float, min_gap: float) -> np.ndarray:
+    """Robust z (0.6745·(v − median) / MAD) of each value vs the rest; NaN = no data → 0."""
+    ok = ~np.isnan(values)
+    scores = np.zeros(len(values))
+    if ok.sum() < PEER_MIN_DEVICES:
+        return scores
+    med = np.median(values[ok])
+    mad = max(float(np.median(np.abs(values[ok] - med))), mad_floor)
+    gap = np.where(ok, values - med, 0.0)
+    scores[ok] = 0.6745 * gap[ok] / mad
+    scores[gap < min_gap] = np.minimum(scores[gap < min_gap], 0.0)
+    return scores
+
+
+class AnomalyDetector:
+    def __init__(
+        self,
+        on_event: Optional[Callable[[AnomalyEvent], None]] = None,
+        on_score: Optional[Callable[[str, Optional[str], str, str], None]] = None,
+    ):
+        self.on_event = on_event
+        self.on_score = on_score            # fn(device, stadium, metric, value) - stores the score
+        self.z_fire = float(os.getenv("ANOMALY_Z", "4"))
+        self.trend_fire = float(os.getenv("ANOMALY_TEMP_TREND", "3"))       # °C/h
+        self.peer_fire = float(os.getenv("ANOMALY_PEER_Z", "3.5"))
+        self.peer_interval_s = float(os.getenv("ANOMALY_PEER_S", "60"))
+        self.max_age_s = float(os.getenv("ANOMALY_MAX_AGE_S", "900"))    # silent longer → out of the peers
+        # stadium → device → metric → _Track
+        self._stadiums: dict[Optional[str], dict[str, dict[str, _Track]]] = {}
+        self._active: dict[tuple, dict] = {}    # (stadium, device, kind) → last event dict
+        self._lock = threading.Lock()
+
+    # ---------- per message ----------
+    def observe(self, device: str, stadium: Optional[str], metric: str, value, now: Optional[float] = None) -> None:
+        if metric not in SCORE_METRICS:
+            return
+        try:
+            x = float(value)
+        except (TypeError, ValueError):
+            return
+        if x == 0:
+            return              # 0 = "not reported" (see aggregates.py)
+        now = now if now is not None else time.time()
+        events: list[AnomalyEvent] = []
+        with self._lock:
+            tracks = self._stadiums.setdefault(stadium, {}).setdefault(device, {})
+            tr = tracks.get(metric)
+            if tr is None or (metric == "battery" and tr.n and x > tr.mean + 1):
+                tr = tracks[metric] = _Track()      # new, or a battery that is charging: start over
+            z = tr.update_stats(x, STD_FLOOR[metric])
+            tr.seen = now
+            if metric == "temperature":
+                if z is not None:
+                    self._judge(events, stadium, device, "temperature_spike", abs(z), self.z_fire, now,
+                                value=x, mean=round(tr.mean, 2))
+                if tr.update_rate(now):
+                    self._judge(events, stadium, device, "temperature_trend", tr.rate, self.trend_fire, now,
+                                rate_per_h=round(tr.rate, 2))
+            else:
+                tr.update_rate(now, sign=-1.0)      # drain: positive while discharging
+        self._emit(events)
+
+    def _judge(self, events: list, stadium, device: str, kind: str, score: float, threshold: float, now: float, **detail):
+        key = (stadium, device, kind)
+        active = self._active.get(key)
+        if active is None and score >= threshold:
+            ev = AnomalyEvent(kind, device, stadium, score, "fired", now, detail)
+            self._active[key] = ev.to_dict()
+            events.append(ev)
+        elif active is not None:
+            if score < threshold * CLEAR_RATIO:
+                del self._active[key]
+                events.append(AnomalyEvent(kind, device, stadium, score, "cleared", now, detail))
+            else:
+                active.update(score=round(score, 2), **detail)
+
+    def _emit(self, events: list[AnomalyEvent]) -> None:
+        if not self.on_event:
+            return
+        for ev in events:
+            try:
+                self.on_event(ev)
+            except Exception as e:
+                print(f"Anomaly event handler failed: {e}")
+
+    # ---------- peer comparison ----------
+    def run_peers(self, now: Optional[float] = None) -> list[AnomalyEvent]:
+        """Score every device against its stadium's peers; fire/clear the peer anomalies."""
+        now = now if now is not None else time.time()
+        events: list[AnomalyEvent] = []
+        stored: list[tuple] = []
+        cutoff = now - self.max_age_s
+        with self._lock:
+            for stadium, devices in self._stadiums.items():
+                names = list(devices)
+                # a device gone quiet is NaN like one without data, so its peer anomalies clear
+                columns = {
+                    "battery": np.array([_current(t.get("battery"), "rate", cutoff) for t in devices.values()]),
+                    "temperature": np.array([_current(t.get("temperature"), "mean", cutoff) for t in devices.values()]),
+                }
+                for metric, values in columns.items():
+                    kind = "battery_drain_peer" if metric == "battery" else "temperature_peer"
+                    scores = peer_scores(values, MAD_FLOOR[metric], PEER_MIN_GAP[metric])
+                    # only devices over the threshold or currently firing need a decision
+                    firing = {d for (st, d, k) in self._active if st == stadium and k == kind}
+                    for i in np.flatnonzero(scores >= self.peer_fire):
+                        firing.add(names[i])
+                    index = {name: i for i, name in enumerate(names)} if firing else {}
+                    for name in firing:
+                        i = index[name]
+                        self._judge(events, stadium, name, kind, float(scores[i]), self.peer_fire, now,
+                                    value=None if np.isnan(values[i]) else round(float(values[i]), 2))
+                    for i in np.flatnonzero(~np.isnan(values)):
+                        stored.append((names[i], stadium, SCORE_METRICS[metric], f"{scores[i]:.2f}"))
+            self._clear_silent(events, cutoff, now)
+            self._expire(cutoff)
+        self._emit(events)
+        if self.on_score:
+            for device, stadium, metric, value in stored:
+                try:
+                    self.on_score(device, stadium, metric, value)
+                except Exception as e:
+                    print(f"Anomaly score store failed: {e}")
+                    break
+        return events
+
+    def _clear_silent(self, events: list, cutoff: float, now: float) -> None:
+        """Clear a device's own anomalies once it has gone quiet: only a new sample would clear them."""
+        for (stadium, device, kind), active in list(self._active.items()):
+            metric = OWN_KINDS.get(kind)
+            if metric is None:
+                continue
+            tr = self._stadiums.get(stadium, {}).get(device, {}).get(metric)
+            if tr is None or tr.seen < cutoff:
+                del self._active[(stadium, device, kind)]
+                events.append(AnomalyEvent(kind, device, stadium, 0.0, "cleared", now, {"reason": "silent"}))
+
+    def _expire(self, cutoff: float) -> None:
+        """Forget devices silent since `cutoff` that have nothing firing (caller holds the lock)."""
+        firing = {(st, d) for (st, d, _) in self._active}
+        for stadium, devices in list(self._stadiums.items()):
+            for name, tracks in list(devices.items()):
+                if (stadium, name) not in firing and all(t.seen < cutoff for t in tracks.values()):
+                    del devices[name]
+            if not devices:
+                del self._stadiums[stadium]
+
+    def active(self) -> list[dict]:
+        with self._lock:
+            return [dict(a) for a in self._active.values()]
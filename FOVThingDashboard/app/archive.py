@@ -0,0 +1,422 @@
+"""
+Cold archive for old `device_logs` rows.
+
+`Archiver` moves whole UTC days older than the hot window (ARCHIVE_HOT_DAYS)
+out of SQLite into one immutable file per day under ARCHIVE_DIR, then
+deletes them from the live table. `ArchiveStore` reads those files through
+mmap, so history/series queries that reach past the hot window see the
+archived rows transparently.
+
+File layout (`YYYY-MM-DD.fova`):
+
+    b"FOVA1\n" | block | block | ... | index (zlib JSON) | >Q index length | b"FOVAIDX1"
+
+One block holds up to BLOCK_ROWS rows of one (device, stadium, metric) series, as
+three zlib streams:
+
+* ids        - first id + deltas (int64, byte-shuffled)
+* timestamps - µs since epoch as first value, first delta, then
+               delta-of-deltas (regular reporting intervals → mostly 0)
+* values     - "f64":  plain numerals with a fixed number of decimals
+                       (latency), stored as XOR of consecutive float64 bit
+                       patterns, byte-shuffled (Gorilla-style, zlib instead
+                       of bit packing)
+               "dict": anything else (JSON bodies, versions, OTA) as a
+                       dictionary of distinct strings + uint32 codes
+
+Both codecs are lossless: a read returns exactly the stored metric_value.
+The index keeps per-block device/metric, min/max time and min/max id, so
+reads only decompress blocks that can match.
+
+A day's file is renamed into place before its rows are deleted, and the
+DELETE runs in ARCHIVE_DELETE_BATCH-row transactions. A crash in between
+leaves rows in both places; the next run skips ids already present in
+that day's files and only finishes the delete.
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from timeseries import format_ts, parse_ts
+
+MAGIC = b"FOVA1\n"
+TRAILER = struct.Struct(">Q8s")
+TRAILER_MAGIC = b"FOVAIDX1"
+BLOCK_ROWS = 4096
+_NUMERAL = re.compile(r"-?\d+(?:\.(\d+))?")
+
+
+def default_archive_dir() -> Path:
+    db_path = Path(os.getenv("DB_PATH", Path(__file__).with_name("fov_dashboard.db"))).expanduser().resolve()
+    return Path(os.getenv("ARCHIVE_DIR", db_path.parent / "archive"))
+
+
+# ---------- column codecs ----------
+
+def _shuffle(a: np.ndarray) -> bytes:
+    """Group byte 0 of every value, then byte 1, ... - zlib finds the zeros."""
+    return zlib.compress(a.astype("<i8").view(np.uint8).reshape(-1, 8).T.tobytes(), 6)
+
+
+def _unshuffle(buf: bytes, n: int) -> np.ndarray:
+    raw = np.frombuffer(zlib.decompress(buf), dtype=np.uint8).reshape(8, n)
+    return raw.T.copy().view("<i8").ravel()
+
+
+def _encode_ids(ids: np.ndarray) -> bytes:
+    return _shuffle(np.concatenate((ids[:1], np.diff(ids))))
+
+
+def _decode_ids(buf: bytes, n: int) -> np.ndarray:
+    return np.cumsum(_unshuffle(buf, n))
+
+
+def _encode_ts(us: np.ndarray) -> bytes:
+    if len(us) < 2:
+        return _shuffle(us)
+    d = np.diff(us)
+    return _shuffle(np.concatenate((us[:1], d[:1], np.diff(d))))
+
+
+def _decode_ts(buf: bytes, n: int) -> np.ndarray:
+    head = _unshuffle(buf, n)
+    if n < 2:
+        return head
+    deltas = np.cumsum(head[1:])
+    return head[0] + np.concatenate(([0], np.cumsum(deltas)))
+
+
+def _float_decimals(values: list[str]) -> Optional[int]:
+    """Decimals if every value round-trips through f"{float(v):.{d}f}", else None."""
+    m = _NUMERAL.fullmatch(values[0])
+    if not m:
+        return None
+    dec = len(m.group(1) or "")
+    for v in values:
+        if not _NUMERAL.fullmatch(v) or f"{float(v):.{dec}f}" != v:
+            return None
+    return dec
+
+
+def _encode_values(values: list[str]) -> tuple[str, Optional[int], bytes]:
+    dec = _float_decimals(values)
+    if dec is not None:
+        bits = np.array([float(v) for v in values], dtype=np.float64).view(np.int64)
+        xored = bits ^ np.concatenate(([0], bits[:-1]))
+        return "f64", dec, _shuffle(xored)
+    distinct = list(dict.fromkeys(values))
+    index = {v: i for i, v in enumerate(distinct)}
+    head = json.dumps(distinct).encode()
+    codes = np.array([index[v] for v in values], dtype="<u4")
+    return "dict", None, zlib.compress(struct.pack(">I", len(head)) + head + codes.tobytes(), 6)
+
+
+def _decode_values(codec: str, dec: Optional[int], buf: bytes, n: int) -> list[str]:
+    if codec == "f64":
+        floats = np.bitwise_xor.accumulate(_unshuffle(buf, n)).view(np.float64)
+        return [f"{v:.{dec}f}" for v in floats]
+    raw = zlib.decompress(buf)
+    (size,) = struct.unpack_from(">I", raw)
+    distinct = json.loads(raw[4:4 + size])
+    codes = np.frombuffer(raw, dtype="<u4", offset=4 + size)
+    return [distinct[c] for c in codes]
+
+
+# ---------- writing ----------
+
+def _blocks(rows: Iterable[tuple]) -> Iterable[list[tuple]]:
+    """Consecutive rows of one (device, stadium, metric), at most BLOCK_ROWS at a time."""
+    chunk: list[tuple] = []
+    series = None
+    for r in rows:
+        key = (r[2], r[3], r[4])
+        if chunk and (key != series or len(chunk) >= BLOCK_ROWS):
+            yield chunk
+            chunk = []
+        series = key
+        chunk.append(r)
+    if chunk:
+        yield chunk
+
+
+def write_archive_file(path: Path, rows: Iterable[tuple]) -> int:
+    """
+    rows: (id, ts string, device, stadium, metric, value) sorted by
+    device, stadium, metric, id - consumed one block at a time, so a
+    streamed query never has to be held in memory. Written to a temp file
+    and renamed into place; no rows → no file. Returns the block count.
+    """
+    tmp = path.with_suffix(".tmp")
+    index = []
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        for chunk in _blocks(rows):
+            device, stadium, metric = chunk[0][2], chunk[0][3], chunk[0][4]
+            ids = np.array([r[0] for r in chunk], dtype=np.int64)
+            us = np.round(parse_ts([str(r[1]) for r in chunk]) * 1e6).astype(np.int64)
+            codec, dec, vals = _encode_values([r[5] or "" for r in chunk])
+            ids_b, ts_b = _encode_ids(ids), _encode_ts(us)
+            index.append({
+                "device": device, "stadium": stadium, "metric": metric, "n": len(chunk),
+                "t_min": int(us.min()), "t_max": int(us.max()),
+                "id_min": int(ids.min()), "id_max": int(ids.max()),
+                "off": f.tell(), "ids": len(ids_b), "ts": len(ts_b), "val": len(vals),
+                "codec": codec, "dec": dec,
+            })
+            f.write(ids_b)
+            f.write(ts_b)
+            f.write(vals)
+        if not index:
+            f.close()
+            tmp.unlink()
+            return 0
+        footer = zlib.compress(json.dumps(index).encode(), 6)
+        f.write(footer)
+        f.write(TRAILER.pack(len(footer), TRAILER_MAGIC))
+    os.replace(tmp, path)
+    return len(index)
+
+
+# ---------- reading ----------
+
+def _epoch_us(dt: datetime) -> int:
+    """Naive UTC datetime (as stored) → µs since epoch."""
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+
+
+class ArchiveFile:
+    def __init__(self, path: Path):
+        self.path = path
+        self._fh = open(path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        size, magic = TRAILER.unpack(self._mm[-TRAILER.size:])
+        if self._mm[:len(MAGIC)] != MAGIC or magic != TRAILER_MAGIC:
+            raise ValueError(f"{path} is not an archive file")
+        footer_at = len(self._mm) - TRAILER.size - size
+        self.blocks: list[dict] = json.loads(zlib.decompress(self._mm[footer_at:footer_at + size]))
+        self.id_min = min((b["id_min"] for b in self.blocks), default=0)
+        self.id_max = max((b["id_max"] for b in self.blocks), default=0)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._fh.close()
+
+    def read_block(self, b: dict) -> tuple[np.ndarray, np.ndarray, list[str]]:
+        o, n = b["off"], b["n"]
+        ids = _decode_ids(self._mm[o:o + b["ids"]], n)
+        o += b["ids"]
+        us = _decode_ts(self._mm[o:o + b["ts"]], n)
+        o += b["ts"]
+        values = _decode_values(b["codec"], b["dec"], self._mm[o:o + b["val"]], n)
+        return ids, us, values
+
+
+class ArchiveStore:
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory or default_archive_dir())
+        self._lock = threading.Lock()
+        self._files: dict[str, ArchiveFile] = {}
+        self._dir_mtime: Optional[float] = None
+        self.boundary: Optional[datetime] = None    # rows before this may be archived
+
+    def refresh(self) -> None:
+        """Pick up files written by the archiver (maybe in another process)."""
+        try:
+            mtime = self.directory.stat().st_mtime
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime == self._dir_mtime:
+                return
+            self._dir_mtime = mtime
+            for path in sorted(self.directory.glob("*.fova")):
+                if path.name not in self._files:
+                    try:
+                        self._files[path.name] = ArchiveFile(path)
+                    except (OSError, ValueError) as e:
+                        print(f"Skipping archive file {path}: {e}")
+            if self._files:
+                newest = max(name.split(".")[0] for name in self._files)
+                self.boundary = datetime.fromisoformat(newest) + timedelta(days=1)
+
+    def archived_ids(self, day: str) -> set[int]:
+        """Ids already stored in the files for `day` (YYYY-MM-DD)."""
+        self.refresh()
+        with self._lock:
+            files = [af for name, af in self._files.items() if name.split(".")[0] == day]
+        ids: set[int] = set()
+        for af in files:
+            for b in af.blocks:
+                ids.update(_decode_ids(af._mm[b["off"]:b["off"] + b["ids"]], b["n"]).tolist())
+        return ids
+
+    def covers(self, start_time: Optional[datetime]) -> bool:
+        self.refresh()
+        return self.boundary is not None and (start_time is None or start_time < self.boundary)
+
+    def scan(
+        self,
+        metric: Optional[str] = None,
+        device: Optional[str] = None,
+        devices: Optional[Iterable[str]] = None,
+        stadium: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> list[tuple]:
+        """
+        Matching archived rows as (id, ts string, device, stadium, metric, value),
+        highest id first. With `limit`, stops once enough newer rows were found.
+        """
+        if not self.covers(start_time):
+            return []
+        wanted = set(devices) if devices else None
+        t_lo = _epoch_us(start_time) if start_time else None
+        t_hi = _epoch_us(end_time) if end_time else None
+        with self._lock:
+            files = sorted(self._files.values(), key=lambda f: f.id_max, reverse=True)
+
+        out: list[tuple] = []
+        for af in files:
+            if limit is not None and len(out) >= limit:
+                break                                   # older files only hold lower ids
+            if before_id is not None and af.id_min >= before_id:
+                continue
+            for b in af.blocks:
+                if (metric and b["metric"] != metric) or (device and b["device"] != device) \
+                        or (wanted is not None and b["device"] not in wanted) \
+                        or (stadium and b["stadium"] != stadium) \
+                        or (t_lo is not None and b["t_max"] < t_lo) \
+                        or (t_hi is not None and b["t_min"] > t_hi) \
+                        or (before_id is not None and b["id_min"] >= before_id):
+                    continue
+                ids, us, values = af.read_block(b)
+                keep = np.ones(len(ids), dtype=bool)
+                if t_lo is not None:
+                    keep &= us >= t_lo
+                if t_hi is not None:
+                    keep &= us <= t_hi
+                if before_id is not None:
+                    keep &= ids < before_id
+                sel = np.flatnonzero(keep)
+                for i, ts in zip(sel, format_ts(us[sel] / 1e6)):
+                    out.append((int(ids[i]), ts, b["device"], b["stadium"], b["metric"], values[i]))
+        out.sort(key=lambda r: r[0], reverse=True)
+        return out[:limit] if limit is not None else out
+
+
+# ---------- archiver ----------
+
+class Archiver:
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        store: ArchiveStore,
+        hot_days: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.store = store
+        self.hot_days = hot_days if hot_days is not None else int(os.getenv("ARCHIVE_HOT_DAYS", "30"))
+        self.delete_batch = max(1, int(os.getenv("ARCHIVE_DELETE_BATCH", "5000")))
+        self.stats = {"runs": 0, "files": 0, "rows": 0, "bytes": 0, "last_run": None}
+
+    def _target(self, day: str) -> Path:
+        path = self.store.directory / f"{day}.fova"
+        n = 1
+        while path.exists():                    # late rows for an archived day → another file
+            path = self.store.directory / f"{day}.{n}.fova"
+            n += 1
+        return path
+
+    def run_once(self) -> int:
+        """Archive every complete UTC day older than the hot window. Returns rows moved."""
+        if self.hot_days <= 0:
+            return 0
+        cutoff = (datetime.utcnow() - timedelta(days=self.hot_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.store.directory.mkdir(parents=True, exist_ok=True)
+        moved = 0
+        session = self.session_factory()
+        try:
+            oldest = session.execute(text("SELECT MIN(timestamp) FROM device_logs")).scalar()
+            if not oldest:
+                return 0
+            day = datetime.fromisoformat(str(oldest)).replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < cutoff:
+                nxt = day + timedelta(days=1)
+                bounds = {"a": day.isoformat(sep=" "), "b": nxt.isoformat(sep=" ")}
+                # streamed in series order straight into the block writer: a busy day is
+                # millions of rows, and only one block of them is held at a time
+                result = session.execute(text("""
+                    SELECT dl.id, dl.timestamp, d.name, d.stadium, dl.metric_type, dl.metric_value
+                    FROM device_logs dl JOIN devices d ON dl.device_id = d.id
+                    WHERE dl.timestamp >= :a AND dl.timestamp < :b
+                    ORDER BY d.name, d.stadium, dl.metric_type, dl.id
+                """), bounds).yield_per(BLOCK_ROWS)
+                # rows left behind by a crash after the file was written are already archived
+                done = self.store.archived_ids(day.date().isoformat())
+                seen = {"rows": 0, "fresh": 0, "max_id": 0}
+
+                def fresh_rows():
+                    for r in result:
+                        seen["rows"] += 1
+                        seen["max_id"] = max(seen["max_id"], r[0])
+                        if r[0] not in done:
+                            seen["fresh"] += 1
+                            yield tuple(r)
+
+                path = self._target(day.date().isoformat())
+                if write_archive_file(path, fresh_rows()):
+                    moved += seen["fresh"]
+                    self.stats["files"] += 1
+                    self.stats["bytes"] += path.stat().st_size
+                    print(f"Archived {seen['fresh']} log rows for {day.date()} → {path.name} ({path.stat().st_size} bytes)")
+                if seen["fresh"] < seen["rows"]:
+                    print(f"Archive: {seen['rows'] - seen['fresh']} rows for {day.date()} were already archived; deleting them")
+                if seen["rows"]:
+                    self._delete(session, bounds, seen["max_id"])
+                day = nxt
+        finally:
+            session.close()
+        self.stats["runs"] += 1
+        self.stats["rows"] += moved
+        self.stats["last_run"] = datetime.utcnow().isoformat()
+        if moved:
+            self.store.refresh()
+        return moved
+
+    def _delete(self, session, bounds: dict, max_id: int) -> None:
+        """Delete an archived day in short transactions, so ingest writers aren't locked out."""
+        while True:
+            deleted = session.execute(text("""
+                DELETE FROM device_logs WHERE id IN (
+                    SELECT id FROM device_logs
+                    WHERE timestamp >= :a AND timestamp < :b AND id <= :max_id
+                    LIMIT :n
+                )
+            """), {**bounds, "max_id": max_id, "n": self.delete_batch}).rowcount
+            session.commit()
+            if deleted < self.delete_batch:
+                return
+
+    async def run_forever(self, interval_s: Optional[float] = None) -> None:
+        interval_s = interval_s or float(os.getenv("ARCHIVE_INTERVAL_S", "3600"))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"Archiver failed: {e}")
+            await asyncio.sleep(interval_s)
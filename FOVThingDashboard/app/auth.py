@@ -59,3 +59,11 @@ def is_admin(claims: dict) -> bool:
 
 def stadium_from_claims(claims: dict) -> Optional[str]:
     return claims.get("sub") if claims.get("sub_type") == "stadium" else None
+
+def require_admin(claims: dict = Depends(get_current_subject)) -> dict:
+    if not is_admin(claims):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return claims
+
+def can_view_stadium(claims: dict, slug: str) -> bool:
+    return is_admin(claims) or stadium_from_claims(claims) == slug
@@ -3,7 +3,8 @@ from __future__ import annotations
 
 import threading
 import time
-from typing import Callable, Dict
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List, Optional, Tuple
 
 from awscrt import mqtt, exceptions as awscrt_exceptions
 from awsiot import mqtt_connection_builder
@@ -51,6 +52,18 @@ class IOTClient:
         self.connected = True
         print("… connected")
 
+    def connect_async(self) -> Future:
+        """Start connecting; the returned future resolves once CONNACK arrives."""
+        print(f"MQTT connect … ({self.credentials.endpoint})")
+        fut = self._mqtt.connect()
+
+        def _done(f: Future) -> None:
+            if f.exception() is None:
+                self.connected = True
+                print(f"… connected ({self.credentials.endpoint})")
+        fut.add_done_callback(_done)
+        return fut
+
     def disconnect(self) -> None:
         print("MQTT disconnect …")
         self._mqtt.disconnect().result()
@@ -58,12 +71,13 @@ class IOTClient:
         print("… disconnected")
 
     # ---- publish ------------------------------------------------------ #
-    def publish(self, topic: str, payload: str | bytes) -> None:
+    def publish(self, topic: str, payload: str | bytes, qos: int = 0) -> Future | None:
+        """Returns the CRT future: resolves on send (QoS 0) or on PUBACK (QoS 1)."""
         if not self.connected:
             print("WARNING: publish skipped - not connected")
-            return
-        publish_future, packet_id = self._mqtt.publish(topic=topic, payload=payload, qos=mqtt.QoS.AT_MOST_ONCE)
-        print(f"Published message: {payload} to topic: {topic} with packet id: {packet_id}")
+            return None
+        publish_future, _packet_id = self._mqtt.publish(topic=topic, payload=payload, qos=mqtt.QoS(int(qos)))
+        return publish_future
 
     # ---- subscribe (fixed) ------------------------------------------- #
     def subscribe(self, topic: str, handler: Handler) -> None:
@@ -75,6 +89,35 @@ class IOTClient:
         self._subs[topic] = handler
         print(f"Subscribed to: {topic}")
 
+    def subscribe_many(
+        self, subscriptions: List[Tuple[str, Handler]], timeout: Optional[float] = None
+    ) -> Dict[str, Optional[BaseException]]:
+        """
+        Pipelined subscribe: every SUBSCRIBE goes out before any SUBACK is
+        awaited, so N topics cost ~1 round-trip instead of N.
+        (MQTT 3.1.1 in awscrt has no multi-topic SUBSCRIBE for new topics.)
+
+        Returns topic → None on success or the exception.
+        """
+        pending: Dict[str, Future] = {}
+        for topic, handler in subscriptions:
+            fut, _packet_id = self._mqtt.subscribe(
+                topic=topic, qos=mqtt.QoS.AT_MOST_ONCE, callback=handler
+            )
+            pending[topic] = fut
+            self._subs[topic] = handler
+        wait(pending.values(), timeout=timeout)
+
+        results: Dict[str, Optional[BaseException]] = {}
+        for topic, fut in pending.items():
+            if not fut.done():
+                results[topic] = TimeoutError(f"no SUBACK for {topic}")
+            else:
+                results[topic] = fut.exception()
+        ok = sum(1 for e in results.values() if e is None)
+        print(f"Subscribed to {ok}/{len(results)} topics on {self.credentials.endpoint}")
+        return results
+
     # ------------------------------------------------------------------ #
     # internal callbacks
     # ------------------------------------------------------------------ #
@@ -97,12 +140,39 @@ class IOTClient:
 
     # ------------------------------------------------------------------ #
     def _resubscribe_all(self) -> None:
+        """
+        Session lost: one SUBSCRIBE packet carrying every known topic.
+        Runs on the CRT callback thread, so nothing here blocks on a future.
+        """
+        try:
+            fut, _ = self._mqtt.resubscribe_existing_topics()
+        except Exception as exc:
+            print(f"Batched re-subscribe failed ({exc}); falling back to per-topic")
+            self._resubscribe_each()
+            return
+
+        def _done(f: Future) -> None:
+            exc = f.exception()
+            if exc is None:
+                print(f"Re-subscribed to {len(f.result().get('topics') or [])} topics in one packet")
+            else:
+                print(f"Batched re-subscribe failed ({exc}); falling back to per-topic")
+                self._resubscribe_each()
+        fut.add_done_callback(_done)
+
+    def _resubscribe_each(self) -> None:
         for topic, handler in self._subs.items():
             try:
                 fut, _ = self._mqtt.subscribe(                  #  ← unpack
                     topic=topic, qos=mqtt.QoS.AT_MOST_ONCE, callback=handler
                 )
-                fut.result()
-                print(f"Re-subscribed to: {topic}")
             except Exception as exc:
                 print(f"Failed to re-subscribe {topic}: {exc}")
+                continue
+
+            def _done(f: Future, topic: str = topic) -> None:
+                if f.exception() is None:
+                    print(f"Re-subscribed to: {topic}")
+                else:
+                    print(f"Failed to re-subscribe {topic}: {f.exception()}")
+            fut.add_done_callback(_done)
@@ -0,0 +1,242 @@
+# aws_iot/IOTClient5.py
+"""
+MQTT5 counterpart of IOTClient with the same surface (connect/connect_async,
+publish, subscribe, subscribe_many, connected).
+
+Its reason to exist is shared subscriptions: a filter written as
+`$share/<group>/<topic filter>` makes the broker deliver each matching
+message to only one client in the group, so several dashboard instances
+can split the telemetry stream instead of all receiving (and logging)
+every message.
+
+The CRT client keeps retrying on its own after a failed connect, so a
+client whose first connect failed or timed out is not dead: bootstrap
+hands it its filters with `subscribe_when_connected` and it subscribes
+on whichever later connect succeeds.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from awscrt import mqtt5
+from awsiot import mqtt5_client_builder
+
+from aws_iot.IOTClient import Handler
+from aws_iot.IOTContext import IOTContext, IOTCredentials
+
+MAX_SUBSCRIPTIONS_PER_PACKET = 8   # AWS IoT Core limit
+
+
+def strip_share(topic_filter: str) -> str:
+    """`$share/group/a/+/b` → `a/+/b` (what incoming PUBLISH topics match)."""
+    if topic_filter.startswith("$share/"):
+        parts = topic_filter.split("/", 2)
+        return parts[2] if len(parts) == 3 else ""
+    return topic_filter
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    f_parts = topic_filter.split("/")
+    t_parts = topic.split("/")
+    for i, f in enumerate(f_parts):
+        if f == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if f != "+" and f != t_parts[i]:
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+class IOTClient5:
+    def __init__(
+        self,
+        context: IOTContext,
+        credentials: IOTCredentials,
+        ca_bytes: bytes | None = None,
+    ) -> None:
+        self.context = context
+        self.credentials = credentials
+
+        self.connected = False
+        self._subs: Dict[str, Handler] = {}            # filter as subscribed ($share/... kept) → handler
+        self._match: List[Tuple[str, Handler]] = []    # (plain filter, handler) for dispatch
+        self._lock = threading.Lock()
+        self._first_connect: Optional[Future] = None
+        self._acked = False            # a SUBACK came back on the current session
+        self._deferred = False         # caller gave up on the first connect; subscribe ourselves
+        self._on_ready: Optional[Callable[[int, int], None]] = None
+
+        self._client = mqtt5_client_builder.mtls_from_path(
+            endpoint=credentials.endpoint,
+            port=credentials.port,
+            cert_filepath=credentials.cert_path,
+            pri_key_filepath=credentials.priv_key_path,
+            ca_filepath=credentials.ca_path,
+            ca_bytes=ca_bytes,
+            client_bootstrap=context.client_bootstrap,
+            client_id=credentials.client_id,
+            session_behavior=mqtt5.ClientSessionBehaviorType.REJOIN_POST_SUCCESS,
+            keep_alive_interval_sec=30,
+            on_publish_received=self._on_publish,
+            on_lifecycle_connection_success=self._on_success,
+            on_lifecycle_connection_failure=self._on_failure,
+            on_lifecycle_disconnection=self._on_disconnect,
+        )
+
+    # ------------------------------------------------------------------ #
+    def connect_async(self) -> Future:
+        print(f"MQTT5 connect … ({self.credentials.endpoint})")
+        self._first_connect = Future()
+        self._client.start()
+        return self._first_connect
+
+    def connect(self) -> None:
+        self.connect_async().result()
+
+    def disconnect(self) -> None:
+        print("MQTT5 disconnect …")
+        self._client.stop()
+        self.connected = False
+
+    # ---- publish ------------------------------------------------------ #
+    def publish(self, topic: str, payload: str | bytes, qos: int = 0) -> Future | None:
+        """Returns the CRT future: resolves on send (QoS 0) or on PUBACK (QoS 1)."""
+        if not self.connected:
+            print("WARNING: publish skipped - not connected")
+            return None
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return self._client.publish(mqtt5.PublishPacket(topic=topic, payload=payload, qos=mqtt5.QoS(int(qos))))
+
+    # ---- subscribe ---------------------------------------------------- #
+    def _remember(self, topic_filter: str, handler: Handler) -> None:
+        with self._lock:
+            self._subs[topic_filter] = handler
+            self._match = [(strip_share(f), h) for f, h in self._subs.items()]
+
+    def _send_subscribes(self, filters: List[str]) -> List[Tuple[List[str], Future]]:
+        """Multi-topic SUBSCRIBE packets, at most 8 filters each."""
+        sent = []
+        for i in range(0, len(filters), MAX_SUBSCRIPTIONS_PER_PACKET):
+            chunk = filters[i:i + MAX_SUBSCRIPTIONS_PER_PACKET]
+            packet = mqtt5.SubscribePacket(subscriptions=[
+                mqtt5.Subscription(topic_filter=f, qos=mqtt5.QoS.AT_MOST_ONCE) for f in chunk
+            ])
+            sent.append((chunk, self._client.subscribe(packet)))
+        return sent
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        err = self.subscribe_many([(topic, handler)])[topic]
+        if err is not None:
+            raise err
+
+    def subscribe_many(
+        self, subscriptions: List[Tuple[str, Handler]], timeout: Optional[float] = None
+    ) -> Dict[str, Optional[BaseException]]:
+        for topic, handler in subscriptions:
+            self._remember(topic, handler)
+        sent = self._send_subscribes([t for t, _ in subscriptions])
+        wait([f for _, f in sent], timeout=timeout)
+        results = self._results(sent)
+        ok = sum(1 for e in results.values() if e is None)
+        if ok:
+            self._acked = True
+        print(f"Subscribed to {ok}/{len(results)} topics on {self.credentials.endpoint} (MQTT5)")
+        return results
+
+    def subscribe_when_connected(
+        self, subscriptions: List[Tuple[str, Handler]], on_ready: Optional[Callable[[int, int], None]] = None
+    ) -> None:
+        """
+        For a client whose first connect failed or timed out: remember the
+        filters and subscribe on the next successful connect (or now, if one
+        has already happened). `on_ready(ok, total)` reports the SUBACKs.
+        """
+        for topic, handler in subscriptions:
+            self._remember(topic, handler)
+        self._on_ready = on_ready
+        self._deferred = True
+        if self.connected:
+            self._resubscribe("late connect")
+
+    def _resubscribe(self, reason: str) -> None:
+        """Fire-and-forget from the callback thread; the SUBACKs are checked in a done-callback."""
+        with self._lock:
+            filters = list(self._subs)
+        if not filters:
+            return
+        print(f"Re-subscribing {len(filters)} topics on {self.credentials.endpoint} ({reason})")
+        sent = self._send_subscribes(filters)
+        remaining = [len(sent)]
+
+        def _done(_f: Future) -> None:
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            results = self._results(sent)
+            ok = sum(1 for e in results.values() if e is None)
+            if ok:
+                self._acked = True
+                self._deferred = False
+            print(f"Subscribed to {ok}/{len(results)} topics on {self.credentials.endpoint} (MQTT5, {reason})")
+            if self._on_ready:
+                self._on_ready(ok, len(results))
+
+        for _, fut in sent:
+            fut.add_done_callback(_done)
+
+    @staticmethod
+    def _results(sent: List[Tuple[List[str], Future]]) -> Dict[str, Optional[BaseException]]:
+
+        results: Dict[str, Optional[BaseException]] = {}
+        for chunk, fut in sent:
+            if not fut.done():
+                for t in chunk:
+                    results[t] = TimeoutError(f"no SUBACK for {t}")
+                continue
+            if fut.exception() is not None:
+                for t in chunk:
+                    results[t] = fut.exception()
+                continue
+            codes = fut.result().reason_codes or []
+            for t, code in zip(chunk, codes):
+                results[t] = None if int(code) < 0x80 else RuntimeError(f"SUBACK {code!r}")
+        return results
+
+    # ------------------------------------------------------------------ #
+    # internal callbacks (CRT thread - never block here)
+    # ------------------------------------------------------------------ #
+    def _on_publish(self, data: mqtt5.PublishReceivedData) -> None:
+        packet = data.publish_packet
+        for topic_filter, handler in self._match:
+            if topic_matches(topic_filter, packet.topic):
+                handler(packet.topic, packet.payload, packet.qos, False, packet.retain)
+                return
+
+    def _on_success(self, data: mqtt5.LifecycleConnectSuccessData) -> None:
+        self.connected = True
+        session_present = bool(data.connack_packet and data.connack_packet.session_present)
+        print(f"MQTT5 connected ({self.credentials.endpoint}); session_present = {session_present}")
+        if not session_present:
+            self._acked = False
+        first = bool(self._first_connect and not self._first_connect.done())
+        if first:
+            self._first_connect.set_result(data)
+        # the first connect's caller subscribes itself - unless it already gave up on us;
+        # any later success (after a failed first connect, or a lost session) is ours
+        if (not first or self._deferred) and not self._acked and self._subs:
+            self._resubscribe("late connect" if self._deferred else "after session loss")
+
+    def _on_failure(self, data: mqtt5.LifecycleConnectFailureData) -> None:
+        print(f"MQTT5 connect failed ({self.credentials.endpoint}): {data.exception}")
+        if self._first_connect and not self._first_connect.done():
+            self._first_connect.set_exception(data.exception or ConnectionError("MQTT5 connect failed"))
+
+    def _on_disconnect(self, data: mqtt5.LifecycleDisconnectData) -> None:
+        print(f"MQTT5 interrupted ({self.credentials.endpoint}): {data.exception}")
+        self.connected = False
+        # No manual reconnect – the CRT client retries with backoff.
@@ -1,3 +1,5 @@
+import os
+import threading
 from awscrt import io
 from dataclasses import dataclass
 from typing import Optional
@@ -20,7 +22,27 @@ class IOTContext:
     event_loop_group: io.EventLoopGroup
     host_resolver: io.DefaultHostResolver
 
-    def __init__(self):
-        self.event_loop_group = io.EventLoopGroup(1)  # https://awslabs.github.io/aws-crt-python/api/io.html#awscrt.io.EventLoopGroup
-        self.host_resolver = io.DefaultHostResolver(self.event_loop_group)  # https://awslabs.github.io/aws-crt-python/api/io.html#awscrt.io.ClientBootstrap
-        self.client_bootstrap = io.ClientBootstrap(self.event_loop_group, self.host_resolver)  # https://awslabs.github.io/aws-crt-python/api/io.html#awscrt.io.ClientBootstrap
\ No newline at end of file
+    _shared: Optional["IOTContext"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, threads: int = 1, max_host_entries: int = 16):
+        self.event_loop_group = io.EventLoopGroup(threads)  # https://awslabs.github.io/aws-crt-python/api/io.html#awscrt.io.EventLoopGroup
+        self.host_resolver = io.DefaultHostResolver(self.event_loop_group, max_host_entries)  # https://awslabs.github.io/aws-crt-python/api/io.html#awscrt.io.ClientBootstrap
+        self.client_bootstrap = io.ClientBootstrap(self.event_loop_group, self.host_resolver)  # https://awslabs.github.io/aws-crt-python/api/io.html#awscrt.io.ClientBootstrap.
+
+    @classmethod
+    def shared(cls) -> "IOTContext":
+        """
+        Process-wide context reused by every client, so N endpoints share one
+        event-loop group and DNS cache instead of N single-thread groups.
+        IOT_EVENT_LOOP_THREADS (0 = one per CPU) and IOT_HOST_RESOLVER_MAX_ENTRIES
+        configure it.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                threads = int(os.getenv("IOT_EVENT_LOOP_THREADS", "1"))
+                cls._shared = cls(
+                    threads=threads or None,
+                    max_host_entries=int(os.getenv("IOT_HOST_RESOLVER_MAX_ENTRIES", "16")),
+                )
+            return cls._shared
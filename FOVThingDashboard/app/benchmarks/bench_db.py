@@ -0,0 +1,183 @@
+"""
+Repeatable benchmarks for the DeviceManager DB paths, against a fixture
+from gen_fixtures.py. Reports ops/s and latency percentiles per path and
+exits non-zero when a path regressed against a stored baseline.
+
+    cd FOVThingDashboard/app
+    python benchmarks/gen_fixtures.py --db /tmp/fov_bench.db --devices 5000 --rows 50000000
+    python benchmarks/bench_db.py --db /tmp/fov_bench.db --save-baseline   # on the old schema
+    python benchmarks/bench_db.py --db /tmp/fov_bench.db                   # after the change
+
+A path regresses when its p50 is more than --tolerance (default 25 %)
+slower than the baseline. Baselines are machine-specific: record and
+compare on the same box. update_device appends rows to the fixture, so
+regenerate it now and then for long-running comparisons.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_db.json")
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 3) -> dict:
+    for _ in range(min(warmup, iterations)):
+        fn()
+    times = np.empty(iterations)
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - t0
+    ms = times * 1000
+    return {
+        "iterations": iterations,
+        "ops_per_s": round(iterations / times.sum(), 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def run(db: str, scale: float, seed: int) -> dict:
+    os.environ["DB_PATH"] = db
+    from database import init_db
+    from device import DeviceManager
+    from journal import IngestJournal
+    from sqlalchemy import text
+
+    session_factory = init_db()
+    dm = DeviceManager(session_factory)          # no storage filter: every write hits device_logs
+    journaled = DeviceManager(session_factory)   # same, DB writes behind the ingest journal
+    journaled.attach_journal(IngestJournal(tempfile.mkdtemp(prefix="fov_bench_journal_")))
+    rnd = random.Random(seed)
+    names = sorted(dm.devices)
+    stadium_of = {n: d["stadium"] for n, d in dm.devices.items()}
+    with session_factory() as s:
+        rows = s.execute(text("SELECT COUNT(*), MAX(id) FROM device_logs")).one()
+    n_rows, max_id = rows[0], rows[1] or 0
+    n = lambda base: max(3, int(base * scale))
+    now = datetime.utcnow()
+
+    def update(manager=dm):
+        name = rnd.choice(names)
+        metric = rnd.choice(["battery", "temperature", "latency"])
+        value = f"{rnd.uniform(20, 400):.2f}" if metric == "latency" else json.dumps(
+            {"Battery_Percentage": rnd.randint(5, 100)} if metric == "battery" else {"Temperature": rnd.randint(25, 70)}
+        )
+        manager.update_device(name, metric, stadium_of[name], value)
+
+    benches = {
+        "load_devices": (lambda: dm._load_devices_from_db(), n(10)),
+        "update_device": (update, n(2000)),
+        "update_device_journaled": (lambda: update(journaled), n(2000)),
+        "history_first_page": (
+            lambda: dm.get_device_history(rnd.choice(names), start_time=now - timedelta(hours=24), page_size=50),
+            n(500),
+        ),
+        "history_first_page_metric": (
+            lambda: dm.get_device_history(rnd.choice(names), metric_type="temperature",
+                                          start_time=now - timedelta(hours=24), page_size=50),
+            n(500),
+        ),
+        "history_deep_page": (
+            lambda: dm.get_device_history(rnd.choice(names), page_size=50, last_id=rnd.randint(1, max_id or 1)),
+            n(500),
+        ),
+        "device_series_7d": (
+            lambda: dm.get_device_series(rnd.choice(names), "temperature", start_time=now - timedelta(days=7)),
+            n(50),
+        ),
+        "check_wifi_status": (lambda: dm.check_wifi_status(), n(10)),
+    }
+
+    results = {}
+    for name, (fn, iterations) in benches.items():
+        print(f"  {name} x{iterations} …", end="", flush=True)
+        results[name] = measure(fn, iterations)
+        print(f" p50 {results[name]['p50_ms']} ms")
+    return {
+        "fixture": {"devices": len(names), "rows": n_rows},
+        "scale": scale,
+        "created": datetime.utcnow().isoformat(),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    if current["fixture"]["devices"] != baseline["fixture"]["devices"] or \
+            abs(current["fixture"]["rows"] - baseline["fixture"]["rows"]) > 0.05 * baseline["fixture"]["rows"]:
+        print(f"WARNING: fixture differs from baseline ({baseline['fixture']} vs {current['fixture']})")
+    regressions = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            continue
+        change = cur["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"  {name:<28}{base['p50_ms']:>10.3f}{cur['p50_ms']:>10.3f}{change:>+9.1%}  {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def print_table(report: dict) -> None:
+    print(f"\n{report['fixture']['devices']:,} devices, {report['fixture']['rows']:,} log rows")
+    print(f"{'path':<28}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in report["results"].items():
+        print(f"{name:<28}{r['ops_per_s']:>10.1f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+              f"{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="fixture from gen_fixtures.py")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found; build one with benchmarks/gen_fixtures.py")
+
+    report = run(args.db, args.scale, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"\nvs baseline ({baseline['created']}), p50 ms:")
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Bytes/frame and CPU/frame for each WebSocket encoding, with and without
+permessage-deflate.
+
+Deflate is simulated the way RFC 7692 does it with context takeover (the
+default for browsers + uvicorn/websockets): one raw-deflate stream per
+connection, Z_SYNC_FLUSH per message, trailing 00 00 ff ff stripped.
+
+    cd FOVThingDashboard/app
+    python benchmarks/bench_ws_encoding.py --frames 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ws_encoding import ENCODERS, msgpack, cbor2  # noqa: E402
+
+DECODERS = {"json": json.loads}
+if msgpack is not None:
+    DECODERS["msgpack"] = lambda b: msgpack.unpackb(b, raw=False)
+if cbor2 is not None:
+    DECODERS["cbor"] = cbor2.loads
+
+
+def make_frames(n: int, devices: int = 300, seed: int = 7) -> list[dict]:
+    """Device-state frames shaped like DeviceManager._device_to_dict output."""
+    rnd = random.Random(seed)
+    names = [f"fov-marvel-tablet-{i:03d}" for i in range(devices)]
+    frames = []
+    for _ in range(n):
+        name = rnd.choice(names)
+        frames.append({
+            "topic": name,
+            "message": {
+                "name": name,
+                "wifiConnected": True,
+                "batteryCharge": float(rnd.randint(5, 100)),
+                "temperature": round(rnd.uniform(30, 85), 2),
+                "latencyMs": round(rnd.uniform(20, 400), 2),
+                "firmwareVersion": "1.1.0",
+                "otaStatus": "N/A",
+                "lastMessageTime": f"2025-06-01T10:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}.{rnd.randint(0, 999999):06d}",
+                "firstSeen": "2025-05-30T08:00:00.000000",
+                "stadium": "marvel",
+            },
+        })
+    return frames
+
+
+def deflate_stream():
+    comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+
+    def deflate(data: bytes) -> bytes:
+        out = comp.compress(data) + comp.flush(zlib.Z_SYNC_FLUSH)
+        return out[:-4] if out.endswith(b"\x00\x00\xff\xff") else out
+    return deflate
+
+
+def bench(name: str, frames: list[dict]) -> dict:
+    enc = ENCODERS[name]
+    dec = DECODERS[name]
+
+    t0 = time.perf_counter()
+    encoded = [enc(f) for f in frames]
+    t_enc = time.perf_counter() - t0
+    raw = [e.encode() if isinstance(e, str) else e for e in encoded]
+
+    t0 = time.perf_counter()
+    for e in encoded:
+        dec(e)
+    t_dec = time.perf_counter() - t0
+
+    deflate = deflate_stream()
+    t0 = time.perf_counter()
+    compressed = [deflate(b) for b in raw]
+    t_def = time.perf_counter() - t0
+
+    n = len(frames)
+    return {
+        "encoding": name,
+        "bytes": sum(map(len, raw)) / n,
+        "bytes_deflate": sum(map(len, compressed)) / n,
+        "encode_us": t_enc / n * 1e6,
+        "decode_us": t_dec / n * 1e6,
+        "deflate_us": t_def / n * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames)
+    results = [bench(name, frames) for name in ENCODERS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.frames} frames; per-frame averages")
+    print(f"{'encoding':<10}{'bytes':>9}{'+deflate':>10}{'enc µs':>9}{'dec µs':>9}{'defl µs':>9}")
+    for r in results:
+        print(
+            f"{r['encoding']:<10}{r['bytes']:>9.1f}{r['bytes_deflate']:>10.1f}"
+            f"{r['encode_us']:>9.2f}{r['decode_us']:>9.2f}{r['deflate_us']:>9.2f}"
+        )
+    missing = {"msgpack", "cbor"} - set(ENCODERS)
+    if missing:
+        print(f"(not installed: {', '.join(sorted(missing))})")
+
+
+if __name__ == "__main__":
+    main()
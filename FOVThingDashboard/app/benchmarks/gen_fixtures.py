@@ -0,0 +1,139 @@
+"""
+Build a large, realistic SQLite database for the DB benchmarks.
+
+Devices are spread over stadiums; log rows are spread over `--days` in
+time order (ids grow with time, like production), with the production
+metric mix and payload shapes (JSON bodies for battery/temperature/version/
+ota, plain numbers for latency). ~90 % of devices were heard from in the
+last minute, so check_wifi_status has real flips to make.
+
+    cd FOVThingDashboard/app
+    python benchmarks/gen_fixtures.py --db /tmp/fov_bench.db --devices 5000 --rows 50000000
+
+50M rows takes a while (bulk inserts with journaling off) and ~4 GB of disk.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+METRICS = ["battery", "temperature", "latency", "version", "ota"]
+METRIC_WEIGHTS = [0.30, 0.30, 0.30, 0.05, 0.05]
+VERSIONS = ["1.1.0", "1.1.1", "1.2.0"]
+OTA = ["in_progress", "success", "success", "success", "error"]
+CHUNK = 200_000
+
+
+def create_schema(path: str) -> None:
+    os.environ["DB_PATH"] = path
+    from database import init_db        # reads DB_PATH when called
+    init_db()
+
+
+def insert_devices(conn: sqlite3.Connection, n: int, stadiums: list[str], now: datetime, rnd) -> int:
+    rows = []
+    for i in range(n):
+        stadium = stadiums[i % len(stadiums)]
+        online = rnd.random() < 0.9
+        last = now - timedelta(seconds=float(rnd.uniform(0, 50) if online else rnd.uniform(120, 86400)))
+        values = {
+            "battery": str(int(rnd.integers(5, 101))),
+            "temperature": str(int(rnd.integers(25, 70))),
+            "latency": f"{rnd.uniform(20, 400):.2f}",
+            "version": str(rnd.choice(VERSIONS)),
+        }
+        rows.append((
+            f"fov-{stadium}-tablet-{i:05d}", stadium, 1,
+            last.isoformat(sep=" "), (now - timedelta(days=90)).isoformat(sep=" "), json.dumps(values),
+        ))
+    conn.executemany(
+        "INSERT INTO devices (name, stadium, wifi_connected, last_message_time, first_seen, last_metric_values)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    return n
+
+
+def _payloads(metric: str, k: int, rnd) -> list[str]:
+    if metric == "battery":
+        return [json.dumps({"Battery_Percentage": int(v)}) for v in rnd.integers(5, 101, k)]
+    if metric == "temperature":
+        return [json.dumps({"Temperature": int(v)}) for v in rnd.integers(25, 70, k)]
+    if metric == "latency":
+        return [f"{v:.2f}" for v in rnd.uniform(20, 400, k)]
+    if metric == "version":
+        return [json.dumps({"Version": v}) for v in rnd.choice(VERSIONS, k)]
+    return [json.dumps({"status": v}) for v in rnd.choice(OTA, k)]
+
+
+def insert_logs(conn: sqlite3.Connection, n_rows: int, n_devices: int, days: float, now: datetime, rnd) -> None:
+    start = now - timedelta(days=days)
+    span_us = days * 86400e6
+    done = 0
+    t0 = time.perf_counter()
+    while done < n_rows:
+        k = min(CHUNK, n_rows - done)
+        # this chunk covers the next slice of the time range, in order
+        lo, hi = done / n_rows * span_us, (done + k) / n_rows * span_us
+        offsets = np.sort(rnd.uniform(lo, hi, k))
+        device_ids = rnd.integers(1, n_devices + 1, k)
+        metric_idx = rnd.choice(len(METRICS), k, p=METRIC_WEIGHTS)
+        values = np.empty(k, dtype=object)
+        for m, metric in enumerate(METRICS):
+            sel = np.flatnonzero(metric_idx == m)
+            values[sel] = _payloads(metric, len(sel), rnd)
+        stamps = np.datetime_as_string(
+            np.datetime64(start.isoformat(), "us") + offsets.astype("timedelta64[us]"), unit="us"
+        )
+        conn.executemany(
+            "INSERT INTO device_logs (device_id, timestamp, metric_type, metric_value) VALUES (?, ?, ?, ?)",
+            zip(device_ids.tolist(), (s.replace("T", " ") for s in stamps),
+                (METRICS[i] for i in metric_idx), values.tolist()),
+        )
+        conn.commit()
+        done += k
+        rate = done / (time.perf_counter() - t0)
+        print(f"\r  {done:,}/{n_rows:,} rows ({rate:,.0f} rows/s)", end="", flush=True)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="output SQLite file (must not exist)")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--stadiums", default="marvel,kia,aviva,optus,mcg")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        sys.exit(f"{args.db} exists; remove it first")
+    rnd = np.random.default_rng(args.seed)
+    now = datetime.utcnow()
+
+    create_schema(args.db)
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    print(f"Devices: {args.devices:,}")
+    insert_devices(conn, args.devices, args.stadiums.split(","), now, rnd)
+    print(f"Log rows: {args.rows:,} over {args.days:g} days")
+    insert_logs(conn, args.rows, args.devices, args.days, now, rnd)
+    conn.execute("ANALYZE")
+    conn.close()
+    print(f"Done: {args.db} ({os.path.getsize(args.db) / 1e6:,.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Fleet commands (e.g. firmware OTA for a whole stadium) and OTA rollout tracking.
+
+`CommandDispatcher` publishes one command to many devices in waves: at most
+`concurrency` un-acked QoS 1 publishes in flight, at most `rate_per_s`
+publishes per second, with a pause between waves. Each publish waits for
+its PUBACK and is retried once on timeout/failure.
+
+`RolloutTracker` folds incoming `ota` metrics into per-stadium counts
+(pending / in_progress / success / error) as they arrive, so a 300-tablet
+rollout is one dict read instead of 300 history queries.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+# (stadium, device, topic, payload) → future resolved on PUBACK
+PublishFn = Callable[[str, str, str, str], Future]
+
+OTA_STATES = ("pending", "in_progress", "success", "error")
+
+
+@dataclass
+class CommandJob:
+    id: str
+    command: str
+    payload: dict
+    targets: list[tuple[str, str]]                    # (stadium, device)
+    wave_size: int
+    concurrency: int
+    state: str = "queued"                             # queued → running → done
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    results: dict[str, str] = field(default_factory=dict)   # "stadium/device" → acked | error: ...
+
+    def summary(self) -> dict:
+        acked = sum(1 for r in self.results.values() if r == "acked")
+        return {
+            "id": self.id,
+            "command": self.command,
+            "state": self.state,
+            "targets": len(self.targets),
+            "acked": acked,
+            "failed": len(self.results) - acked,
+            "remaining": len(self.targets) - len(self.results),
+            "wave_size": self.wave_size,
+            "concurrency": self.concurrency,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class CommandDispatcher:
+    def __init__(
+        self,
+        publish: PublishFn,
+        topic_for: Callable[[str, str, str], str],
+        rate_per_s: Optional[float] = None,
+        ack_timeout_s: float = 10.0,
+        wave_pause_s: Optional[float] = None,
+        max_jobs: int = 100,
+    ):
+        self.publish = publish
+        self.topic_for = topic_for
+        self.rate_per_s = rate_per_s or float(os.getenv("COMMAND_RATE_PER_S", "20"))
+        self.ack_timeout_s = ack_timeout_s
+        self.wave_pause_s = wave_pause_s if wave_pause_s is not None else float(os.getenv("COMMAND_WAVE_PAUSE_S", "2"))
+        self.max_jobs = max_jobs
+        self.jobs: dict[str, CommandJob] = {}
+        self.on_dispatched: Optional[Callable[[CommandJob], None]] = None
+
+    def submit(
+        self,
+        command: str,
+        payload: dict,
+        targets: list[tuple[str, str]],
+        wave_size: int = 25,
+        concurrency: int = 10,
+    ) -> CommandJob:
+        """Create a job and start it on the running loop."""
+        job = CommandJob(
+            id=uuid.uuid4().hex[:12],
+            command=command,
+            payload=payload,
+            targets=targets,
+            wave_size=max(1, wave_size),
+            concurrency=max(1, concurrency),
+        )
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:                 # forget the oldest
+            self.jobs.pop(next(iter(self.jobs)))
+        if self.on_dispatched:
+            self.on_dispatched(job)
+        asyncio.create_task(self._run(job))
+        return job
+
+    async def _run(self, job: CommandJob) -> None:
+        job.state = "running"
+        sem = asyncio.Semaphore(job.concurrency)
+        interval = 1.0 / self.rate_per_s
+        body = json.dumps({"command": job.command, "job": job.id, **job.payload})
+        next_slot = time.monotonic()
+
+        async def _one(stadium: str, device: str) -> None:
+            nonlocal next_slot
+            async with sem:
+                # rate limit: space publishes evenly
+                now = time.monotonic()
+                slot = max(now, next_slot)
+                next_slot = slot + interval
+                if slot > now:
+                    await asyncio.sleep(slot - now)
+                topic = self.topic_for(stadium, device, job.command)
+                result = "error: not attempted"
+                for attempt in range(2):
+                    try:
+                        await asyncio.wait_for(
+                            asyncio.wrap_future(self.publish(stadium, device, topic, body)),
+                            timeout=self.ack_timeout_s,
+                        )
+                        result = "acked"
+                        break
+                    except Exception as e:
+                        result = f"error: {str(e) or type(e).__name__}"
+                job.results[f"{stadium}/{device}"] = result
+
+        for i in range(0, len(job.targets), job.wave_size):
+            wave = job.targets[i:i + job.wave_size]
+            tasks = [asyncio.create_task(_one(stadium, device)) for stadium, device in wave]
+            await asyncio.gather(*tasks)
+            if i + job.wave_size < len(job.targets):
+                await asyncio.sleep(self.wave_pause_s)
+
+        job.state = "done"
+        job.finished = time.time()
+        s = job.summary()
+        print(f"Command job {job.id} ({job.command}) done: {s['acked']} acked, {s['failed']} failed")
+
+
+def ota_state(value) -> Optional[str]:
+    """Map an `ota` metric body (JSON with "status", or a bare string) to a rollout state."""
+    status = value
+    try:
+        parsed = json.loads(value) if isinstance(value, str) else value
+        if isinstance(parsed, dict):
+            status = parsed.get("status")
+    except (json.JSONDecodeError, TypeError):
+        pass
+    status = str(status or "").strip().lower()
+    if status in ("in_progress", "inprogress", "downloading", "updating", "started"):
+        return "in_progress"
+    if status in ("success", "succeeded", "done", "complete", "completed"):
+        return "success"
+    if status in ("error", "failed", "failure"):
+        return "error"
+    return None
+
+
+class RolloutTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: dict[tuple[str, str], str] = {}            # (stadium, device) → state
+        self.counts: dict[str, dict[str, int]] = {}              # stadium → state → n
+        self._errors: dict[str, set[str]] = {}                   # stadium → devices in error
+
+    def _set(self, stadium: str, device: str, new: str) -> None:
+        key = (stadium, device)
+        old = self._state.get(key)
+        if old == new:
+            return
+        counts = self.counts.setdefault(stadium, dict.fromkeys(OTA_STATES, 0))
+        if old:
+            counts[old] -= 1
+        counts[new] += 1
+        self._state[key] = new
+        errors = self._errors.setdefault(stadium, set())
+        if new == "error":
+            errors.add(device)
+        else:
+            errors.discard(device)
+
+    def mark_pending(self, targets: list[tuple[str, str]]) -> None:
+        """OTA just dispatched to these devices; they count as pending until they report."""
+        with self._lock:
+            for stadium, device in targets:
+                self._set(stadium, device, "pending")
+
+    def states(self) -> dict[str, dict[str, str]]:
+        """stadium → device → state (for the state bus snapshot)."""
+        with self._lock:
+            out: dict[str, dict[str, str]] = {}
+            for (stadium, device), state in self._state.items():
+                out.setdefault(stadium, {})[device] = state
+            return out
+
+    def apply(self, stadium: str, states: dict[str, str]) -> None:
+        """Replica side: take states as published by the ingest process."""
+        with self._lock:
+            for device, state in states.items():
+                if state in OTA_STATES:
+                    self._set(stadium, device, state)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state.clear()
+            self.counts.clear()
+            self._errors.clear()
+
+    def observe(self, device: str, stadium: Optional[str], metric: str, value) -> None:
+        """DeviceManager listener: only `ota` metrics matter."""
+        if metric != "ota" or not stadium:
+            return
+        state = ota_state(value)
+        if state:
+            with self._lock:
+                self._set(stadium, device, state)
+
+    def summary(self, stadium: str) -> dict:
+        with self._lock:
+            counts = dict(self.counts.get(stadium) or dict.fromkeys(OTA_STATES, 0))
+            errors = sorted(self._errors.get(stadium, ()))
+        total = sum(counts.values())
+        return {
+            "stadium": stadium,
+            "counts": counts,
+            "total": total,
+            "percent_complete": round(100.0 * counts["success"] / total, 1) if total else None,
+            "errors": errors,
+        }
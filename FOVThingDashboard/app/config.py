@@ -1,4 +1,5 @@
 import os
+from dataclasses import dataclass
 
 try:
     from dotenv import load_dotenv
@@ -7,6 +8,25 @@ except ImportError:
     pass
 
 
+# Cert directories for regions other than the default one. Override (or add a
+# region) with IOT_CERT_DIR_<REGION>, e.g. IOT_CERT_DIR_EU_WEST_1=/etc/fov/certs/dublin.
+# Each directory holds certificate.pem.crt, private.pem.key and AmazonRootCA1.pem.
+REGION_CERT_DIRS = {
+    "eu-west-1": "./certs/dublin",
+}
+
+
+@dataclass(frozen=True)
+class CredentialBundle:
+    region: str
+    cert_path: str
+    private_key_path: str
+    root_ca_path: str
+
+    def missing(self) -> list[str]:
+        return [p for p in (self.cert_path, self.private_key_path, self.root_ca_path) if not os.path.exists(p)]
+
+
 class FOVDashboardConfig:
     def __init__(self):
         # ---------- AWS IoT endpoint + certs ----------
@@ -30,5 +50,30 @@ class FOVDashboardConfig:
             "./certs/sydney/AmazonRootCA1.pem",
         )
 
+        # The IOT_* cert paths above belong to this region; other regions use REGION_CERT_DIRS
+        self.default_region: str = os.getenv("IOT_DEFAULT_REGION", "ap-southeast-2")
+
+        self.port: int = int(os.getenv("IOT_PORT", "8883"))
+
+        # ---------- MQTT protocol ----------
+        # IOT_MQTT_VERSION=5 switches to the MQTT5 client. With IOT_SHARED_GROUP
+        # set as well, telemetry topics are subscribed as $share/<group>/...
+        # so several dashboard instances split the stream between them.
+        self.mqtt_version: int = int(os.getenv("IOT_MQTT_VERSION", "3"))
+        self.shared_group: str = os.getenv("IOT_SHARED_GROUP", "").strip()
+
         # ---------- Relay ----------
         self.relay_topic: str = "fov/relay/+/heartbeat"
+
+    def credentials_for(self, region: str) -> CredentialBundle:
+        """Cert bundle for an AWS region (one per region: IoT certs are regional)."""
+        env_dir = os.getenv(f"IOT_CERT_DIR_{region.upper().replace('-', '_')}")
+        cert_dir = env_dir or (REGION_CERT_DIRS.get(region) if region != self.default_region else None)
+        if not cert_dir:
+            return CredentialBundle(region, self.cert_path, self.private_key_path, self.root_ca_path)
+        return CredentialBundle(
+            region,
+            os.path.join(cert_dir, "certificate.pem.crt"),
+            os.path.join(cert_dir, "private.pem.key"),
+            os.path.join(cert_dir, "AmazonRootCA1.pem"),
+        )
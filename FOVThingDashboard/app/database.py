@@ -1,6 +1,6 @@
 from datetime import datetime
 from pathlib import Path   
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Index, UniqueConstraint, text
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Index, Text, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 import os
@@ -56,6 +56,51 @@ class DeviceLog(Base):
     __table_args__ = (
         # Composite index for efficient querying of device history
         Index('idx_device_metric_time', 'device_id', 'metric_type', 'timestamp'),
+        # Time-range scans across all devices (archiver day windows)
+        Index('idx_device_log_time', 'timestamp'),
+    )
+
+class IngestCheckpoint(Base):
+    """Last ingest-journal entry committed to the DB (single row, see journal.py)."""
+    __tablename__ = 'ingest_checkpoint'
+
+    id = Column(Integer, primary_key=True)
+    lsn = Column(Integer, nullable=False, default=0)
+
+
+class RelayInterval(Base):
+    """One up/down stretch of a relay's liveness (see relay_history.py)."""
+    __tablename__ = 'relay_intervals'
+
+    id = Column(Integer, primary_key=True)
+    relay_id = Column(String, nullable=False)
+    stadium = Column(String)
+    state = Column(String, nullable=False)        # 'up' | 'down'
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)        # checkpointed while the interval is open
+    open = Column(Boolean, default=True, nullable=False)
+    recovered = Column(Boolean, default=False, nullable=False)   # down interval ended by a heartbeat
+
+    __table_args__ = (
+        Index('idx_relay_interval_start', 'relay_id', 'start'),
+    )
+
+
+class MatchSession(Base):
+    """A match (or any stretch of activity) at one stadium, with its report (see sessions.py)."""
+    __tablename__ = 'match_sessions'
+
+    id = Column(Integer, primary_key=True)
+    stadium = Column(String, nullable=False)
+    label = Column(String)
+    source = Column(String, nullable=False)       # 'manual' | 'inferred'
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime)                        # NULL while the session is open
+    summary = Column(Text)                        # JSON, computed once when the session closes
+    summarized_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('idx_match_session_start', 'stadium', 'start'),
     )
 
 def init_db() -> sessionmaker:
@@ -81,6 +126,8 @@ def init_db() -> sessionmaker:
 
     # Create the normalized view used by DeviceManager.get_device_history()
     with engine.connect() as conn:
+        # create_all() skips tables that already exist, so add newer indexes to old DBs here
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_device_log_time ON device_logs (timestamp)"))
         conn.execute(text("""
             CREATE VIEW IF NOT EXISTS device_logs_norm AS
             SELECT
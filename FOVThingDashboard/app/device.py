@@ -1,22 +1,136 @@
 from __future__ import annotations
 
 import json
+import threading
+import time
+import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy import text  # ✅ added
-from database import Device, DeviceLog  # keep this import
+from sqlalchemy import bindparam, text  # ✅ added
+from database import Device, DeviceLog, IngestCheckpoint  # keep this import
+from archive import ArchiveStore
+from journal import Batch, IngestJournal
+from response_cache import StateVersions
+from rules import RuleEngine
+from storage_policy import StorageFilter
+from timeseries import parse_ts
+
+
+def parse_metric_value(metric_type: str, raw: Optional[str]) -> str:
+    """Raw MQTT body (often JSON, e.g. {"Temperature": 41}) → the stored scalar string."""
+    actual_value = raw or ""
+    try:
+        parsed = json.loads(raw) if raw else {}
+        if not isinstance(parsed, dict):
+            return actual_value
+        if metric_type == "battery":
+            actual_value = str(parsed.get("Battery_Percentage", parsed.get("Battery Percentage", 0)))
+        elif metric_type == "temperature":
+            actual_value = str(parsed.get("Temperature", 0))
+        elif metric_type == "version":
+            actual_value = str(parsed.get("Version", parsed.get("version", actual_value)))
+    except json.JSONDecodeError:
+        pass
+    return actual_value
+
+
+def numeric_metric_value(metric_type: str, raw: Optional[str]) -> Optional[float]:
+    if raw and raw[0] != "{":
+        try:
+            return float(raw)               # latency and other plain numbers
+        except ValueError:
+            pass
+    try:
+        return float(parse_metric_value(metric_type, raw))
+    except ValueError:
+        return None
+
+
+def _numeric_samples(metric_type: str, rows) -> Tuple[np.ndarray, np.ndarray, List]:
+    """(ts, raw, tag) rows → time-sorted (epoch seconds, values, tags); non-numeric rows dropped."""
+    # devices repeat the same few bodies ({"Temperature": 41}, ...), so parse each once
+    parsed: Dict[str, Optional[float]] = {}
+    ts, values, tags = [], [], []
+    for t, raw, tag in rows:
+        if raw not in parsed:
+            parsed[raw] = numeric_metric_value(metric_type, raw)
+        v = parsed[raw]
+        if v is not None:
+            ts.append(str(t))
+            values.append(v)
+            tags.append(tag)
+    if not ts:
+        return np.empty(0), np.empty(0), []
+    x, y = parse_ts(ts), np.array(values, dtype=np.float64)
+    if np.any(np.diff(x) < 0):          # clock steps: keep x increasing for downsampling
+        order = np.argsort(x, kind="stable")
+        x, y, tags = x[order], y[order], [tags[i] for i in order]
+    return x, y, tags
 
 
 class DeviceManager:
-    def __init__(self, session_factory: sessionmaker):
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        rule_engine: Optional[RuleEngine] = None,
+        storage_filter: Optional[StorageFilter] = None,
+    ):
         self.session_factory = session_factory
+        self.rule_engine = rule_engine
+        self.storage_filter = storage_filter
+        self.archive: Optional[ArchiveStore] = None   # cold rows moved out of device_logs
+        self.journal: Optional[IngestJournal] = None  # set by attach_journal(); else writes are inline
         self.devices: Dict[str, Dict] = {}
+        self._values: Dict[str, Dict] = {}  # name → last_metric_values (raw strings), as in the DB
+        self._flags: Dict[str, Dict] = {}   # name → live-only fields (e.g. rateLimited), kept across updates
+        self.versions = StateVersions()   # bumped on every change to self.devices
+        # fn(device, stadium, metric, value) called after each stored metric
+        self.listeners: List[Callable[[str, Optional[str], str, str], None]] = []
+        # fn(device, old_dict | None, new_dict) called on every change to self.devices
+        self.state_listeners: List[Callable[[str, Optional[Dict], Dict], None]] = []
+        # One writer at a time for devices/_values/_flags/versions and the state listeners:
+        # every region's ingest thread, the rate limiter and the status check all change state.
+        # Reentrant because _apply_state and set_flag call store_state while holding it.
+        self._state_lock = threading.RLock()
         self._load_devices_from_db()
 
     def _serialize_datetime(self, dt: Optional[datetime]) -> Optional[str]:
         return dt.isoformat() if dt else None
 
+    def add_state_listener(self, fn: Callable[[str, Optional[Dict], Dict], None]) -> None:
+        """Register fn and replay the current devices into it (as new)."""
+        with self._state_lock:
+            self.state_listeners.append(fn)
+            for name, data in list(self.devices.items()):
+                fn(name, None, data)
+
+    def store_state(self, name: str, device_dict: Dict) -> None:
+        """Replace one device's cached dict; the only writer of self.devices after load."""
+        with self._state_lock:
+            old = self.devices.get(name)
+            self.devices[name] = device_dict
+            self.versions.bump(device_dict.get("stadium"))
+            if old is not None and old.get("stadium") != device_dict.get("stadium"):
+                self.versions.bump(old.get("stadium"))    # moved: the old stadium's cached lists still have it
+            for fn in self.state_listeners:
+                try:
+                    fn(name, old, device_dict)
+                except Exception as e:
+                    print(f"State listener failed: {e}")
+
+    def set_flag(self, name: str, field: str, value) -> Optional[Dict]:
+        """Set a live-only field on a device's dict (not stored); returns the new dict, or None if unknown."""
+        with self._state_lock:
+            flags = {**self._flags.get(name, {}), field: value}
+            self._flags[name] = flags
+            current = self.devices.get(name)
+            if current is None:
+                return None
+            device_dict = {**current, **flags}
+            self.store_state(name, device_dict)
+            return device_dict
+
     def _load_devices_from_db(self):
         session = self.session_factory()
         try:
@@ -28,18 +142,37 @@ class DeviceManager:
 
     def _device_to_dict(self, device: "Device") -> Dict:
         latest_values = json.loads(device.last_metric_values) if device.last_metric_values else {}
+        self._values[device.name] = latest_values
+        return self._state_dict(
+            device.name,
+            # ✅ include stadium for filtering (works even if column missing)
+            getattr(device, "stadium", None),
+            device.wifi_connected,
+            latest_values,
+            self._serialize_datetime(device.last_message_time),
+            self._serialize_datetime(device.first_seen),
+        )
+
+    @staticmethod
+    def _state_dict(
+        name: str,
+        stadium: Optional[str],
+        wifi_connected: bool,
+        latest_values: Dict,
+        last_message_time: Optional[str],
+        first_seen: Optional[str],
+    ) -> Dict:
         return {
-            "name": device.name,
-            "wifiConnected": device.wifi_connected,
+            "name": name,
+            "wifiConnected": wifi_connected,
             "batteryCharge": float(latest_values.get("battery", 0)),
             "temperature": float(latest_values.get("temperature", 0)),
             "latencyMs": float(latest_values.get("latency", -1)),
             "firmwareVersion": latest_values.get("version", "N/A"),
             "otaStatus": latest_values.get("ota", "N/A"),
-            "lastMessageTime": self._serialize_datetime(device.last_message_time),
-            "firstSeen": self._serialize_datetime(device.first_seen),
-            # ✅ include stadium for filtering (works even if column missing)
-            "stadium": getattr(device, "stadium", None),
+            "lastMessageTime": last_message_time,
+            "firstSeen": first_seen,
+            "stadium": stadium,
         }
 
     def get_or_create_device(self, name: str, stadium: Optional[str] = None) -> "Device":
@@ -58,7 +191,7 @@ class DeviceManager:
                 )
                 session.add(device)
                 session.commit()
-                self.devices[name] = self._device_to_dict(device)
+                self.store_state(name, self._device_to_dict(device))
             return device
         finally:
             session.close()
@@ -72,7 +205,13 @@ class DeviceManager:
         metric_type: str,
         stadium_or_value: Optional[str] = None,
         value: Optional[str] = None,
+        received_at: Optional[float] = None,
     ) -> Dict:
+        """
+        Apply one metric message. With a journal attached the DB write is
+        queued (see journal.py) and live state moves on at once; without one
+        the row is committed before the state changes, as before.
+        """
         if value is None:
             # old call: (name, metric, value)
             stadium = None
@@ -81,58 +220,144 @@ class DeviceManager:
             # new call: (name, metric, stadium, value)
             stadium = stadium_or_value
 
+        at = received_at if received_at is not None else time.time()
+        actual_value = parse_metric_value(metric_type, value)
+        # Log entry unless the storage policy thins it out; decided once here so a
+        # retried or replayed write stores exactly the same rows. Live state is always exact.
+        store_log = self.storage_filter is None or self.storage_filter.admit(
+            name, stadium, metric_type, actual_value, now=at
+        )
+        record = (name, metric_type, stadium, value or "", at, store_log)
+        if self.journal is not None:
+            self.journal.append(record)
+        else:
+            self._persist([record])
+        if store_log and self.storage_filter is not None:
+            # only now: a failed inline write must not become the deadband reference
+            self.storage_filter.stored(name, stadium, metric_type, actual_value, at)
+
+        device_dict = self._apply_state(name, metric_type, stadium, actual_value, at)
+
+        # Threshold rules only look at this metric's rules
+        if self.rule_engine:
+            self.rule_engine.evaluate(name, device_dict["stadium"], metric_type, actual_value)
+        for listener in self.listeners:
+            try:
+                listener(name, device_dict["stadium"], metric_type, actual_value)
+            except Exception as e:
+                print(f"Metric listener failed: {e}")
+        return device_dict
+
+    def log_metric(
+        self,
+        name: str,
+        stadium: Optional[str],
+        metric_type: str,
+        value: str,
+        at: Optional[float] = None,
+    ) -> None:
+        """Store a derived series (e.g. anomaly scores) as DeviceLog rows; device state is untouched."""
+        at = at if at is not None else time.time()
+        if self.storage_filter is not None and not self.storage_filter.admit(name, stadium, metric_type, value, now=at):
+            return
+        record = (name, metric_type, stadium, value, at, True, False)
+        if self.journal is not None:
+            self.journal.append(record)
+        else:
+            self._persist([record])
+        if self.storage_filter is not None:
+            self.storage_filter.stored(name, stadium, metric_type, value, at)
+
+    def _apply_state(self, name: str, metric_type: str, stadium: Optional[str], actual_value: str, at: float) -> Dict:
+        """Same change as _persist makes to the Device row, on the cached dict."""
+        seen = self._serialize_datetime(datetime.utcfromtimestamp(at))
+        with self._state_lock:
+            values = dict(self._values.get(name, {}))
+            values[metric_type] = actual_value
+            self._values[name] = values
+            old = self.devices.get(name) or {}
+            device_dict = self._state_dict(
+                name,
+                stadium or old.get("stadium") or "",
+                True,
+                values,
+                seen,
+                old.get("firstSeen") or seen,
+            )
+            device_dict.update(self._flags.get(name, {}))
+            self.store_state(name, device_dict)
+        return device_dict
+
+    def _persist(self, records: List[tuple], lsn: Optional[int] = None) -> None:
+        """
+        Write (name, metric, stadium, raw value, epoch, store_log[, updates_state])
+        records in one transaction. updates_state=False (log_metric) adds the row only.
+        """
         session = self.session_factory()
         try:
-            query = session.query(Device).filter(Device.name == name)
-            if stadium:
-                query = query.filter(Device.stadium == stadium)
-            device = query.first()
-            if not device:
-                device = Device(name=name, stadium=stadium or "", first_seen=datetime.utcnow())
-                session.add(device)
-                session.flush()
-
-            # ✅ store stadium on the row if provided & column exists
-            if stadium and hasattr(device, "stadium") and getattr(device, "stadium") != stadium:
-                setattr(device, "stadium", stadium)
-
-            # Log entry
-            log = DeviceLog(
-                device_id=device.id,
-                metric_type=metric_type,
-                metric_value=value or "",
-                timestamp=datetime.utcnow()
-            )
-            session.add(log)
+            rows: Dict[tuple, Device] = {}
+            for name, metric_type, stadium, value, at, store_log, *flags in records:
+                ts = datetime.utcfromtimestamp(at)
+                device = rows.get((name, stadium))
+                if device is None:
+                    query = session.query(Device).filter(Device.name == name)
+                    if stadium:
+                        query = query.filter(Device.stadium == stadium)
+                    device = query.first()
+                    if not device:
+                        device = Device(name=name, stadium=stadium or "", first_seen=ts)
+                        session.add(device)
+                        session.flush()
+                    rows[(name, stadium)] = device
 
-            # Update last known state
-            current_values = json.loads(device.last_metric_values) if device.last_metric_values else {}
-            # Parse JSON metric body if needed
-            actual_value = value or ""
-            try:
-                parsed = json.loads(value) if value else {}
-                if metric_type == "battery":
-                    actual_value = str(parsed.get("Battery_Percentage", parsed.get("Battery Percentage", 0)))
-                elif metric_type == "temperature":
-                    actual_value = str(parsed.get("Temperature", 0))
-                elif metric_type == "version":
-                    actual_value = str(parsed.get("Version", parsed.get("version", actual_value)))
-            except json.JSONDecodeError:
-                pass
-
-            current_values[metric_type] = actual_value
-            device.last_metric_values = json.dumps(current_values)
-            device.last_message_time = datetime.utcnow()
-            device.wifi_connected = True
+                # ✅ store stadium on the row if provided & column exists
+                if stadium and hasattr(device, "stadium") and getattr(device, "stadium") != stadium:
+                    setattr(device, "stadium", stadium)
+
+                if store_log:
+                    session.add(DeviceLog(
+                        device_id=device.id,
+                        metric_type=metric_type,
+                        metric_value=value,
+                        timestamp=ts,
+                    ))
+                if flags and not flags[0]:
+                    continue
 
+                # Update last known state
+                current_values = json.loads(device.last_metric_values) if device.last_metric_values else {}
+                current_values[metric_type] = parse_metric_value(metric_type, value)
+                device.last_metric_values = json.dumps(current_values)
+                device.last_message_time = ts
+                device.wifi_connected = True
+
+            if lsn is not None:
+                # same transaction as the rows: replay resumes exactly after this
+                session.merge(IngestCheckpoint(id=1, lsn=lsn))
             session.commit()
+        finally:
+            session.close()
 
-            # Update cache
-            device_dict = self._device_to_dict(device)
-            self.devices[name] = device_dict
-            return device_dict
+    # ---------- ingest journal ----------
+    def attach_journal(self, journal: IngestJournal) -> None:
+        """Replay what the last run journaled but never committed, then write through `journal`."""
+        session = self.session_factory()
+        try:
+            checkpoint = session.get(IngestCheckpoint, 1)
+            committed = checkpoint.lsn if checkpoint else 0
         finally:
             session.close()
+        replay = journal.open(committed)
+        for _, (name, metric_type, stadium, value, at, _store, *flags) in replay:
+            if not flags or flags[0]:
+                self._apply_state(name, metric_type, stadium, parse_metric_value(metric_type, value), at)
+        if replay:
+            print(f"Journal: replaying {len(replay)} uncommitted messages (after lsn {committed})")
+        self.journal = journal
+        journal.start(self._persist_batch)
+
+    def _persist_batch(self, batch: Batch) -> None:
+        self._persist([record for _, record in batch], lsn=batch[-1][0])
 
     def get_device_history(
         self,
@@ -181,12 +406,101 @@ class DeviceManager:
                 LIMIT :limit
             """
 
-            rows = session.execute(text(sql), params).mappings().all()
-            has_more = len(rows) == page_size
-            return [dict(r) for r in rows], has_more
+            logs = [dict(r) for r in session.execute(text(sql), params).mappings().all()]
+
+            # Past the hot window: continue below the oldest id seen in the archive
+            if len(logs) < page_size and self.archive and self.archive.covers(start_time):
+                before = logs[-1]["id"] if logs else last_id
+                for rid, ts, _dev, _st, metric, value in self.archive.scan(
+                    metric=metric_type, device=device_name, start_time=start_time,
+                    end_time=end_time, before_id=before, limit=page_size - len(logs),
+                ):
+                    logs.append({"id": rid, "ts": ts, "metric": metric, "value": value})
+
+            has_more = len(logs) == page_size
+            return logs, has_more
         finally:
             session.close()
 
+    def get_device_series(
+        self,
+        device_name: str,
+        metric_type: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All numeric samples of one metric in a time range, oldest first, as
+        (epoch seconds, values) arrays. Non-numeric rows are skipped.
+        """
+        where = ["device = :device", "metric = :metric"]
+        params: Dict = {"device": device_name, "metric": metric_type}
+        if start_time:
+            where.append("ts >= :start_time")
+            params["start_time"] = start_time.isoformat(sep=" ")
+        if end_time:
+            where.append("ts <= :end_time")
+            params["end_time"] = end_time.isoformat(sep=" ")
+
+        session = self.session_factory()
+        try:
+            rows = session.execute(
+                text(f"SELECT ts, value FROM device_logs_norm WHERE {' AND '.join(where)} ORDER BY id"),
+                params,
+            ).all()
+        finally:
+            session.close()
+
+        rows = [(t, raw, None) for t, raw in rows]
+        if self.archive and self.archive.covers(start_time):
+            rows += [(r[1], r[5], None) for r in self.archive.scan(
+                metric=metric_type, device=device_name, start_time=start_time, end_time=end_time)]
+        x, y, _ = _numeric_samples(metric_type, rows)
+        return x, y
+
+    def get_metric_samples(
+        self,
+        metric_type: str,
+        start_time: datetime,
+        end_time: datetime,
+        stadium: Optional[str] = None,
+        device_names: Optional[List[str]] = None,
+    ) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        One query for one metric across a stadium and/or a device list.
+        Returns (device names, epoch seconds, values, column index into names).
+        """
+        where = ["metric = :metric", "ts >= :start_time", "ts <= :end_time"]
+        params: Dict = {
+            "metric": metric_type,
+            "start_time": start_time.isoformat(sep=" "),
+            "end_time": end_time.isoformat(sep=" "),
+        }
+        if stadium:
+            where.append("stadium = :stadium")
+            params["stadium"] = stadium
+        stmt = text(f"SELECT ts, value, device FROM device_logs_norm WHERE {' AND '.join(where)}"
+                    + (" AND device IN :devices" if device_names else "") + " ORDER BY id")
+        if device_names:
+            stmt = stmt.bindparams(bindparam("devices", expanding=True))
+            params["devices"] = list(device_names)
+
+        session = self.session_factory()
+        try:
+            rows = session.execute(stmt, params).all()
+        finally:
+            session.close()
+
+        if self.archive and self.archive.covers(start_time):
+            rows += [(r[1], r[5], r[2]) for r in self.archive.scan(
+                metric=metric_type, devices=device_names, stadium=stadium,
+                start_time=start_time, end_time=end_time)]
+        x, y, names = _numeric_samples(metric_type, rows)
+        columns = sorted(set(device_names or names))
+        index = {name: i for i, name in enumerate(columns)}
+        col = np.array([index[n] for n in names], dtype=np.int64)
+        return columns, x, y, col
+
     def check_wifi_status(self):
         session = self.session_factory()
         changed: list[str] = []
@@ -198,8 +512,11 @@ class DeviceManager:
                 is_now = bool(device.last_message_time and device.last_message_time > threshold)
                 if was != is_now:
                     device.wifi_connected = is_now
-                    if device.name in self.devices:
-                        self.devices[device.name]["wifiConnected"] = is_now
+                    with self._state_lock:
+                        if device.name in self.devices:
+                            self.store_state(device.name, {**self.devices[device.name], "wifiConnected": is_now})
+                        else:
+                            self.versions.bump(device.stadium)
                     changed.append(device.name)
             session.commit()
         finally:
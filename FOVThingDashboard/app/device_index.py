@@ -0,0 +1,268 @@
+"""
+Secondary indexes over DeviceManager.devices for the device search API.
+
+`DeviceIndex.observe(name, old, new)` is a DeviceManager state listener, so
+the indexes move with every state change. Kept:
+
+* name → set of device names, per stadium / online / battery band / firmware
+* every name in sorted order (name-prefix lookups and unfiltered
+  name-ordered pages are bisects)
+* per sort field, (sort value, name) in sorted order - for the whole
+  fleet and per stadium
+
+A query intersects the matching buckets (smallest first) to count the
+matches, then bisects the cursor into the sorted list of its stadium (or
+the fleet) and walks it, keeping rows that pass the other filters, until
+the page is full - no copy or sort of the matched set. Only when the
+matches are a small fraction of that list is sorting them cheaper than
+the walk. Cursors are keyset cursors - (sort value, name) of the last
+row - so pages stay stable while devices come and go.
+"""
+
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Iterable, Optional
+
+# battery bands, by lower bound; 0 % means "never reported" (see aggregates.py)
+BATTERY_BANDS = [(80, "high"), (40, "ok"), (15, "low"), (0, "critical")]
+SORT_FIELDS = ("name", "batteryCharge", "temperature", "latencyMs", "lastMessageTime", "firmwareVersion")
+FIELDS = (
+    "name", "stadium", "wifiConnected", "batteryCharge", "temperature", "latencyMs",
+    "firmwareVersion", "otaStatus", "lastMessageTime", "firstSeen", "rateLimited",
+)
+_NUMERIC = ("batteryCharge", "temperature", "latencyMs")
+# walk the sorted list unless the matches are fewer than 1/SPARSE of it
+SPARSE = 16
+
+
+def battery_band(charge: Any) -> str:
+    try:
+        charge = float(charge)
+    except (TypeError, ValueError):
+        return "unknown"
+    if charge <= 0:
+        return "unknown"
+    return next(band for low, band in BATTERY_BANDS if charge >= low)
+
+
+def _keys(data: dict) -> dict[str, Any]:
+    """Index keys of one device dict."""
+    return {
+        "stadium": data.get("stadium"),
+        "online": bool(data.get("wifiConnected")),
+        "battery": battery_band(data.get("batteryCharge")),
+        "firmware": str(data.get("firmwareVersion", "N/A")),
+    }
+
+
+def _sort_value(field: str, data: dict):
+    v = data.get(field)
+    if field in _NUMERIC:
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            return 0.0
+    return "" if v is None else str(v)
+
+
+def encode_cursor(value, name: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, name]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("invalid cursor")
+    return value, name
+
+
+class DeviceIndex:
+    INDEXES = ("stadium", "online", "battery", "firmware")
+
+    def __init__(self):
+        self._by: dict[str, dict[Any, set]] = {ix: {} for ix in self.INDEXES}
+        self._keys: dict[str, dict] = {}        # name → its current index keys
+        self._data: dict[str, dict] = {}        # name → latest device dict
+        self._names: list[str] = []             # sorted
+        # sort field → sorted [(sort value, name)]: whole fleet, and per stadium
+        self._sorted: dict[str, list[tuple]] = {f: [] for f in SORT_FIELDS}
+        self._sorted_by_stadium: dict[Any, dict[str, list[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    # ---------- maintenance (state listener) ----------
+    @staticmethod
+    def _remove(entries: list[tuple], entry: tuple) -> None:
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            entries.pop(i)
+
+    def _resort(self, name: str, before: Optional[dict], after: Optional[dict], old: Optional[dict], new: Optional[dict]) -> None:
+        """Move name's (sort value, name) entries when a sort value or its stadium changed."""
+        st_old = before["stadium"] if before else None
+        st_new = after["stadium"] if after else None
+        for field in SORT_FIELDS:
+            v_old = _sort_value(field, old) if old is not None else None
+            v_new = _sort_value(field, new) if new is not None else None
+            if old is not None and new is not None and v_old == v_new and st_old == st_new:
+                continue
+            if old is not None:
+                self._remove(self._sorted[field], (v_old, name))
+                self._remove(self._sorted_by_stadium[st_old][field], (v_old, name))
+            if new is not None:
+                insort(self._sorted[field], (v_new, name))
+                per = self._sorted_by_stadium.setdefault(st_new, {f: [] for f in SORT_FIELDS})
+                insort(per[field], (v_new, name))
+        if old is not None and st_old != st_new and not self._sorted_by_stadium[st_old]["name"]:
+            del self._sorted_by_stadium[st_old]         # its last device left
+
+    def observe(self, name: str, old: Optional[dict], new: Optional[dict]) -> None:
+        with self._lock:
+            before = self._keys.get(name)
+            after = _keys(new) if new is not None else None
+            self._resort(name, before, after, self._data.get(name), new)
+            for ix in self.INDEXES:
+                if before and after and before[ix] == after[ix]:
+                    continue
+                if before:
+                    bucket = self._by[ix].get(before[ix])
+                    if bucket is not None:
+                        bucket.discard(name)
+                        if not bucket:
+                            del self._by[ix][before[ix]]
+                if after:
+                    self._by[ix].setdefault(after[ix], set()).add(name)
+            if after is None:
+                if before is not None:
+                    del self._keys[name], self._data[name]
+                    i = bisect_left(self._names, name)
+                    if i < len(self._names) and self._names[i] == name:
+                        self._names.pop(i)
+                return
+            if before is None:
+                insort(self._names, name)
+            self._keys[name] = after
+            self._data[name] = new
+
+    def counts(self, index: str) -> dict:
+        """Devices per key of one index (e.g. per battery band)."""
+        with self._lock:
+            return {str(k): len(v) for k, v in self._by[index].items()}
+
+    # ---------- queries ----------
+    def _bucket_union(self, ix: str, values: Iterable) -> set:
+        out: set = set()
+        for v in values:
+            out |= self._by[ix].get(v, set())
+        return out
+
+    def _prefix_names(self, prefix: str) -> list[str]:
+        lo = bisect_left(self._names, prefix)
+        hi = bisect_left(self._names, prefix + "\U0010ffff")
+        return self._names[lo:hi]
+
+    @staticmethod
+    def _page(
+        ordered: list[tuple], key: Optional[tuple], desc: bool, limit: int, keep: Optional[set]
+    ) -> tuple[list[tuple], bool]:
+        """Up to `limit` entries after `key` (before it, descending) that are in `keep`, and whether more follow."""
+        if keep is None:
+            if desc:
+                i = bisect_left(ordered, key) if key else len(ordered)
+                return ordered[max(0, i - limit):i][::-1], i - limit > 0
+            i = bisect_right(ordered, key) if key else 0
+            return ordered[i:i + limit], i + limit < len(ordered)
+        rows: list[tuple] = []
+        if desc:
+            i = bisect_left(ordered, key) if key else len(ordered)
+            walk = range(i - 1, -1, -1)
+        else:
+            i = bisect_right(ordered, key) if key else 0
+            walk = range(i, len(ordered))
+        for j in walk:
+            if ordered[j][1] in keep:
+                if len(rows) == limit:
+                    return rows, True
+                rows.append(ordered[j])
+        return rows, False
+
+    def search(
+        self,
+        stadium: Optional[str] = None,
+        online: Optional[bool] = None,
+        battery: Optional[list[str]] = None,
+        firmware: Optional[list[str]] = None,
+        prefix: Optional[str] = None,
+        sort: str = "name",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[list[str]] = None,
+    ) -> dict:
+        desc = sort.startswith("-")
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {SORT_FIELDS} (prefix '-' for descending)")
+        bad = [f for f in fields or () if f not in FIELDS]
+        if bad:
+            raise ValueError(f"unknown fields {bad}; valid: {FIELDS}")
+        after = decode_cursor(cursor) if cursor else None
+
+        with self._lock:
+            sets = []
+            if stadium is not None:
+                sets.append(self._by["stadium"].get(stadium, set()))
+            if online is not None:
+                sets.append(self._by["online"].get(online, set()))
+            if battery:
+                sets.append(self._bucket_union("battery", battery))
+            if firmware:
+                sets.append(self._bucket_union("firmware", firmware))
+            sets.sort(key=len)
+
+            if not sets and field == "name" and not desc:
+                # whole fleet by name: straight off the sorted name list
+                names = self._prefix_names(prefix) if prefix else self._names
+                total = len(names)
+                i = bisect_right(names, after[1]) if after else 0
+                page_names = names[i:i + limit]
+                has_more = i + limit < total
+                page = [(n, self._data[n]) for n in page_names]
+            else:
+                if sets:
+                    # read-only below, so a single bucket is used as is
+                    matched = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+                    if prefix:
+                        matched = {n for n in matched if n.startswith(prefix)}
+                else:
+                    matched = self._prefix_names(prefix) if prefix else self._names
+                total = len(matched)
+                if stadium is not None:
+                    base = self._sorted_by_stadium.get(stadium, {}).get(field, [])
+                else:
+                    base = self._sorted[field]
+                key = tuple(after) if after else None
+                try:
+                    if total * SPARSE < len(base):
+                        ordered = sorted((_sort_value(field, self._data[n]), n) for n in matched)
+                        rows, has_more = self._page(ordered, key, desc, limit, None)
+                    else:
+                        # the base list already is stadium ∩ sort order; filter the rest while walking
+                        keep = None
+                        if len(sets) > (stadium is not None) or prefix:
+                            keep = matched if isinstance(matched, set) else set(matched)
+                        rows, has_more = self._page(base, key, desc, limit, keep)
+                except TypeError:
+                    raise ValueError("cursor was issued for a different sort")
+                page = [(n, self._data[n]) for _, n in rows]
+
+        items = [
+            {f: data.get(f) for f in fields} if fields else data
+            for _, data in page
+        ]
+        next_cursor = None
+        if has_more and page:
+            last_name, last_data = page[-1]
+            next_cursor = encode_cursor(_sort_value(field, last_data), last_name)
+        return {"devices": items, "total": total, "nextCursor": next_cursor}
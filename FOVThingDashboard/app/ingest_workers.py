@@ -0,0 +1,135 @@
+"""
+Region-local ingest workers.
+
+All MQTT clients share one CRT event-loop thread (IOTContext.shared()), so
+a handler doing a slow SQLite write for one region used to hold up every
+other region's messages. Now the CRT callback only enqueues
+(handler, topic, payload, received_at) on its region's queue, and one
+worker thread per region runs the handlers.
+
+Per region: received / processed / dropped (queue full) counts, queue
+depth, throughput (msg/s over the last window) and lag (time from MQTT
+receipt to handler completion; last, EWMA and window max).
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+Handler = Callable[..., None]
+Gate = Callable[[str, Callable[[], None]], None]     # fn(topic, enqueue)
+
+RATE_WINDOW_S = 5.0
+LAG_ALPHA = 0.1        # EWMA weight of the newest lag sample
+
+
+class RegionWorker:
+    def __init__(self, region: str, max_queue: int):
+        self.region = region
+        self._q: "queue.Queue[tuple]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.rate_per_s = 0.0
+        self.lag_ms_last = 0.0
+        self.lag_ms_ewma = 0.0
+        self.lag_ms_max = 0.0          # max over the last completed rate window
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._window_max = 0.0
+        threading.Thread(target=self._run, name=f"ingest-{region}", daemon=True).start()
+
+    def submit(self, handler: Handler, topic: str, payload: bytes, received_at: Optional[float] = None) -> None:
+        """CRT callback thread: never blocks. Full queue → drop and count."""
+        with self._lock:
+            self.received += 1
+        try:
+            self._q.put_nowait((handler, topic, payload, received_at or time.time()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            handler, topic, payload, received_at = self._q.get()
+            try:
+                self._call(handler, topic, payload, received_at)
+            except Exception as e:
+                self.errors += 1
+                print(f"[{self.region}] ingest handler failed on '{topic}': {e}")
+            self._record((time.time() - received_at) * 1000.0)
+
+    def _call(self, handler: Handler, topic: str, payload: bytes, received_at: float) -> None:
+        # separate method so the stage profiler can wrap it while enabled
+        handler(topic, payload, received_at=received_at)
+
+    def _record(self, lag_ms: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.processed += 1
+            self.lag_ms_last = lag_ms
+            self.lag_ms_ewma += LAG_ALPHA * (lag_ms - self.lag_ms_ewma)
+            self._window_count += 1
+            self._window_max = max(self._window_max, lag_ms)
+            if now - self._window_start >= RATE_WINDOW_S:
+                self.rate_per_s = self._window_count / (now - self._window_start)
+                self.lag_ms_max = self._window_max
+                self._window_start, self._window_count, self._window_max = now, 0, 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = time.monotonic() - self._window_start >= 2 * RATE_WINDOW_S
+            return {
+                "received": self.received,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "queue_depth": self._q.qsize(),
+                "rate_per_s": 0.0 if idle else round(self.rate_per_s, 1),
+                "lag_ms": {
+                    "last": round(self.lag_ms_last, 1),
+                    "ewma": round(self.lag_ms_ewma, 1),
+                    "window_max": round(max(self.lag_ms_max, self._window_max), 1),
+                },
+            }
+
+
+class IngestWorkers:
+    def __init__(self, max_queue: Optional[int] = None):
+        self.max_queue = max_queue or int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+        self._workers: dict[str, RegionWorker] = {}
+        self._lock = threading.Lock()
+
+    def worker(self, region: str) -> RegionWorker:
+        with self._lock:
+            w = self._workers.get(region)
+            if w is None:
+                w = self._workers[region] = RegionWorker(region, self.max_queue)
+            return w
+
+    def wrap(self, region: str, handler: Handler, gate: Optional[Gate] = None) -> Handler:
+        """
+        MQTT callback that hands the message to `region`'s worker. With a
+        `gate` (e.g. the rate limiter) the gate decides whether and when the
+        enqueue happens.
+        """
+        w = self.worker(region)
+
+        if gate is None:
+            def _enqueue(topic, payload, *a, **kw):
+                w.submit(handler, topic, payload)
+        else:
+            def _enqueue(topic, payload, *a, **kw):
+                # stamped here: a message the gate holds back keeps its real receipt time
+                received_at = time.time()
+                gate(topic, lambda: w.submit(handler, topic, payload, received_at))
+        return _enqueue
+
+    def stats(self) -> dict:
+        with self._lock:
+            workers = dict(self._workers)
+        return {region: w.stats() for region, w in workers.items()}
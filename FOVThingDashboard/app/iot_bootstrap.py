@@ -0,0 +1,164 @@
+"""
+Parallel MQTT bootstrap + readiness tracking.
+
+All endpoints connect concurrently, then every endpoint's topics are
+subscribed pipelined (all SUBSCRIBEs in flight at once). One bad endpoint
+(missing certs, unreachable region) no longer blocks the others.
+
+`IngestReadiness` records per-endpoint state and phase timings for
+/api/ready.
+
+An MQTT5 client whose first connect failed or timed out keeps retrying
+inside the CRT; it is handed its subscriptions to apply on whichever
+connect succeeds, stays in the returned clients (publish is a no-op
+until then) and turns its endpoint "ready" once the SUBACKs arrive.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from aws_iot.IOTClient import Handler, IOTClient
+
+CONNECT_TIMEOUT_S = 30
+SUBSCRIBE_TIMEOUT_S = 30
+
+
+@dataclass
+class EndpointPlan:
+    endpoint: str
+    region: str = ""
+    subscriptions: list[tuple[str, Handler]] = field(default_factory=list)
+
+
+class IngestReadiness:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.endpoints: dict[str, dict] = {}
+
+    def begin(self, plans: list[EndpointPlan]) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.finished_at = None
+            self.endpoints = {
+                p.endpoint: {
+                    "region": p.region,
+                    "state": "pending",            # pending → connecting → subscribing → ready | failed (| retrying → ready)
+                    "topics": len(p.subscriptions),
+                    "subscribed": 0,
+                    "connect_ms": None,
+                    "subscribe_ms": None,
+                    "error": None,
+                }
+                for p in plans
+            }
+
+    def update(self, endpoint: str, **fields) -> None:
+        with self._lock:
+            self.endpoints[endpoint].update(fields)
+
+    def finish(self) -> None:
+        self.finished_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.endpoints) and all(e["state"] == "ready" for e in self.endpoints.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "bootstrap_ms": (
+                    round((self.finished_at - self.started_at) * 1000, 1)
+                    if self.started_at and self.finished_at else None
+                ),
+                "endpoints": {ep: dict(st) for ep, st in self.endpoints.items()},
+            }
+
+
+def _ms_since(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def bootstrap(
+    plans: list[EndpointPlan],
+    make_client: Callable[[EndpointPlan], IOTClient],
+    readiness: IngestReadiness,
+) -> dict[str, IOTClient]:
+    """Connect all endpoints concurrently, then subscribe each one pipelined."""
+    readiness.begin(plans)
+
+    # --- phase 1: connect everything at once ---------------------------
+    clients: dict[str, IOTClient] = {}
+    connects: dict[str, tuple[Future, float]] = {}
+    connected_at: dict[str, float] = {}
+    for plan in plans:
+        try:
+            client = make_client(plan)
+            t0 = time.perf_counter()
+            fut = client.connect_async()
+            fut.add_done_callback(lambda _f, ep=plan.endpoint: connected_at.setdefault(ep, time.perf_counter()))
+            connects[plan.endpoint] = (fut, t0)
+            clients[plan.endpoint] = client
+            readiness.update(plan.endpoint, state="connecting")
+        except Exception as exc:
+            print(f"IoT client for {plan.endpoint} failed to start: {exc}")
+            readiness.update(plan.endpoint, state="failed", error=str(exc))
+
+    wait([f for f, _ in connects.values()], timeout=CONNECT_TIMEOUT_S)
+    connected: list[str] = []
+    by_endpoint = {p.endpoint: p for p in plans}
+    for endpoint, (fut, t0) in connects.items():
+        if not fut.done() or fut.exception() is not None:
+            error = "connect timed out" if not fut.done() else str(fut.exception())
+            client = clients[endpoint]
+            if hasattr(client, "subscribe_when_connected"):
+                # MQTT5: the CRT keeps retrying; subscribe on its first success
+                def _late_ready(ok: int, total: int, ep=endpoint) -> None:
+                    readiness.update(
+                        ep,
+                        state="ready" if ok == total else "failed",
+                        subscribed=ok,
+                        error=None if ok == total else f"subscribe failed: {total - ok} topics",
+                    )
+                readiness.update(endpoint, state="retrying", error=error)
+                client.subscribe_when_connected(by_endpoint[endpoint].subscriptions, on_ready=_late_ready)
+                connected.append(endpoint)
+            else:
+                readiness.update(endpoint, state="failed", error=error)
+        else:
+            connected.append(endpoint)
+            done = connected_at.get(endpoint, time.perf_counter())
+            readiness.update(endpoint, state="subscribing", connect_ms=round((done - t0) * 1000, 1))
+
+    # --- phase 2: subscribe every connected endpoint in parallel -------
+    def _subscribe(plan: EndpointPlan) -> None:
+        t0 = time.perf_counter()
+        results = clients[plan.endpoint].subscribe_many(plan.subscriptions, timeout=SUBSCRIBE_TIMEOUT_S)
+        failed = {t: str(e) for t, e in results.items() if e is not None}
+        readiness.update(
+            plan.endpoint,
+            state="failed" if failed else "ready",
+            subscribed=len(results) - len(failed),
+            subscribe_ms=_ms_since(t0),
+            error=f"subscribe failed: {failed}" if failed else None,
+        )
+
+    threads = [
+        threading.Thread(target=_subscribe, args=(plan,), name=f"subscribe-{plan.endpoint}", daemon=True)
+        for plan in plans
+        if readiness.endpoints[plan.endpoint]["state"] == "subscribing"
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    readiness.finish()
+    snap = readiness.snapshot()
+    print(f"IoT bootstrap finished in {snap['bootstrap_ms']} ms; ready={snap['ready']}")
+    return {ep: clients[ep] for ep in connected}
@@ -0,0 +1,336 @@
+"""
+Crash-safe, append-only ingest journal in front of the DB writer.
+
+Ingest used to write SQLite inline: a locked DB, a slow commit or a
+briefly full disk made `update_device` raise and the message was gone.
+Now each message is appended here first (a memcpy into an mmap'd
+segment), live state moves on, and one writer thread commits the journal
+to SQLite in batches - retrying with backoff while the DB is unhappy.
+
+Segments (`<first lsn>.journal` under JOURNAL_DIR) are preallocated to
+JOURNAL_SEGMENT_MB and hold length-prefixed records:
+
+    >I payload length | >I crc32(payload) | >Q lsn | payload (JSON)
+
+A zero length marks the end of the written part; a bad CRC marks a torn
+tail write. Dirty pages are synced every JOURNAL_FSYNC_MS (batched
+fsync), so a power cut can lose at most that window; a process crash or
+DB failure loses nothing. The sync is an fdatasync of the segment file,
+outside the append lock: it releases the GIL, where mmap.flush would
+hold it and stall every ingest thread for the length of the disk write.
+A full segment is handed to the sync thread, which syncs and closes it.
+
+The writer's queue keeps at most JOURNAL_MAX_PENDING entries in memory.
+While the DB is down for long, newer entries live only in the segments,
+and the writer reads them back from there once it has caught up.
+
+The writer stores the last LSN it committed in the same transaction as
+the rows (DeviceManager does this), so on startup exactly the entries
+after it are replayed. Segments whose records are all committed are
+deleted.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Callable, Optional
+
+_HEADER = struct.Struct(">IIQ")     # payload length, crc32, lsn
+SUFFIX = ".journal"
+
+Record = tuple
+Batch = list[tuple[int, Record]]    # [(lsn, record), ...]
+
+
+def default_journal_dir() -> Path:
+    db_path = Path(os.getenv("DB_PATH", Path(__file__).with_name("fov_dashboard.db"))).expanduser().resolve()
+    return Path(os.getenv("JOURNAL_DIR", db_path.parent / "journal"))
+
+
+def _records(buf, size: int):
+    """(lsn, payload, end offset) of valid records; stops at the end marker or a torn write."""
+    pos = 0
+    while pos + _HEADER.size <= size:
+        length, crc, lsn = _HEADER.unpack_from(buf, pos)
+        end = pos + _HEADER.size + length
+        if length == 0 or end > size:
+            break
+        payload = buf[pos + _HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            break
+        yield lsn, payload, end
+        pos = end
+
+
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+class _Segment:
+    def __init__(self, path: Path, size: Optional[int] = None):
+        """Open an existing segment, or create and preallocate one of `size` bytes."""
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT | os.O_EXCL if size else 0), 0o644)
+        try:
+            if size:
+                try:
+                    os.posix_fallocate(fd, 0, size)     # real blocks now, not ENOSPC later
+                except (AttributeError, OSError):
+                    os.ftruncate(fd, size)
+            self.size = os.fstat(fd).st_size
+            self.mm = mmap.mmap(fd, self.size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd                # kept for fdatasync; closed with the segment
+        self.path = path
+        self.offset = 0             # append position
+        self.flushed = 0            # synced up to here
+        self.last_lsn = 0
+
+    def records(self):
+        """Valid records from the start; stops at the end marker or a torn write."""
+        for lsn, payload, end in _records(self.mm, self.size):
+            yield lsn, payload
+            self.offset = end
+
+    def write(self, lsn: int, payload: bytes) -> bool:
+        end = self.offset + _HEADER.size + len(payload)
+        if end > self.size:
+            return False
+        # payload first, header last: a half-written record has no valid length+crc
+        self.mm[self.offset + _HEADER.size:end] = payload
+        _HEADER.pack_into(self.mm, self.offset, len(payload), zlib.crc32(payload), lsn)
+        self.offset = end
+        self.last_lsn = lsn
+        return True
+
+    def sync(self, upto: int) -> bool:
+        """Make everything before `upto` durable; no lock needed (only the sync thread calls this)."""
+        if upto <= self.flushed:
+            return False
+        _datasync(self.fd)          # writes back the mapping's dirty pages; releases the GIL
+        self.flushed = upto
+        return True
+
+    def close(self) -> None:
+        self.sync(self.offset)
+        self.mm.close()
+        os.close(self.fd)
+
+
+class IngestJournal:
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        segment_bytes: Optional[int] = None,
+        fsync_interval_s: Optional[float] = None,
+        batch_size: Optional[int] = None,
+    ):
+        self.directory = Path(directory or default_journal_dir())
+        self.segment_bytes = segment_bytes or int(float(os.getenv("JOURNAL_SEGMENT_MB", "16")) * 1024 * 1024)
+        self.fsync_interval_s = fsync_interval_s or float(os.getenv("JOURNAL_FSYNC_MS", "50")) / 1000.0
+        self.batch_size = batch_size or int(os.getenv("JOURNAL_BATCH_SIZE", "500"))
+        self.max_pending = max(self.batch_size, int(os.getenv("JOURNAL_MAX_PENDING", "200000")))
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()         # one syncer at a time; never held with appends
+        self._has_work = threading.Condition(self._lock)
+        self._pending: deque = deque()             # (lsn, record) not yet committed to the DB
+        # first lsn that is only on disk (the queue was full when it came), or None
+        self._spill_lsn: Optional[int] = None
+        self._closed: list[tuple[Path, int]] = []  # full segments: (path, last lsn)
+        self._retired: list[_Segment] = []         # full segments the sync thread still has to close
+        self._segment: Optional[_Segment] = None
+        self._next_lsn = 1
+        self.committed_lsn = 0
+        self.stats = {"appended": 0, "committed": 0, "replayed": 0, "fsyncs": 0,
+                      "write_failures": 0, "read_back": 0, "last_error": None}
+
+    # ---------- startup ----------
+    def open(self, committed_lsn: int) -> Batch:
+        """Scan existing segments; return (and queue) the entries after `committed_lsn`."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.committed_lsn = committed_lsn
+        last = committed_lsn
+        replay: Batch = []
+        for path in sorted(self.directory.glob(f"*{SUFFIX}")):
+            if path.stat().st_size == 0:
+                # created but never preallocated (crash in _roll): holds nothing, and can't be mmap'd
+                print(f"Journal: removing empty segment {path.name}")
+                path.unlink()
+                continue
+            seg = _Segment(path)
+            seg_last = 0
+            for lsn, payload in seg.records():
+                seg_last = max(seg_last, lsn)
+                if lsn > committed_lsn:
+                    replay.append((lsn, tuple(json.loads(payload))))
+            seg.mm.close()
+            os.close(seg.fd)
+            last = max(last, seg_last)
+            self._closed.append((path, seg_last))
+        replay.sort(key=lambda e: e[0])
+        self._pending.extend(replay[:self.max_pending])
+        if len(replay) > self.max_pending:
+            self._spill_lsn = replay[self.max_pending][0]
+        self._next_lsn = last + 1
+        self.stats["replayed"] = len(replay)
+        self._release(committed_lsn)
+        self._roll()            # appends always go to a fresh segment
+        threading.Thread(target=self._flush_loop, name="journal-fsync", daemon=True).start()
+        return replay
+
+    def start(self, apply_batch: Callable[[Batch], None]) -> None:
+        """Run the DB writer: apply_batch must persist the batch and its last lsn atomically."""
+        threading.Thread(target=self._write_loop, args=(apply_batch,), name="journal-writer", daemon=True).start()
+
+    # ---------- ingest side ----------
+    @property
+    def appended_lsn(self) -> int:
+        """lsn of the newest entry appended so far (committed_lsn catches up to it)."""
+        with self._lock:
+            return self._next_lsn - 1
+
+    def append(self, record: Record) -> int:
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        if _HEADER.size + len(payload) > self.segment_bytes:
+            raise ValueError(f"journal record too large ({len(payload)} bytes)")
+        with self._lock:
+            lsn = self._next_lsn
+            if not self._segment.write(lsn, payload):
+                self._roll()
+                self._segment.write(lsn, payload)
+            self._next_lsn += 1
+            if self._spill_lsn is None and len(self._pending) >= self.max_pending:
+                self._spill_lsn = lsn       # the writer is far behind: keep the rest on disk only
+            if self._spill_lsn is None:
+                self._pending.append((lsn, record))
+            self.stats["appended"] += 1
+            self._has_work.notify()
+        return lsn
+
+    def _roll(self) -> None:
+        """Start a new preallocated segment (caller holds the lock, or we're starting up)."""
+        old = self._segment
+        if old is not None:
+            self._retired.append(old)       # synced and closed by the sync thread, not here
+            self._closed.append((old.path, old.last_lsn))
+        path = self.directory / f"{self._next_lsn:016d}{SUFFIX}"
+        self._segment = _Segment(path, self.segment_bytes)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.fsync_interval_s)
+            self.flush()
+
+    def flush(self) -> None:
+        """Sync what was appended so far. Only the offsets are taken under the append lock."""
+        with self._sync_lock:
+            with self._lock:
+                seg = self._segment
+                upto = seg.offset if seg else 0
+                retired, self._retired = self._retired, []
+            for old in retired:
+                old.close()
+            if seg and seg.sync(upto):
+                self.stats["fsyncs"] += 1
+
+    # ---------- writer side ----------
+    def _write_loop(self, apply_batch: Callable[[Batch], None]) -> None:
+        backoff = 0.1
+        while True:
+            with self._has_work:
+                while not self._pending and self._spill_lsn is None:
+                    self._has_work.wait()
+                spilled = self._spill_lsn if not self._pending else None
+            if spilled is not None:
+                self._read_back(spilled)
+                continue
+            with self._lock:
+                batch = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+            try:
+                apply_batch(batch)
+            except Exception as e:
+                # DB locked / disk full / ...: entries stay queued (and on disk); try again
+                self.stats["write_failures"] += 1
+                self.stats["last_error"] = str(e)
+                print(f"Journal writer: batch of {len(batch)} failed ({e}); retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 5.0)
+                continue
+            backoff = 0.1
+            with self._lock:
+                for _ in batch:
+                    self._pending.popleft()
+                self.committed_lsn = batch[-1][0]
+                self.stats["committed"] += len(batch)
+                self._release(self.committed_lsn)
+
+    def _read_back(self, from_lsn: int) -> None:
+        """Queue up to max_pending entries from `from_lsn` on, read from the segments."""
+        with self._lock:
+            segments = [path for path, last in self._closed if last >= from_lsn]
+            active = self._segment
+            segments.append(active.path)
+            limits = {active.path: active.offset}       # bytes of the active segment written so far
+            next_lsn = self._next_lsn
+        entries: Batch = []
+        for path in sorted(segments):
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if not size:
+                    continue
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for lsn, payload, _ in _records(mm, limits.get(path, size)):
+                    if lsn >= from_lsn:
+                        entries.append((lsn, tuple(json.loads(payload))))
+                        if len(entries) >= self.max_pending:
+                            break
+            finally:
+                mm.close()
+            if len(entries) >= self.max_pending:
+                break
+        with self._lock:
+            self._pending.extend(entries)
+            after = entries[-1][0] + 1 if entries else from_lsn
+            # caught up with everything appended while we read: back to queueing in memory
+            self._spill_lsn = None if after >= self._next_lsn else after
+            self.stats["read_back"] += len(entries)
+        if not entries:
+            # nothing readable past from_lsn yet (shouldn't happen): don't spin on it
+            print(f"Journal: nothing to read back from lsn {from_lsn}; retrying")
+            time.sleep(1.0)
+        else:
+            print(f"Journal: read back {len(entries)} entries from disk (lsn {from_lsn}..{after - 1}"
+                  f"{'' if after >= next_lsn else ', more to come'})")
+
+    def _release(self, committed_lsn: int) -> None:
+        """Delete full segments whose records are all in the DB."""
+        keep = []
+        for path, last_lsn in self._closed:
+            if last_lsn <= committed_lsn:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    print(f"Journal: could not remove {path.name}: {e}")
+                    keep.append((path, last_lsn))
+            else:
+                keep.append((path, last_lsn))
+        self._closed = keep
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "backlog": self._next_lsn - 1 - self.committed_lsn,
+                "in_memory": len(self._pending),
+                "spilled": self._spill_lsn is not None,
+                "committed_lsn": self.committed_lsn,
+                "next_lsn": self._next_lsn,
+                "segments": len(self._closed) + (self._segment is not None),
+            }
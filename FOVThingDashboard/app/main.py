@@ -2,33 +2,57 @@ import asyncio
 import json
 import os
 import time
+import urllib.error
+import urllib.request
 import uuid
-from fastapi import FastAPI, WebSocket, HTTPException, Depends
+import numpy as np
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from datetime import datetime, timedelta
 from threading import Thread
 from typing import Optional
 from pydantic import BaseModel  # added
 
 from aws_iot.IOTClient import IOTClient
+from aws_iot.IOTClient5 import IOTClient5
 from aws_iot.IOTContext import IOTContext, IOTCredentials
 from database import init_db
 from device import DeviceManager
+from device_index import DeviceIndex
 from relay import RelayManager
+from relay_history import RelayTimeline
+from sessions import SessionManager
 from config import FOVDashboardConfig
 from websockets_manager import WebSocketManager
-import smtplib
-from email.message import EmailMessage
-from email.utils import formatdate
+from sse import EventRing
+from ws_encoding import negotiate as negotiate_ws_encoding
+from runtime_monitor import LoopLagMonitor, ProcessSampler
+from state_bus import StateBusClient, StateBusServer
+from ingest_workers import IngestWorkers, RegionWorker
+from ratelimit import IngressLimiter
+from journal import IngestJournal
+from profiling import AllocationTracker, Busy, CPUSampler, StageProfiler
+from iot_bootstrap import EndpointPlan, IngestReadiness, bootstrap as bootstrap_iot
+from commands import CommandDispatcher, CommandJob, RolloutTracker
+from aggregates import FleetAggregates
+from anomalies import AnomalyDetector, AnomalyEvent
+from archive import Archiver, ArchiveStore
+from alerts import Alert, AlertDispatcher, default_channels
+from rules import RuleEngine, RuleEvent
+from storage_policy import StorageFilter
+from timeseries import AGGREGATES, METHODS as DOWNSAMPLE_METHODS, align, downsample, format_ts
+from response_cache import LRUCache, ResponseCache, conditional_response, json_bytes, etag_for
 
 
 # auth helpers (added) - JWT functions
 from auth import (
     create_access_token,
     decode_token,
+    can_view_stadium,
     get_current_subject,
     is_admin,
+    require_admin,
     stadium_from_claims,
     verify_admin_password,
     verify_stadium_password,
@@ -44,45 +68,151 @@ RELAY_TO_STADIUM = {
     if "relay_id" in st
 }
 
+# Process role:
+#   all    - single process: MQTT ingest + API/WS (default)
+#   ingest - MQTT ingest, DB writes and status checks; serves the state bus
+#   api    - stateless API/WS worker fed by the state bus (safe with --workers N)
+ROLE = os.getenv("FOV_ROLE", "all").strip().lower()
+if ROLE not in ("all", "ingest", "api"):
+    raise ValueError(f"FOV_ROLE must be all, ingest or api (got {ROLE!r})")
+# api role: where the ingest process serves HTTP, for the writes only it can do (commands, ...)
+INGEST_URL = os.getenv("INGEST_URL", "http://127.0.0.1:8001").rstrip("/")
+INGEST_FORWARD_TIMEOUT_S = float(os.getenv("INGEST_FORWARD_TIMEOUT_S", "30"))
+
+ALERT_GRACE_S = int(os.getenv("RELAY_OFFLINE_GRACE_S", "90"))
+_last_relay_alert_state: dict[str, bool] = {}  # remember prior state to avoid spam
+alert_dispatcher = AlertDispatcher(default_channels())
+
+def on_rule_event(event: RuleEvent) -> None:
+    """Rule fired/cleared (MQTT thread): push to WS clients and the alert channel."""
+    schedule_notification(f"alert:{event.device}", event.to_dict(), stadium=event.stadium)
+    verb = "ALERT" if event.state == "fired" else "CLEARED"
+    alert_dispatcher.submit_threadsafe(Alert(
+        kind=f"rule_{event.state}",
+        label=f"device alerts {event.state}",
+        target=f"{event.stadium}/{event.device}",
+        subject=f"[FOV] {verb} {event.device}: {event.rule.source}",
+        body=(
+            f"Device {event.device} ({event.stadium or 'unknown stadium'}) "
+            f"{event.rule.metric}={event.value} - rule '{event.rule.source}' {event.state}."
+        ),
+    ))
+
 app = FastAPI()
 SessionFactory = init_db()
-device_manager = DeviceManager(SessionFactory)
+rule_engine = RuleEngine.from_env(on_event=on_rule_event)
+storage_filter = StorageFilter.from_env()
+device_manager = DeviceManager(SessionFactory, rule_engine=rule_engine, storage_filter=storage_filter)
 config = FOVDashboardConfig()
 relay_manager  = RelayManager()
 
-ALERT_GRACE_S = int(os.getenv("RELAY_OFFLINE_GRACE_S", "90"))
-_last_relay_alert_state: dict[str, bool] = {}  # remember prior state to avoid spam
+# Relay liveness as persisted up/down intervals; api workers follow the bus instead of writing
+relay_timeline = RelayTimeline(SessionFactory, persist=ROLE != "api")
+relay_manager.listeners.append(relay_timeline.record)
+RELAY_TIMELINE_LIMIT = 500      # intervals returned with ?timeline=true
+
+# --- fleet commands + OTA rollout tracking (see commands.py) ---
+COMMAND_TOPIC = os.getenv("COMMAND_TOPIC", "{region}/{stadium}/{device}/cmd/{command}")
+_stadium_clients: dict = {}   # stadium slug → connected IoT client, filled by start_iot_client
+
+def _command_topic(stadium: str, device: str, command: str) -> str:
+    region = STADIUMS.get(stadium, {}).get("region", "")
+    return COMMAND_TOPIC.format(region=region, stadium=stadium, device=device, command=command)
+
+def _publish_command(stadium: str, device: str, topic: str, payload: str):
+    client = _stadium_clients.get(stadium)
+    fut = client.publish(topic=topic, payload=payload, qos=1) if client else None
+    if fut is None:
+        raise ConnectionError(f"no connected IoT client for {stadium}")
+    return fut
+
+rollout_tracker = RolloutTracker()
+device_manager.listeners.append(rollout_tracker.observe)
+command_dispatcher = CommandDispatcher(_publish_command, _command_topic)
+
+def _on_command_dispatched(job: CommandJob) -> None:
+    if job.command == "ota":
+        rollout_tracker.mark_pending(job.targets)
+        # api workers keep their own tracker: tell them which devices are now pending
+        if state_bus_server:
+            pending: dict[str, dict[str, str]] = {}
+            for stadium, device in job.targets:
+                pending.setdefault(stadium, {})[device] = "pending"
+            for stadium, states in pending.items():
+                state_bus_server.publish(f"rollout:{stadium}", states, stadium)
+command_dispatcher.on_dispatched = _on_command_dispatched
+
+# Ingest appends to a write-ahead journal; one writer thread commits it to SQLite in batches
+# (attached at startup, ingest/all roles only; INGEST_JOURNAL=0 writes inline as before)
+ingest_journal = IngestJournal() if os.getenv("INGEST_JOURNAL", "1") != "0" and ROLE != "api" else None
+
+# Days older than ARCHIVE_HOT_DAYS move to compressed files; history reads merge them
+archive_store = ArchiveStore()
+device_manager.archive = archive_store
+archiver = Archiver(SessionFactory, archive_store)
+
+# Per-stadium online/battery/temperature/latency summary, kept up to date per change
+fleet_aggregates = FleetAggregates()
+device_manager.add_state_listener(fleet_aggregates.observe)
+SUMMARY_PUSH_S = float(os.getenv("SUMMARY_PUSH_S", "5"))
+
+# Streaming anomaly detection: O(1) per message here, peer comparison in run_anomaly_peers()
+def on_anomaly_event(event: AnomalyEvent) -> None:
+    schedule_notification(f"anomaly:{event.device}", event.to_dict(), stadium=event.stadium)
+
+anomaly_detector = AnomalyDetector(on_event=on_anomaly_event, on_score=device_manager.log_metric)
+device_manager.listeners.append(anomaly_detector.observe)
+
+# Match sessions (manual or inferred from activity) with a summary stored when they close
+session_manager = SessionManager(device_manager, STADIUMS, activity=fleet_aggregates.summary)
+MAX_SESSION_LIST = 500
+
+# Secondary indexes (stadium / online / battery band / firmware) for /api/devices/search
+device_index = DeviceIndex()
+device_manager.add_state_listener(device_index.observe)
+MAX_SEARCH_PAGE = 1000
+
+# Serialised REST bodies per (endpoint, scope), and immutable history pages
+response_cache = ResponseCache()
+history_cache = LRUCache(int(os.getenv("HISTORY_CACHE_SIZE", "512")))
+HISTORY_PAGE_CACHE_CONTROL = "private, max-age=86400"
+MAX_CHART_POINTS = 10_000
+MAX_ALIGNED_BINS = 10_000
+
+# Per-endpoint MQTT connect/subscribe progress, served by /api/ready
+ingest_readiness = IngestReadiness()
+# One handler thread per region, fed by the MQTT callbacks (see ingest_workers.py)
+ingest_workers = IngestWorkers()
+
+# Per-device / per-stadium token buckets in front of those queues (see ratelimit.py)
+def on_rate_flag(stadium: str, device: str, flagged: bool) -> None:
+    data = device_manager.set_flag(device, "rateLimited", flagged)
+    if data is not None:
+        schedule_notification(device, data, stadium=stadium)
+
+ingress_limiter = IngressLimiter.from_env(on_flag=on_rate_flag)
+
+def ingress_gate(topic: str, enqueue) -> None:
+    """region/stadium/device/metric (or .../latency/echo) → the device's and stadium's buckets."""
+    parts = topic.split('/')
+    if len(parts) < 4:
+        enqueue()       # the handler logs the bad topic
+        return
+    metric = "latency" if parts[-1] == "echo" else parts[-1]
+    ingress_limiter.submit(parts[1], parts[2], metric, enqueue)
+
+# On-demand profiling (admin). Nothing is sampled or wrapped until a profile runs.
+MAX_PROFILE_S = 300
+cpu_sampler = CPUSampler()
+alloc_tracker = AllocationTracker()
+stage_profiler = StageProfiler()
+stage_profiler.register(RegionWorker, "_call", "ingest", label=lambda _worker, handler, *a: handler.__name__)
+stage_profiler.register(device_manager, "update_device", "update_device")
+stage_profiler.register(WebSocketManager, "notify_clients", "notify_clients", is_async=True)
 
 # Global event loop reference for thread-safe task scheduling
 _main_loop: Optional[asyncio.AbstractEventLoop] = None
 
-def send_email(subject: str, body: str) -> None:
-    host = os.getenv("SMTP_HOST")
-    port = int(os.getenv("SMTP_PORT", "587"))
-    user = os.getenv("SMTP_USER")
-    pwd  = os.getenv("SMTP_PASS")
-    to   = os.getenv("ALERT_EMAIL_TO")
-    frm  = os.getenv("ALERT_EMAIL_FROM", user)
-
-    if not all([host, port, user, pwd, to]):
-        print("Email not sent: SMTP env not set"); return
-
-    try:
-        msg = EmailMessage()
-        msg["From"] = frm
-        msg["To"] = to
-        msg["Subject"] = subject
-        msg["Date"] = formatdate(localtime=True)
-        msg.set_content(body)
-
-        with smtplib.SMTP(host, port, timeout=20) as s:
-            s.starttls()
-            s.login(user, pwd)
-            s.send_message(msg)
-    except Exception as e:
-        print(f"Email send failed: {e}")
-
-
 # store send-timestamp per ping-id
 _pending_pings: dict[str, float] = {}
 PING_INTERVAL_S = 60          # one RTT measurement per minute
@@ -108,21 +238,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def initialize_iot_client_for_endpoint(endpoint: str) -> IOTClient:
-    """Create a client bound to a specific IoT endpoint."""
-    iot_context = IOTContext()
+def initialize_iot_client_for_endpoint(plan: EndpointPlan) -> IOTClient | IOTClient5:
+    """Create a client for one endpoint with its region's certs (all clients share one IOTContext)."""
+    bundle = config.credentials_for(plan.region or config.default_region)
+    missing = bundle.missing()
+    if missing:
+        raise FileNotFoundError(f"{bundle.region} certs missing: {', '.join(missing)}")
+    iot_context = IOTContext.shared()
     client_id = f"FOVDashboardClient-{uuid.uuid4()}"
-    print(f"Client ID: {client_id} (endpoint {endpoint})")
+    print(f"Client ID: {client_id} (endpoint {plan.endpoint}, {bundle.region}, MQTT{config.mqtt_version})")
     iot_credentials = IOTCredentials(
-        cert_path=config.cert_path,
+        cert_path=bundle.cert_path,
         client_id=client_id,
-        endpoint=endpoint,
-        priv_key_path=config.private_key_path,
-        ca_path=config.root_ca_path
+        endpoint=plan.endpoint,
+        priv_key_path=bundle.private_key_path,
+        ca_path=bundle.root_ca_path,
+        port=config.port,
     )
+    if config.mqtt_version == 5:
+        return IOTClient5(iot_context, iot_credentials)
     return IOTClient(iot_context, iot_credentials)
 
-def schedule_notification(device_name: str, device_data: dict, stadium: Optional[str] = None):
+def telemetry_filter(topic: str) -> str:
+    """
+    Shared-subscription form of a telemetry filter when configured.
+    Latency echoes and relay heartbeats are never shared: each instance
+    must see its own ping replies and every relay's liveness.
+    """
+    if config.mqtt_version == 5 and config.shared_group:
+        return f"$share/{config.shared_group}/{topic}"
+    return topic
+
+# --- multi-process state bus (see state_bus.py) ---
+state_bus_server: Optional[StateBusServer] = None
+_replica_alerts: dict[tuple, dict] = {}   # api role: active rule alerts seen on the bus
+_replica_anomalies: dict[tuple, dict] = {}   # api role: active anomalies seen on the bus
+
+def _bus_snapshot():
+    """Full current state as bus events, sent to each new API worker."""
+    for name, data in list(device_manager.devices.items()):
+        yield {"topic": name, "message": data, "stadium": data.get("stadium")}
+    for rid, st in list(relay_manager.relays.items()):
+        yield {"topic": f"relay:{rid}", "message": st, "stadium": st.get("stadium")}
+    for a in rule_engine.active():
+        yield {"topic": f"alert:{a['device']}", "message": {**a, "state": "fired"}, "stadium": a["stadium"]}
+    for a in anomaly_detector.active():
+        yield {"topic": f"anomaly:{a['device']}", "message": a, "stadium": a["stadium"]}
+    for stadium, states in rollout_tracker.states().items():
+        yield {"topic": f"rollout:{stadium}", "message": states, "stadium": stadium}
+
+def _reset_replica():
+    """api role, on every bus (re)connect: drop state the coming snapshot will rebuild."""
+    _replica_alerts.clear()
+    _replica_anomalies.clear()
+    rollout_tracker.reset()
+    # an ingest restart closed the open relay intervals in the DB; the snapshot reopens live ones
+    relay_timeline.resync()
+
+async def _apply_bus_event(event: dict):
+    """api role: update the local read replica, then fan out to our WS clients."""
+    topic, message, stadium = event["topic"], event["message"], event.get("stadium")
+    metric = event.get("metric")
+    if topic.startswith("rollout:"):
+        rollout_tracker.apply(stadium, message)     # bookkeeping only; no WS event
+        return
+    if topic.startswith("relay:"):
+        rid = topic.split(":", 1)[1]
+        # the bus carries last_seen as an ISO string; keep the replica's types the same as ingest's
+        try:
+            since = datetime.fromisoformat(str(message.get("last_seen")).replace("Z", ""))
+        except ValueError:
+            since = None
+        relay_manager.relays[rid] = {**message, "last_seen": since}
+        relay_manager.versions.bump(stadium)
+        relay_timeline.record(rid, stadium, bool(message.get("alive")), since)
+    elif topic.startswith("alert:"):
+        key = (stadium, message.get("device"), message.get("rule"))
+        if message.get("state") == "fired":
+            _replica_alerts[key] = {"stadium": stadium, "device": key[1], "rule": key[2]}
+        else:
+            _replica_alerts.pop(key, None)
+    elif topic.startswith("anomaly:"):
+        key = (stadium, message.get("device"), message.get("kind"))
+        if message.get("state") == "fired":
+            _replica_anomalies[key] = message
+        else:
+            _replica_anomalies.pop(key, None)
+    else:
+        device_manager.store_state(topic, message)
+        if metric == "ota":
+            # only a real ota report moves the rollout, as on ingest; other metrics carry the
+            # old otaStatus and would undo the "pending" a dispatch just published
+            rollout_tracker.observe(topic, stadium, metric, message.get("otaStatus"))
+    await notify_local(topic, message, stadium=stadium, metric=metric)
+
+state_bus_client = StateBusClient(_apply_bus_event, on_connect=_reset_replica)
+
+# Read-only SSE viewers share one ring of pre-serialised events (see sse.py)
+event_ring = EventRing()
+
+async def notify_local(topic: str, message: dict, stadium: Optional[str] = None, metric: Optional[str] = None):
+    """This process's viewers: subscribed WS clients and the SSE ring."""
+    event_ring.publish(topic, message, stadium)
+    await WebSocketManager.notify_clients(topic, message, stadium=stadium, metric=metric)
+
+async def broadcast(topic: str, message: dict, stadium: Optional[str] = None, metric: Optional[str] = None):
+    """Fan an event out to local WS/SSE clients and, in ingest role, to API workers."""
+    if state_bus_server:
+        state_bus_server.publish(topic, message, stadium, metric)
+    await notify_local(topic, message, stadium=stadium, metric=metric)
+
+def schedule_notification(
+    device_name: str,
+    device_data: dict,
+    stadium: Optional[str] = None,
+    metric: Optional[str] = None,
+):
     """
     Thread-safe wrapper to schedule async WebSocket notifications from MQTT threads.
     Uses asyncio.run_coroutine_threadsafe to avoid creating new event loops.
@@ -130,7 +361,7 @@ def schedule_notification(device_name: str, device_data: dict, stadium: Optional
     if _main_loop and not _main_loop.is_closed():
         # Schedule coroutine to run in main event loop
         asyncio.run_coroutine_threadsafe(
-            WebSocketManager.notify_clients(device_name, device_data, stadium=stadium),
+            broadcast(device_name, device_data, stadium=stadium, metric=metric),
             _main_loop
         )
     else:
@@ -152,10 +383,12 @@ def message_handler(topic, payload, *a, **kw):
         device_name = parts[2]
         metric_type = parts[-1]
 
-        device_data = device_manager.update_device(device_name, metric_type, stadium, message_str)
+        device_data = device_manager.update_device(
+            device_name, metric_type, stadium, message_str, received_at=kw.get("received_at")
+        )
 
         # Notify only relevant clients
-        schedule_notification(device_name, device_data, stadium=stadium)
+        schedule_notification(device_name, device_data, stadium=stadium, metric=metric_type)
 
     except Exception as e:
         print(f"Error handling message: {str(e)}")
@@ -197,13 +430,15 @@ def latency_echo_handler(topic, payload, *a, **kw):
             print(f"Unknown or stale ping ID: {ping_id}, ignoring")
             return
 
-        rtt_ms = (time.time() - _pending_pings.pop(ping_id)) * 1000.0
+        # measured at MQTT receipt, not after waiting in the region queue
+        received_at = kw.get("received_at") or time.time()
+        rtt_ms = (received_at - _pending_pings.pop(ping_id)) * 1000.0
         print(f"RTT {dev}: {rtt_ms:.1f} ms")
 
-        state = device_manager.update_device(dev, "latency", stadium, f"{rtt_ms:.2f}")
+        state = device_manager.update_device(dev, "latency", stadium, f"{rtt_ms:.2f}", received_at=received_at)
 
         # Fan-out only to that stadium (admins always receive)
-        schedule_notification(dev, state, stadium=stadium)
+        schedule_notification(dev, state, stadium=stadium, metric="latency")
 
     except Exception as exc:
         print(f"latency-echo handler failed: {exc}")
@@ -214,41 +449,58 @@ def latency_echo_handler(topic, payload, *a, **kw):
 def start_iot_client():
     """
     Start IoT Clients per unique endpoint, connect, and subscribe to per-stadium topics.
+    Endpoints connect concurrently and subscribe pipelined (see iot_bootstrap.py).
+    Each endpoint uses its region's certs, and its messages are handled on that
+    region's ingest worker so a slow region can't stall another.
     Also start a ping loop that publishes a latency ping per stadium.
     """
-    # Build/Connect one client per unique endpoint
-    clients_by_endpoint: dict[str, IOTClient] = {}
+    # Plan one client per unique endpoint
+    plans: dict[str, EndpointPlan] = {}
 
-    # Keep (client, ping_topic) per stadium for the ping loop
-    ping_targets: list[tuple[IOTClient, str]] = []
+    # Keep (endpoint, ping_topic) per stadium for the ping loop
+    ping_plan: list[tuple[str, str]] = []
+    endpoint_by_stadium: dict[str, str] = {}
 
     for slug, st in STADIUMS.items():
         ep = (st.get("iot_endpoint") or "").strip()
         endpoint = ep if (".iot." in ep and ep.endswith(".amazonaws.com")) else config.endpoint
-        if endpoint not in clients_by_endpoint:
-            c = initialize_iot_client_for_endpoint(endpoint)
-            c.connect()
-            clients_by_endpoint[endpoint] = c
-        client = clients_by_endpoint[endpoint]
+        plan = plans.setdefault(endpoint, EndpointPlan(endpoint, region=st["region"]))
+        endpoint_by_stadium[slug] = endpoint
+        gate = ingress_gate if ingress_limiter.enabled else None
+        on_telemetry = ingest_workers.wrap(plan.region, message_handler, gate=gate)
+        on_echo = ingest_workers.wrap(plan.region, latency_echo_handler, gate=gate)
 
         # Derive base from topic_prefix, default to region/slug/+
         base = st.get("topic_prefix") or f"{st['region']}/{slug}/+"
 
         # Subscriptions
-        client.subscribe(topic=f"{base}/version",       handler=message_handler)
-        client.subscribe(topic=f"{base}/battery",       handler=message_handler)
-        client.subscribe(topic=f"{base}/temperature",   handler=message_handler)
-        client.subscribe(topic=f"{base}/ota",           handler=message_handler)
-        client.subscribe(topic=f"{base}/latency/echo",  handler=latency_echo_handler)
+        plan.subscriptions += [
+            (telemetry_filter(f"{base}/version"),      on_telemetry),
+            (telemetry_filter(f"{base}/battery"),      on_telemetry),
+            (telemetry_filter(f"{base}/temperature"),  on_telemetry),
+            (telemetry_filter(f"{base}/ota"),          on_telemetry),
+            (f"{base}/latency/echo",                   on_echo),
+        ]
 
         # Ping topic: remove trailing '/+' from base and append /latency/ping
         base_no_plus = base[:-2] if base.endswith("/+") else base
-        ping_topic = f"{base_no_plus}/latency/ping"
-        ping_targets.append((client, ping_topic))
+        ping_plan.append((endpoint, f"{base_no_plus}/latency/ping"))
 
     # Relay heartbeat — subscribe on every client (cheap & safe)
-    for client in clients_by_endpoint.values():
-        client.subscribe(topic="fov/relay/+/heartbeat", handler=relay_handler)
+    for plan in plans.values():
+        plan.subscriptions.append((config.relay_topic, ingest_workers.wrap(plan.region, relay_handler)))
+
+    clients_by_endpoint = bootstrap_iot(list(plans.values()), initialize_iot_client_for_endpoint, ingest_readiness)
+    _stadium_clients.update({
+        slug: clients_by_endpoint[ep]
+        for slug, ep in endpoint_by_stadium.items()
+        if ep in clients_by_endpoint
+    })
+    ping_targets = [
+        (clients_by_endpoint[endpoint], topic)
+        for endpoint, topic in ping_plan
+        if endpoint in clients_by_endpoint
+    ]
 
     # latency — publish one ping per stadium every minute
     def ping_loop() -> None:
@@ -272,43 +524,53 @@ def relay_handler(topic, payload, *a, **kw):
         rid  = topic.split('/')[2]              # fov/relay/<id>/heartbeat
         pkt  = json.loads(payload.decode())
         stadium = RELAY_TO_STADIUM.get(rid)
-        relay_manager.upsert(rid, pkt)
-        relay_manager.relays[rid]["stadium"] = stadium  # tag for filtering
+        relay_manager.upsert(rid, pkt, stadium=stadium)
         schedule_notification(f"relay:{rid}", relay_manager.relays[rid], stadium=stadium)
     except (json.JSONDecodeError, IndexError) as e:
         print(f"relay_handler error on topic '{topic}': {e}")
     except Exception as e:
         print(f"relay_handler unexpected error: {e}")
 
-@app.get("/api/status")
-async def status():
-    """Return system status information for debugging"""
-    import psutil
-
-    # Check if certificates exist
-    cert_files = {
-        "cert_path": os.path.exists(config.cert_path),
-        "private_key_path": os.path.exists(config.private_key_path),
-        "root_ca_path": os.path.exists(config.root_ca_path)
-    }
-    
-    # Get system information
-    mem = psutil.virtual_memory()
-    
+def _status_fields() -> dict:
+    """App-level part of /api/status; refreshed by the sampler, not per request."""
     return {
-        "status": "online",
-        "certificates": cert_files,
+        "certificates": {
+            region: {"ok": not bundle.missing(), "missing": bundle.missing()}
+            for region, bundle in (
+                (r, config.credentials_for(r))
+                for r in sorted({st["region"] for st in STADIUMS.values()} | {config.default_region})
+            )
+        },
+        "ingest": ingest_workers.stats(),
+        "rate_limits": ingress_limiter.stats() if ingress_limiter.enabled else None,
         "device_count": len(device_manager.devices),
         "websocket_connections": len(WebSocketManager.clients),
-        "system": {
-            "cpu_percent": psutil.cpu_percent(),
-            "memory_used_percent": mem.percent,
-            "memory_available_mb": mem.available / (1024 * 1024)
+        "sse": event_ring.status(),
+        "relays": {
+            rid: {"alive": st.get("alive"), "stadium": st.get("stadium"), "last_seen": st.get("last_seen")}
+            for rid, st in relay_manager.relays.items()
         },
-        "server_time": datetime.utcnow().isoformat(),
-        "relays": relay_manager.relays,
+        "role": ROLE,
+        "state_bus": (
+            {"subscribers": state_bus_server.subscribers, **state_bus_server.stats} if state_bus_server
+            else {"connected": state_bus_client.connected} if ROLE == "api"
+            else None
+        ),
+        "loop": loop_monitor.snapshot(),
+        "alerts": alert_dispatcher.stats,
+        "storage": storage_filter.stats(),
+        "archive": {"hot_days": archiver.hot_days, "boundary": archive_store.boundary, **archiver.stats},
+        "journal": ingest_journal.status() if device_manager.journal else None,
     }
 
+loop_monitor = LoopLagMonitor()
+status_sampler = ProcessSampler(_status_fields)
+
+@app.get("/api/status")
+async def status():
+    """Return system status information for debugging (sampled every few seconds)"""
+    return Response(content=status_sampler.body, media_type="application/json")
+
 # --- AUTH: minimal login route (added) ---
 class LoginBody(BaseModel):
     username: str   # "admin" or stadium slug, e.g. "aviva"
@@ -333,16 +595,26 @@ async def login(body: LoginBody):
 def health():
     return {"status": "ok"}
 
+# --- readiness (public): 200 once ingest is live, 503 until then ---
+@app.get("/api/ready")
+def ready():
+    if ROLE == "api":
+        body = {"ready": state_bus_client.connected, "role": ROLE, "state_bus": {"connected": state_bus_client.connected}}
+    else:
+        body = {**ingest_readiness.snapshot(), "role": ROLE}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
 # --- meta: stadium names for UI labels (NEW, optional) ---
 @app.get("/api/meta/stadiums")
-def meta_stadiums():
-    return {
+def meta_stadiums(request: Request):
+    # STADIUMS is static for the life of the process → version 0 forever
+    return response_cache.respond(request, ("meta_stadiums",), 0, lambda: {
         slug: {
             "name": st.get("name", slug),
             "relay_id": st.get("relay_id"),
         }
         for slug, st in STADIUMS.items()
-    }
+    })
 
 # --- WebSocket: REQUIRE JWT via ?token=... and filter initial state (changed) ---
 @app.websocket("/ws")
@@ -364,9 +636,10 @@ async def websocket_endpoint(websocket: WebSocket):
 
     stadium = stadium_from_claims(claims)   # str or None
     admin   = is_admin(claims)              # bool
+    encoding = negotiate_ws_encoding(websocket.query_params.get("encoding"))
 
     try:
-        await WebSocketManager.connect(websocket, stadium=stadium, is_admin=admin)
+        await WebSocketManager.connect(websocket, stadium=stadium, is_admin=admin, encoding=encoding)
 
         # Initial device state (filtered)
         if admin:
@@ -379,7 +652,7 @@ async def websocket_endpoint(websocket: WebSocket):
             ]
         for device_name, device_data in initial_devices:
             try:
-                await websocket.send_json({"topic": device_name, "message": jsonable_encoder(device_data)})
+                await WebSocketManager.send(websocket, device_name, device_data)
             except Exception as e:
                 print(f"Error sending initial device data: {e}")
 
@@ -394,7 +667,7 @@ async def websocket_endpoint(websocket: WebSocket):
             ]
         for rid, state in initial_relays:
             try:
-                await websocket.send_json({"topic": f"relay:{rid}", "message": jsonable_encoder(state)})
+                await WebSocketManager.send(websocket, f"relay:{rid}", state)
             except Exception as e:
                 print(f"Error sending initial relay data: {e}")
 
@@ -402,7 +675,9 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             try:
                 data = await asyncio.wait_for(websocket.receive_text(), timeout=60)
-                await websocket.send_text("pong")
+                # subscribe/unsubscribe ops (see WebSocketManager.handle_message); anything else is keepalive
+                if not await WebSocketManager.handle_message(websocket, data):
+                    await websocket.send_text("pong")
             except asyncio.TimeoutError:
                 try:
                     await websocket.send_text("ping")
@@ -417,53 +692,358 @@ async def websocket_endpoint(websocket: WebSocket):
         await WebSocketManager.disconnect(websocket)
         print("WebSocket connection closed")
 
+# --- SSE for read-only displays (same events as /ws, plain HTTP) ---
+@app.get("/api/events")
+async def event_stream(request: Request, stadium: Optional[str] = None, lastEventId: Optional[str] = None):
+    """
+    text/event-stream of `{"topic", "message"}` events, scoped by JWT like /ws.
+    EventSource can't send headers, so the token may come as ?token= (or the
+    Authorization header / access_token cookie). Resumes after Last-Event-ID
+    (header, or ?lastEventId=); admins may narrow to one ?stadium=.
+    """
+    auth = request.headers.get("authorization", "")
+    token = (
+        request.query_params.get("token")
+        or (auth[7:] if auth.lower().startswith("bearer ") else None)
+        or request.cookies.get("access_token")
+    )
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    claims = decode_token(token)
+    if stadium is not None and not can_view_stadium(claims, stadium):
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    scope = stadium if is_admin(claims) else stadium_from_claims(claims)
+
+    def visible(st: Optional[str]) -> bool:
+        return st == scope if scope is not None else is_admin(claims)
+
+    def snapshot():
+        for name, data in list(device_manager.devices.items()):
+            if visible(data.get("stadium")):
+                yield name, data
+        for rid, st in list(relay_manager.relays.items()):
+            if visible(st.get("stadium")):
+                yield f"relay:{rid}", st
+
+    return StreamingResponse(
+        event_ring.stream(visible, snapshot, request.headers.get("last-event-id") or lastEventId),
+        media_type="text/event-stream",
+        # no caching, and no proxy buffering (nginx honours X-Accel-Buffering)
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- Protected REST: filter by stadium (changed) ---
 @app.get("/api/devices")
-async def get_devices(claims: dict = Depends(get_current_subject)):
+async def get_devices(request: Request, claims: dict = Depends(get_current_subject)):
     """Get current state, scoped by JWT (admin sees all)."""
     if is_admin(claims):
-        return device_manager.devices
+        return response_cache.respond(
+            request, ("devices", None), device_manager.versions.get(),
+            lambda: device_manager.devices,
+        )
     st = stadium_from_claims(claims)
+    return response_cache.respond(
+        request, ("devices", st), device_manager.versions.get(st),
+        lambda: {
+            name: data
+            for name, data in device_manager.devices.items()
+            if data.get("stadium") == st
+        },
+    )
+
+def _csv(value: Optional[str]) -> Optional[list[str]]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+@app.get("/api/devices/search")
+async def search_devices(
+    stadium: Optional[str] = None,
+    online: Optional[bool] = None,
+    battery: Optional[str] = None,        # comma-separated bands: critical,low,ok,high,unknown
+    firmware: Optional[str] = None,       # comma-separated versions
+    prefix: Optional[str] = None,         # device name prefix
+    sort: str = "name",                   # '-' prefix for descending
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,         # e.g. name,batteryCharge
+    claims: dict = Depends(get_current_subject),
+):
+    """
+    Filtered, sorted, cursor-paged device listing off the in-memory indexes.
+    Pass `nextCursor` back as `cursor` for the next page.
+    """
+    if not is_admin(claims):
+        own = stadium_from_claims(claims)
+        if stadium and stadium != own:
+            raise HTTPException(status_code=404, detail="Stadium not found")
+        stadium = own
+    if not 1 <= limit <= MAX_SEARCH_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be 1..{MAX_SEARCH_PAGE}")
+    try:
+        return device_index.search(
+            stadium=stadium,
+            online=online,
+            battery=_csv(battery),
+            firmware=_csv(firmware),
+            prefix=prefix,
+            sort=sort,
+            limit=limit,
+            cursor=cursor,
+            fields=_csv(fields),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _relay_view(relays) -> dict:
     return {
-        name: data
-        for name, data in device_manager.devices.items()
-        if data.get("stadium") == st
+        rid: {
+            **st,
+            "last_seen": st["last_seen"].isoformat() + "Z" if isinstance(st["last_seen"], datetime) else st["last_seen"]
+        }
+        for rid, st in relays
     }
 
 @app.get("/api/relays")
-async def get_relays(claims: dict = Depends(get_current_subject)):
+async def get_relays(request: Request, claims: dict = Depends(get_current_subject)):
     """
     Return the in-memory relay state so the UI can show it
     without waiting for the next heartbeat.
     """
     if is_admin(claims):
-        return {
-            rid: {
-                **st,
-                "last_seen": st["last_seen"].isoformat() + "Z" if isinstance(st["last_seen"], datetime) else st["last_seen"]
-            }
-            for rid, st in relay_manager.relays.items()
-        }
+        return response_cache.respond(
+            request, ("relays", None), relay_manager.versions.get(),
+            lambda: _relay_view(relay_manager.relays.items()),
+        )
     st_slug = stadium_from_claims(claims)
-    return {
-        rid: {
-            **st,
-            "last_seen": st["last_seen"].isoformat() + "Z" if isinstance(st["last_seen"], datetime) else st["last_seen"]
-        }
-        for rid, st in relay_manager.relays.items()
-        if st.get("stadium") == st_slug  # will include nothing until you tag relays
-    }
+    return response_cache.respond(
+        request, ("relays", st_slug), relay_manager.versions.get(st_slug),
+        lambda: _relay_view(
+            (rid, st) for rid, st in relay_manager.relays.items()
+            if st.get("stadium") == st_slug
+        ),
+    )
+
+@app.get("/api/relays/{rid}/sla")
+async def get_relay_sla(
+    rid: str,
+    hours: float = 24,
+    timeline: bool = False,
+    claims: dict = Depends(get_current_subject),
+):
+    """
+    Uptime %, outage count and MTTR for a relay over the last `hours`.
+    `timeline=true` adds the up/down intervals in that window.
+    """
+    if not is_admin(claims) and relay_timeline.stadium_of(rid) != stadium_from_claims(claims):
+        raise HTTPException(status_code=404, detail="Relay not found")
+    if hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+    report = relay_timeline.sla(
+        rid,
+        datetime.utcnow() - timedelta(hours=hours),
+        timeline_limit=RELAY_TIMELINE_LIMIT if timeline else 0,
+    )
+    if report is None:
+        raise HTTPException(status_code=404, detail="Relay not found")
+    return report
+
+@app.get("/api/alerts/active")
+async def get_active_alerts(claims: dict = Depends(get_current_subject)):
+    """Currently firing device rules, scoped by JWT."""
+    active = list(_replica_alerts.values()) if ROLE == "api" else rule_engine.active()
+    if is_admin(claims):
+        return active
+    st = stadium_from_claims(claims)
+    return [a for a in active if a["stadium"] == st]
+
+@app.get("/api/anomalies/active")
+async def get_active_anomalies(claims: dict = Depends(get_current_subject)):
+    """Anomalies currently firing (spikes, trends, peer outliers), scoped by JWT."""
+    active = list(_replica_anomalies.values()) if ROLE == "api" else anomaly_detector.active()
+    if is_admin(claims):
+        return active
+    st = stadium_from_claims(claims)
+    return [a for a in active if a["stadium"] == st]
+
+# --- fleet commands (admin) ---
+class CommandBody(BaseModel):
+    command: str                          # e.g. "ota"
+    payload: dict = {}                    # merged into the published JSON
+    stadium: Optional[str] = None         # all devices of this stadium ...
+    devices: Optional[list[str]] = None   # ... or an explicit list (narrowed by stadium if both)
+    wave_size: int = 25
+    concurrency: int = 10
+
+async def forward_to_ingest(request: Request) -> Response:
+    """api role: replay this request against the ingest process and return its response as-is."""
+    body = await request.body()
+    url = INGEST_URL + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    headers = {k: request.headers[k] for k in ("authorization", "cookie", "content-type") if k in request.headers}
+
+    def _send():
+        req = urllib.request.Request(url, data=body or None, method=request.method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=INGEST_FORWARD_TIMEOUT_S) as r:
+                return r.status, r.read(), r.headers.get("content-type")
+        except urllib.error.HTTPError as e:       # 4xx/5xx from ingest: pass it on
+            return e.code, e.read(), e.headers.get("content-type")
+
+    try:
+        status, content, media_type = await asyncio.to_thread(_send)
+    except OSError as e:
+        raise HTTPException(status_code=502, detail=f"Ingest process not reachable at {INGEST_URL}: {e}")
+    return Response(content=content, status_code=status, media_type=media_type or "application/json")
+
+# Jobs live in the ingest process (it owns MQTT); api workers forward these to it
+@app.post("/api/commands")
+async def create_command(request: Request, body: CommandBody, claims: dict = Depends(require_admin)):
+    if ROLE == "api":
+        return await forward_to_ingest(request)
+    if body.stadium and body.stadium not in STADIUMS:
+        raise HTTPException(status_code=404, detail="Unknown stadium")
+    wanted = set(body.devices) if body.devices else None
+    targets = [
+        (data["stadium"], name)
+        for name, data in device_manager.devices.items()
+        if data.get("stadium")
+        and (body.stadium is None or data["stadium"] == body.stadium)
+        and (wanted is None or name in wanted)
+    ]
+    if not targets:
+        raise HTTPException(status_code=400, detail="No matching devices")
+    job = command_dispatcher.submit(
+        body.command, body.payload, targets,
+        wave_size=body.wave_size, concurrency=body.concurrency,
+    )
+    return job.summary()
+
+@app.get("/api/commands")
+async def list_commands(request: Request, claims: dict = Depends(require_admin)):
+    if ROLE == "api":
+        return await forward_to_ingest(request)
+    return [job.summary() for job in reversed(command_dispatcher.jobs.values())]
+
+@app.get("/api/commands/{job_id}")
+async def get_command(request: Request, job_id: str, claims: dict = Depends(require_admin)):
+    if ROLE == "api":
+        return await forward_to_ingest(request)
+    job = command_dispatcher.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job.summary(), "results": job.results}
+
+@app.get("/api/stadiums/{slug}/rollout")
+async def get_rollout(slug: str, claims: dict = Depends(get_current_subject)):
+    """OTA rollout progress for a stadium, maintained incrementally from `ota` metrics."""
+    if not can_view_stadium(claims, slug):
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    return rollout_tracker.summary(slug)
+
+@app.get("/api/stadiums/{slug}/summary")
+async def get_stadium_summary(slug: str, claims: dict = Depends(get_current_subject)):
+    """Fleet summary for a stadium (online %, battery, temperature, latency percentiles)."""
+    if not can_view_stadium(claims, slug):
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    return fleet_aggregates.summary(slug)
+
+@app.get("/api/stadiums/{slug}/sla")
+async def get_stadium_sla(slug: str, hours: float = 24, claims: dict = Depends(get_current_subject)):
+    """Relay uptime for a stadium over the last `hours`: totals plus one entry per relay."""
+    if not can_view_stadium(claims, slug):
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    if hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+    return relay_timeline.stadium_sla(slug, datetime.utcnow() - timedelta(hours=hours))
+
+# --- match sessions ---
+class SessionBody(BaseModel):
+    stadium: str
+    label: Optional[str] = None
+    start: Optional[datetime] = None      # default: now
+    end: Optional[datetime] = None        # given → closed and summarized right away
+
+class SessionCloseBody(BaseModel):
+    end: Optional[datetime] = None        # default: now
+
+def _naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is not None:
+        dt = (dt - dt.utcoffset()).replace(tzinfo=None)
+    return dt
+
+def _session_or_404(session_id: int, claims: dict) -> dict:
+    s = session_manager.get(session_id)
+    if s is None or not can_view_stadium(claims, s["stadium"]):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return s
+
+# Sessions are opened/closed by the ingest process: only it knows when its journal has
+# committed the window's last rows, so api workers forward these writes to it
+@app.post("/api/sessions")
+async def create_session(request: Request, body: SessionBody, claims: dict = Depends(get_current_subject)):
+    """Declare a match: open now (or at `start`), or a past one with both `start` and `end`."""
+    if ROLE == "api":
+        return await forward_to_ingest(request)
+    if body.stadium not in STADIUMS or not can_view_stadium(claims, body.stadium):
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    try:
+        return await asyncio.to_thread(
+            session_manager.open, body.stadium, body.label, _naive_utc(body.start), _naive_utc(body.end),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/sessions/{session_id}/close")
+async def close_session(
+    request: Request,
+    session_id: int,
+    body: Optional[SessionCloseBody] = None,
+    claims: dict = Depends(get_current_subject),
+):
+    """Close an open session; its summary is computed once, here."""
+    if ROLE == "api":
+        return await forward_to_ingest(request)
+    _session_or_404(session_id, claims)
+    try:
+        return await asyncio.to_thread(session_manager.close, session_id, _naive_utc(body.end) if body else None)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: int, claims: dict = Depends(get_current_subject)):
+    """A session and its stored report (one primary-key read)."""
+    return _session_or_404(session_id, claims)
+
+@app.get("/api/stadiums/{slug}/sessions")
+async def list_sessions(
+    slug: str,
+    limit: int = 50,
+    before: Optional[datetime] = None,
+    claims: dict = Depends(get_current_subject),
+):
+    """Sessions of a stadium, newest first, without their reports; page with `before` = last start."""
+    if not can_view_stadium(claims, slug):
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    return session_manager.recent(slug, limit=max(1, min(limit, MAX_SESSION_LIST)), before=_naive_utc(before))
 
 @app.get("/api/device/{device_name}/history")
 async def get_device_history(
+    request: Request,
     device_name: str,
     metric_type: Optional[str] = None,
     hours: Optional[int] = 24,
     last_id: Optional[int] = None,
     page_size: int = 50,
+    max_points: Optional[int] = None,
+    method: str = "lttb",
     claims: dict = Depends(get_current_subject),   # added
 ):
-    """Get historical logs for a device with pagination"""
+    """
+    Get historical logs for a device with pagination.
+
+    With `max_points` (and `metric_type`) returns the whole time range as a
+    chart series downsampled to at most that many points instead of a page.
+    """
     # Authorization guard (prevents cross-stadium access)
     if not is_admin(claims):
         st = stadium_from_claims(claims)
@@ -471,23 +1051,178 @@ async def get_device_history(
         if not dev or dev.get("stadium") != st:
             raise HTTPException(status_code=404, detail="Device not found")
 
+    if max_points is not None:
+        if not metric_type:
+            raise HTTPException(status_code=400, detail="max_points needs metric_type")
+        if max_points < 3 or max_points > MAX_CHART_POINTS:
+            raise HTTPException(status_code=400, detail=f"max_points must be 3..{MAX_CHART_POINTS}")
+        if method not in DOWNSAMPLE_METHODS:
+            raise HTTPException(status_code=400, detail=f"method must be one of {DOWNSAMPLE_METHODS}")
+
     try:
         start_time = datetime.utcnow() - timedelta(hours=hours) if hours else None
-        logs, has_more = device_manager.get_device_history(
-            device_name,
-            metric_type=metric_type,
-            start_time=start_time,
-            page_size=page_size,
-            last_id=last_id
-        )
-        return {
+
+        if max_points is not None:
+            def _series() -> dict:
+                x, y = device_manager.get_device_series(device_name, metric_type, start_time=start_time)
+                keep = downsample(x, y, max_points, method)
+                return {
+                    "metric": metric_type,
+                    "method": method,
+                    "rawPoints": int(len(x)),
+                    "points": [
+                        {"ts": ts, "value": float(v)}
+                        for ts, v in zip(format_ts(x[keep]), y[keep])
+                    ],
+                }
+            # whole-range scan + parse + archive read: off the loop, or every WS/SSE client stalls
+            return await asyncio.to_thread(_series)
+
+        if last_id is None:
+            # First page can still grow - always query
+            logs, has_more = device_manager.get_device_history(
+                device_name,
+                metric_type=metric_type,
+                start_time=start_time,
+                page_size=page_size,
+                last_id=last_id
+            )
+            return {
+                "logs": logs,
+                "hasMore": has_more,
+                "lastId": logs[-1]['id'] if logs else None
+            }
+
+        # Rows below an id the client already holds never change, so the
+        # page is fetched once without the time bound and filtered here.
+        key = (device_name, metric_type, last_id, page_size)
+        rows = history_cache.get(key)
+        if rows is None:
+            rows, _ = device_manager.get_device_history(
+                device_name, metric_type=metric_type, page_size=page_size, last_id=last_id
+            )
+            history_cache.put(key, rows)
+        if start_time:
+            cutoff = start_time.isoformat(sep=" ")
+            logs = [r for r in rows if str(r["ts"]) >= cutoff]
+        else:
+            logs = rows
+        body = json_bytes({
             "logs": logs,
-            "hasMore": has_more,
+            "hasMore": len(logs) == page_size,
             "lastId": logs[-1]['id'] if logs else None
-        }
+        })
+        return conditional_response(request, body, etag_for(body), HISTORY_PAGE_CACHE_CONTROL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/series/aligned")
+async def get_aligned_series(
+    metric_type: str,
+    stadium: Optional[str] = None,
+    devices: Optional[str] = None,        # comma-separated device names
+    hours: int = 24,
+    step: int = 300,                      # seconds per row
+    agg: str = "mean",
+    claims: dict = Depends(get_current_subject),
+):
+    """
+    One metric for many devices on a shared time grid: `timestamps` × `devices`
+    matrix in `values` (null where a device sent nothing in that step).
+    One DB query, resampled with NumPy.
+    """
+    if not is_admin(claims):
+        own = stadium_from_claims(claims)
+        if stadium and stadium != own:
+            raise HTTPException(status_code=404, detail="Stadium not found")
+        stadium = own                     # device lists are confined to the caller's stadium
+    # each name once: a repeated name would come back as a second, identical column
+    names = list(dict.fromkeys(d.strip() for d in devices.split(",") if d.strip())) if devices else None
+    if not stadium and not names:
+        raise HTTPException(status_code=400, detail="stadium or devices is required")
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"agg must be one of {AGGREGATES}")
+    if step <= 0 or hours <= 0:
+        raise HTTPException(status_code=400, detail="step and hours must be positive")
+
+    end = time.time()
+    start = (end - hours * 3600) // step * step     # grid aligned to multiples of step
+    n_bins = int(np.ceil((end - start) / step))
+    if n_bins > MAX_ALIGNED_BINS:
+        raise HTTPException(status_code=400, detail=f"hours/step gives {n_bins} rows (max {MAX_ALIGNED_BINS})")
+
+    def _aligned() -> dict:
+        columns, x, y, col = device_manager.get_metric_samples(
+            metric_type,
+            datetime.utcfromtimestamp(start),
+            datetime.utcfromtimestamp(end),
+            stadium=stadium,
+            device_names=names,
+        )
+        matrix = align(x, y, col, len(columns), start, step, n_bins, agg)
+        return {
+            "metric": metric_type,
+            "agg": agg,
+            "step": step,
+            "timestamps": format_ts(start + step * np.arange(n_bins)),
+            "devices": columns,
+            "values": np.where(np.isnan(matrix), None, np.round(matrix, 3)).tolist(),
+        }
+    # multi-device scan, archive decompression and alignment: keep them off the event loop
+    return await asyncio.to_thread(_aligned)
+
+# --- profiling (admin only; folded output loads in speedscope / flamegraph.pl) ---
+def _profile_window(seconds: float) -> None:
+    if not 0 < seconds <= MAX_PROFILE_S:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_S}]")
+
+@app.get("/api/admin/profile/cpu")
+async def profile_cpu(
+    seconds: float = 10,
+    hz: float = 100,
+    thread: Optional[str] = None,      # only threads whose name contains this, e.g. "ingest-"
+    mode: str = "cpu",                 # cpu: weighted by thread CPU time; wall: every thread, idle or not
+    format: str = "folded",
+    claims: dict = Depends(require_admin),
+):
+    """Sample every thread's stack for `seconds`."""
+    _profile_window(seconds)
+    if not 1 <= hz <= 1000:
+        raise HTTPException(status_code=400, detail="hz must be 1..1000")
+    if mode not in ("cpu", "wall"):
+        raise HTTPException(status_code=400, detail="mode must be cpu or wall")
+    try:
+        folded, summary = await asyncio.to_thread(cpu_sampler.run, seconds, hz, thread, mode)
+    except Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {**summary, "folded": folded}
+    return PlainTextResponse(folded)
+
+@app.get("/api/admin/profile/stages")
+async def profile_stages(seconds: float = 10, format: str = "json", claims: dict = Depends(require_admin)):
+    """Wall-clock per stage: ingest handler → update_device, and notify_clients."""
+    _profile_window(seconds)
+    try:
+        await stage_profiler.run(seconds)
+    except Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "folded":
+        return PlainTextResponse(stage_profiler.folded())
+    return {"seconds": seconds, "stages": stage_profiler.stats()}
+
+@app.get("/api/admin/profile/alloc")
+async def profile_alloc(seconds: float = 10, format: str = "folded", claims: dict = Depends(require_admin)):
+    """tracemalloc for `seconds`; stacks weighted by net bytes allocated in the window."""
+    _profile_window(seconds)
+    try:
+        folded, summary = await alloc_tracker.run(seconds)
+    except Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {**summary, "folded": folded}
+    return PlainTextResponse(folded)
+
 async def check_system_status():
     """Periodic task to update device WiFi status *and* relay liveness"""
     while True:
@@ -495,10 +1230,14 @@ async def check_system_status():
         changed = device_manager.check_wifi_status()
         for name in changed:
             st = device_manager.devices[name].get("stadium")
-            await WebSocketManager.notify_clients(name, device_manager.devices[name], stadium=st)
+            await broadcast(name, device_manager.devices[name], stadium=st)
+        # `for` rules whose device went quiet while pending (e.g. stuck OTA)
+        rule_engine.check_deadlines()
 
         # --- relays  ----------------------------------------------------
-        relay_manager.refresh()
+        # both can write relay_intervals rows (state changes, checkpoints): off the loop
+        await asyncio.to_thread(relay_manager.refresh)
+        await asyncio.to_thread(relay_timeline.checkpoint)
         now = datetime.utcnow()
 
         for rid, st in relay_manager.relays.items():
@@ -519,32 +1258,90 @@ async def check_system_status():
             elif prev != alive:
                 _last_relay_alert_state[rid] = alive
                 if not alive:
-                    send_email(
+                    alert_dispatcher.submit(Alert(
+                        kind="relay_offline",
+                        label="relays offline",
+                        target=f"relay:{rid}",
                         subject=f"[FOV] Relay {rid} OFFLINE",
                         body=(
                             f"Relay {rid} has been offline for >{ALERT_GRACE_S}s.\n"
                             f"Last seen: {(last_seen.isoformat() + 'Z') if last_seen else 'unknown'}"
                         )
-                    )
+                    ))
                 else:
-                    send_email(
+                    alert_dispatcher.submit(Alert(
+                        kind="relay_recovered",
+                        label="relays recovered",
+                        target=f"relay:{rid}",
                         subject=f"[FOV] Relay {rid} RECOVERED",
                         body=f"Relay {rid} heartbeat recovered at {now.isoformat()}Z"
-                    )
+                    ))
 
             # existing WS fan-out (kept)
             if not st.get("_sent") or st["_sent"] != st["alive"]:
-                await WebSocketManager.notify_clients(f"relay:{rid}", st, stadium=st.get("stadium"))
+                await broadcast(f"relay:{rid}", st, stadium=st.get("stadium"))
                 st["_sent"] = st["alive"]
 
 
         await asyncio.sleep(30)
 
+async def run_anomaly_peers():
+    """Peer comparison per stadium (NumPy, off the loop); events go out via on_anomaly_event."""
+    while True:
+        await asyncio.sleep(anomaly_detector.peer_interval_s)
+        try:
+            await asyncio.to_thread(anomaly_detector.run_peers)
+        except Exception as e:
+            print(f"Anomaly peer run failed: {e}")
+
+async def run_session_inference():
+    """Open/close inferred match sessions from stadium activity; summarize closed ones."""
+    while True:
+        await asyncio.sleep(session_manager.tick_s)
+        try:
+            await asyncio.to_thread(session_manager.infer)
+        except Exception as e:
+            print(f"Session inference failed: {e}")
+
+async def push_summaries():
+    """Send `summary:<slug>` to this process's WS/SSE clients for stadiums that changed."""
+    while True:
+        await asyncio.sleep(SUMMARY_PUSH_S)
+        for slug in fleet_aggregates.take_dirty():
+            if slug:
+                await notify_local(f"summary:{slug}", fleet_aggregates.summary(slug), stadium=slug)
+
 @app.on_event("startup")
 async def startup_event():
-    global _main_loop
+    global _main_loop, state_bus_server
     _main_loop = asyncio.get_running_loop()
 
+    # Loop-lag probe + background status sampler (every role)
+    loop_monitor.start()
+    status_sampler.start()
+    # Each process pushes summaries to its own WS clients (api workers keep their own aggregates)
+    asyncio.create_task(push_summaries())
+
+    if ROLE == "api":
+        # No MQTT, no DB writes: state arrives from the ingest process
+        state_bus_client.start()
+        return
+
+    if ROLE == "ingest":
+        state_bus_server = StateBusServer(_bus_snapshot)
+        await state_bus_server.start()
+
+    # Alert worker must be running before anything can raise alerts
+    alert_dispatcher.start()
+
+    # Replay journaled-but-uncommitted messages before new ones arrive
+    if ingest_journal:
+        device_manager.attach_journal(ingest_journal)
+
+    # Releases collapsed messages and expires rate-limit flags
+    if ingress_limiter.enabled:
+        ingress_limiter.start()
+
     # Start IoT clients (per endpoint) in a background thread
     iot_thread = Thread(target=start_iot_client)
     iot_thread.daemon = False   # make it non-daemon so it keeps container alive
@@ -552,6 +1349,8 @@ async def startup_event():
 
     # Start the device/relay status checker
     asyncio.create_task(check_system_status())
+    asyncio.create_task(run_anomaly_peers())
+    asyncio.create_task(run_session_inference())
 
     async def _latency_housekeeping():
         while True:
@@ -563,6 +1362,18 @@ async def startup_event():
 
     asyncio.create_task(_latency_housekeeping())
 
+    # Move closed days out of the live DB (runs in a worker thread)
+    asyncio.create_task(archiver.run_forever())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # anything still queued is on disk and replays on the next start
+    if ingest_journal and device_manager.journal:
+        ingest_journal.flush()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app, host="0.0.0.0", port=8000,
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "1") != "0",
+    )
@@ -0,0 +1,206 @@
+"""
+Minimal MQTT5-over-TLS broker stand-in for checking the MQTT5 client's
+connect/retry path locally (no AWS account or real broker needed).
+
+It refuses the first --refuse connections (drops them before CONNACK, as
+an unreachable endpoint would), then accepts: CONNACK without a session,
+SUBACK for every filter, PINGRESP, and every --interval seconds a PUBLISH
+of --topic to each client subscribed to a matching filter. `$share/<group>/`
+prefixes are understood. One process, no persistence, QoS 0 only.
+
+The CRT client insists on mutual TLS, so the stand-in asks for a client
+certificate signed by --ca. One CA and one leaf (used by both sides) will do:
+
+    cd /tmp
+    openssl req -x509 -newkey rsa:2048 -nodes -days 2 -subj /CN=standin-ca -keyout ca.key -out ca.crt
+    openssl req -newkey rsa:2048 -nodes -subj /CN=localhost -keyout standin.key -out standin.csr
+    printf "subjectAltName=DNS:localhost\nextendedKeyUsage=serverAuth,clientAuth\n" > ext.cnf
+    openssl x509 -req -in standin.csr -CA ca.crt -CAkey ca.key -CAcreateserial -days 1 -extfile ext.cnf -out standin.crt
+    python mqtt5_standin.py --cert /tmp/standin.crt --key /tmp/standin.key --ca /tmp/ca.crt --refuse 2 --check
+
+--check runs iot_bootstrap against the stand-in with an IOTClient5 in the
+same process: the first connect fails, bootstrap hands the client its
+filters, and the check passes (exit 0) once a later CRT retry connects,
+subscribes, marks the endpoint ready and a PUBLISH reaches the handler.
+Without --check the stand-in just serves until interrupted.
+"""
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import threading
+import time
+from typing import Optional
+
+from aws_iot.IOTClient5 import IOTClient5, strip_share, topic_matches
+from aws_iot.IOTContext import IOTContext, IOTCredentials
+from iot_bootstrap import EndpointPlan, IngestReadiness, bootstrap
+
+CONNECT, CONNACK, PUBLISH, SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT = 1, 2, 3, 8, 9, 12, 13, 14
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b, n = n % 128, n // 128
+        out.append(b | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _packet(first: int, body: bytes) -> bytes:
+    return bytes([first]) + _varint(len(body)) + body
+
+
+def _str(s: str) -> bytes:
+    b = s.encode()
+    return len(b).to_bytes(2, "big") + b
+
+
+async def _read_varint(reader: asyncio.StreamReader) -> int:
+    n, mult = 0, 1
+    while True:
+        b = (await reader.readexactly(1))[0]
+        n += (b & 0x7F) * mult
+        if not b & 0x80:
+            return n
+        mult *= 128
+
+
+def _skip_varint(buf: bytes, i: int) -> tuple[int, int]:
+    n, mult = 0, 1
+    while True:
+        b = buf[i]
+        i += 1
+        n += (b & 0x7F) * mult
+        if not b & 0x80:
+            return n, i
+        mult *= 128
+
+
+class Standin:
+    def __init__(self, refuse: int, topic: str, interval: float):
+        self.refuse = refuse
+        self.topic = topic
+        self.interval = interval
+        self.clients: dict[asyncio.StreamWriter, list[str]] = {}
+        self.attempts = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.attempts += 1
+        if self.attempts <= self.refuse:
+            print(f"connection {self.attempts}: refused (before CONNACK)")
+            writer.close()
+            return
+        self.clients[writer] = []
+        try:
+            while True:
+                first = (await reader.readexactly(1))[0]
+                body = await reader.readexactly(await _read_varint(reader))
+                kind = first >> 4
+                if kind == CONNECT:
+                    print(f"connection {self.attempts}: CONNECT → CONNACK (no session)")
+                    writer.write(_packet(CONNACK << 4, b"\x00\x00\x00"))
+                elif kind == SUBSCRIBE:
+                    packet_id = body[:2]
+                    props, i = _skip_varint(body, 2)
+                    i += props
+                    filters = []
+                    while i < len(body):
+                        n = int.from_bytes(body[i:i + 2], "big")
+                        filters.append(body[i + 2:i + 2 + n].decode())
+                        i += 2 + n + 1
+                    self.clients[writer].extend(filters)
+                    print(f"SUBSCRIBE {filters} → SUBACK")
+                    writer.write(_packet(SUBACK << 4, packet_id + b"\x00" + b"\x00" * len(filters)))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP << 4, b""))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def publish_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            payload = json.dumps({"value": round(time.time() % 100, 1)}).encode()
+            body = _str(self.topic) + b"\x00" + payload
+            for writer, filters in list(self.clients.items()):
+                if any(topic_matches(strip_share(f), self.topic) for f in filters):
+                    writer.write(_packet(PUBLISH << 4, body))
+                    print(f"PUBLISH {self.topic}")
+
+
+def check(args: argparse.Namespace, timeout_s: float = 30.0) -> bool:
+    received: list[str] = []
+    plan = EndpointPlan(
+        endpoint="localhost",
+        region="ap-southeast-2",
+        subscriptions=[(f"$share/standin/{args.topic}", lambda topic, *_: received.append(topic))],
+    )
+
+    def make_client(p: EndpointPlan) -> IOTClient5:
+        return IOTClient5(IOTContext(), IOTCredentials(
+            cert_path=args.cert, client_id="mqtt5-standin-check", endpoint=p.endpoint,
+            priv_key_path=args.key, ca_path=args.ca, port=args.port,
+        ))
+
+    readiness = IngestReadiness()
+    clients = bootstrap([plan], make_client, readiness)
+    print(f"after bootstrap: {readiness.snapshot()['endpoints']['localhost']['state']}")
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline and not (readiness.ready and received):
+        time.sleep(0.2)
+    state = readiness.snapshot()["endpoints"]["localhost"]
+    print(f"ready={readiness.ready} state={state['state']} subscribed={state['subscribed']} messages={len(received)}")
+    for client in clients.values():
+        client.disconnect()
+    return readiness.ready and bool(received)
+
+
+async def serve(args: argparse.Namespace, started: Optional[threading.Event] = None) -> None:
+    tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    tls.load_cert_chain(args.cert, args.key)
+    tls.load_verify_locations(args.ca)
+    tls.verify_mode = ssl.CERT_REQUIRED
+    standin = Standin(args.refuse, args.topic, args.interval)
+    server = await asyncio.start_server(standin.handle, args.host, args.port, ssl=tls)
+    print(f"MQTT5 stand-in on {args.host}:{args.port}, refusing the first {args.refuse} connection(s)")
+    asyncio.create_task(standin.publish_loop())
+    if started:
+        started.set()
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8883)
+    ap.add_argument("--cert", required=True)
+    ap.add_argument("--key", required=True)
+    ap.add_argument("--ca", required=True, help="CA that signed the client certificate")
+    ap.add_argument("--refuse", type=int, default=1, help="connections to drop before accepting")
+    ap.add_argument("--topic", default="ap-southeast-2/marvel/fov-marvel-tablet-test-1/temperature")
+    ap.add_argument("--interval", type=float, default=2.0)
+    ap.add_argument("--check", action="store_true", help="run the MQTT5 client against the stand-in and exit")
+    args = ap.parse_args()
+
+    if not args.check:
+        asyncio.run(serve(args))
+        return
+    started = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve(args, started)), daemon=True).start()
+    started.wait()
+    ok = check(args)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+On-demand profiling for a running backend (admin endpoints in main.py).
+
+Nothing here costs anything until a profile is requested:
+
+* `CPUSampler` - a thread that exists only for the profile window and
+  samples every thread's stack via sys._current_frames() at `hz`. In
+  "cpu" mode each sample is weighted by the CPU time its thread used
+  since the previous one (Linux /proc/self/task), so threads parked in
+  wait/select/sleep drop out; elsewhere known blocking leaf frames are
+  skipped. "wall" mode counts every sample of every thread.
+* `StageProfiler` - swaps timed wrappers onto registered attributes
+  (ingest handler call, update_device, notify_clients) for the window and
+  puts the originals back afterwards; the hot path runs unwrapped code
+  the rest of the time.
+* `AllocationTracker` - tracemalloc is started for the window and stopped
+  after the snapshot diff.
+
+Profiles come out as folded stacks ("frame;frame;frame weight" per line),
+which flamegraph.pl, speedscope and inferno read directly.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from typing import Any, Callable, Optional
+
+MAX_STAGE_SAMPLES = 50_000      # per stage path, for percentiles
+_NS_PER_TICK = 1_000_000_000 // (os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100)
+
+# leaf frames of a thread that is blocked, not running (used without per-thread CPU clocks)
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_cpu_ns(native_id: Optional[int]) -> Optional[int]:
+    """CPU time a thread has used so far (Linux only), or None."""
+    if native_id is None:
+        return None
+    try:
+        with open(f"/proc/self/task/{native_id}/schedstat") as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) * _NS_PER_TICK     # utime + stime
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _idle_leaf(code) -> bool:
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+
+
+def _folded(weights: dict[str, float]) -> str:
+    lines = [f"{stack} {int(w)}" for stack, w in weights.items() if int(w) > 0]
+    return "\n".join(sorted(lines)) + "\n"
+
+
+class Busy(RuntimeError):
+    """A profile of this kind is already running."""
+
+
+class _Exclusive:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if not self._lock.acquire(blocking=False):
+            raise Busy("profile already running")
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+# ---------- CPU ----------
+
+class CPUSampler:
+    def __init__(self):
+        self._exclusive = _Exclusive()
+
+    def run(
+        self,
+        seconds: float,
+        hz: float = 100.0,
+        thread_filter: Optional[str] = None,
+        mode: str = "cpu",
+    ) -> tuple[str, dict]:
+        """
+        Blocking: sample for `seconds`, return (folded stacks, summary).
+        mode "cpu": weights are µs of thread CPU time (or on-CPU sample
+        counts where that isn't available); "wall": every sample counts 1.
+        """
+        if mode not in ("cpu", "wall"):
+            raise ValueError(f"unknown mode {mode!r}")
+        with self._exclusive:
+            me = threading.get_ident()
+            counts: dict[str, float] = defaultdict(float)
+            last_cpu: dict[int, int] = {}           # ident → CPU ns at the previous sample
+            interval = 1.0 / hz
+            samples = idle = 0
+            timed = False
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                threads = {t.ident: t for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    t = threads.get(ident)
+                    name = t.name if t else str(ident)
+                    if ident == me or (thread_filter and thread_filter not in name):
+                        continue
+                    weight = 1.0
+                    if mode == "cpu":
+                        cpu = _thread_cpu_ns(getattr(t, "native_id", None))
+                        if cpu is not None:
+                            timed = True
+                            prev = last_cpu.get(ident)
+                            last_cpu[ident] = cpu
+                            weight = (cpu - prev) / 1000.0 if prev is not None else 0.0
+                        elif _idle_leaf(frame.f_code):
+                            weight = 0.0
+                        if weight <= 0:
+                            idle += 1
+                            continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    counts[";".join([name] + stack[::-1])] += weight
+                samples += 1
+                time.sleep(interval)
+            return _folded(counts), {
+                "samples": samples,
+                "hz": hz,
+                "seconds": seconds,
+                "stacks": len(counts),
+                "mode": mode,
+                "weight": "cpu_us" if timed else "samples",
+                "idle_skipped": idle,
+            }
+
+
+# ---------- stages ----------
+
+class StageProfiler:
+    def __init__(self):
+        self._targets: list[tuple[Any, str, str, bool, Optional[Callable]]] = []
+        self._saved: list[tuple[Any, str, Any]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._samples: dict[str, deque] = {}
+        self._totals: dict[str, list] = {}          # path → [count, total_s]
+        self._exclusive = _Exclusive()
+        self.enabled = False
+
+    def register(
+        self,
+        obj: Any,
+        attr: str,
+        stage: str,
+        is_async: bool = False,
+        label: Optional[Callable[..., str]] = None,
+    ) -> None:
+        """Time obj.attr as `stage` while enabled. `label(*args)` can refine the stage name."""
+        self._targets.append((obj, attr, stage, is_async, label))
+
+    def _record(self, path: str, elapsed: float) -> None:
+        with self._lock:
+            t = self._totals.setdefault(path, [0, 0.0])
+            t[0] += 1
+            t[1] += elapsed
+            self._samples.setdefault(path, deque(maxlen=MAX_STAGE_SAMPLES)).append(elapsed)
+
+    def _wrap(self, fn: Callable, stage: str, is_async: bool, label: Optional[Callable]) -> Callable:
+        profiler = self
+
+        if is_async:
+            # coroutines interleave on the loop thread, so async stages are not nested
+            async def timed_async(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    profiler._record(stage, time.perf_counter() - t0)
+            return timed_async
+
+        def timed(*args, **kwargs):
+            name = label(*args) if label else stage
+            stack = getattr(profiler._local, "stack", None)
+            if stack is None:
+                stack = profiler._local.stack = []
+            stack.append(name)
+            path = ";".join(stack)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler._record(path, time.perf_counter() - t0)
+                stack.pop()
+        return timed
+
+    def enable(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+        for obj, attr, stage, is_async, label in self._targets:
+            descriptor = vars(obj).get(attr, None) if hasattr(obj, "__dict__") else None
+            wrapped = self._wrap(getattr(obj, attr), stage, is_async, label)
+            if isinstance(descriptor, (classmethod, staticmethod)):
+                wrapped = staticmethod(wrapped)     # already bound to the class
+            self._saved.append((obj, attr, descriptor))
+            setattr(obj, attr, wrapped)
+        self.enabled = True
+
+    def disable(self) -> None:
+        for obj, attr, descriptor in reversed(self._saved):
+            if descriptor is None:
+                delattr(obj, attr)                  # was resolved from the class
+            else:
+                setattr(obj, attr, descriptor)
+        self._saved.clear()
+        self.enabled = False
+
+    async def run(self, seconds: float) -> None:
+        with self._exclusive:
+            self.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                self.disable()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {}
+            for path, (count, total) in self._totals.items():
+                s = sorted(self._samples[path])
+                pct = lambda q: round(s[min(len(s) - 1, int(q * len(s)))] * 1000, 3)
+                out[path] = {
+                    "count": count,
+                    "total_ms": round(total * 1000, 1),
+                    "mean_ms": round(total / count * 1000, 3),
+                    "p50_ms": pct(0.50),
+                    "p95_ms": pct(0.95),
+                    "p99_ms": pct(0.99),
+                    "max_ms": round(s[-1] * 1000, 3),
+                }
+            return out
+
+    def folded(self) -> str:
+        """Self time per stage path in µs (children subtracted from their parent)."""
+        with self._lock:
+            totals = {p: t[1] * 1e6 for p, t in self._totals.items()}
+        weights = dict(totals)
+        for path, us in totals.items():
+            parent = path.rpartition(";")[0]
+            if parent in weights:
+                weights[parent] -= us
+        return _folded(weights)
+
+
+# ---------- allocations ----------
+
+class AllocationTracker:
+    def __init__(self):
+        self._exclusive = _Exclusive()
+
+    async def run(self, seconds: float, nframes: int = 25, top: int = 25) -> tuple[str, dict]:
+        """Track allocations for `seconds`; folded stacks weighted by net bytes allocated."""
+        with self._exclusive:
+            already = tracemalloc.is_tracing()
+            if not already:
+                tracemalloc.start(nframes)
+            try:
+                before = tracemalloc.take_snapshot()
+                await asyncio.sleep(seconds)
+                after = tracemalloc.take_snapshot()
+            finally:
+                if not already:
+                    tracemalloc.stop()
+            return await asyncio.to_thread(self._diff, before, after, top)
+
+    @staticmethod
+    def _diff(before, after, top: int) -> tuple[str, dict]:
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+        weights: dict[str, float] = defaultdict(float)
+        for st in stats:
+            if st.size_diff > 0:
+                frames = [f"{os.path.basename(f.filename)}:{f.lineno}" for f in st.traceback]
+                weights[";".join(frames)] += st.size_diff
+        summary = {
+            "net_bytes": sum(st.size_diff for st in stats),
+            "top": [
+                {
+                    "where": f"{st.traceback[-1].filename}:{st.traceback[-1].lineno}",
+                    "size_diff": st.size_diff,
+                    "count_diff": st.count_diff,
+                }
+                for st in stats[:top]
+            ],
+        }
+        return _folded(weights), summary
@@ -0,0 +1,234 @@
+"""
+Ingress rate limiting: token buckets in front of the region ingest queues.
+
+Nothing used to cap what one device may publish, so a tablet stuck in a
+publish loop flooded its region's queue, the DB writer and every WS
+client of its stadium. Each telemetry message now has to take a token
+from its device's bucket and its stadium's bucket before it is queued.
+Limits are plain strings, like rules and storage policies:
+
+    device * 10/s burst 50 collapse      any metric of one device
+    device latency 2/s burst 5 drop      overrides "*" for that metric
+    stadium * 500/s burst 2000 collapse  all devices of a stadium together
+
+`<rate>/<per>` refills the bucket (per: s, m, h or e.g. 10s); `burst` is
+its size (default: one period's worth). Over the limit:
+
+* drop     - the message is discarded
+* collapse - only the latest message per (device, metric) is kept and
+             delivered as soon as the buckets have tokens again, so the
+             dashboard ends up on the newest value without the flood
+
+A device that went over one of its own (device-scope) limits is flagged
+for RATE_LIMIT_FLAG_S; `on_flag(stadium, device, flagged)` reports the
+changes (main.py turns them into the device's `rateLimited` field).
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from rules import duration_s
+
+DEFAULT_LIMITS = [
+    "device * 10/s burst 50 collapse",
+    "stadium * 500/s burst 2000 collapse",
+]
+
+_LIMIT_RE = re.compile(
+    r"^\s*(?P<scope>device|stadium)\s+(?P<metric>\w+|\*)"
+    r"\s+(?P<rate>\d+(?:\.\d+)?)/(?P<per>\d*(?:\.\d+)?[smh]?)"
+    r"(?:\s+burst\s+(?P<burst>\d+))?"
+    r"(?:\s+(?P<action>drop|collapse))?\s*$"
+)
+
+Deliver = Callable[[], None]
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    scope: str                  # device | stadium
+    metric: str                 # metric name or "*"
+    rate: float                 # tokens per second
+    burst: float
+    action: str = "drop"        # drop | collapse
+    source: str = ""
+
+    @classmethod
+    def parse(cls, text: str) -> "RateLimit":
+        m = _LIMIT_RE.match(text)
+        if not m:
+            raise ValueError(f"Invalid rate limit: {text!r}")
+        per = m.group("per") or "s"
+        period = duration_s(per if per[0].isdigit() else "1" + per)
+        count = float(m.group("rate"))
+        if period <= 0 or count <= 0:
+            raise ValueError(f"Invalid rate limit: {text!r}")
+        return cls(
+            scope=m.group("scope"),
+            metric=m.group("metric"),
+            rate=count / period,
+            burst=float(m.group("burst") or max(count, 1)),
+            action=m.group("action") or "drop",
+            source=text.strip(),
+        )
+
+
+class _Bucket:
+    __slots__ = ("tokens", "at")
+
+    def __init__(self, tokens: float, at: float):
+        self.tokens, self.at = tokens, at
+
+    def refill(self, limit: RateLimit, now: float) -> float:
+        self.tokens = min(limit.burst, self.tokens + (now - self.at) * limit.rate)
+        self.at = now
+        return self.tokens
+
+
+class IngressLimiter:
+    def __init__(
+        self,
+        limits: list[RateLimit],
+        on_flag: Optional[Callable[[str, str, bool], None]] = None,
+        flag_s: Optional[float] = None,
+        tick_s: Optional[float] = None,
+    ):
+        self._rules = {(l.scope, l.metric): l for l in limits}
+        self.on_flag = on_flag
+        self.flag_s = flag_s if flag_s is not None else float(os.getenv("RATE_LIMIT_FLAG_S", "60"))
+        self.tick_s = tick_s if tick_s is not None else float(os.getenv("RATE_LIMIT_TICK_MS", "100")) / 1000.0
+        self._buckets: dict[tuple, _Bucket] = {}
+        # (stadium, device, metric) → (deliver, [(limit, bucket key), ...], refusing limit) of the latest held message
+        self._pending: dict[tuple, tuple] = {}
+        # (stadium, device) → {"dropped", "collapsed", "since", "last"} while flagged
+        self._flagged: dict[tuple, dict] = {}
+        self.counts = {"passed": 0, "dropped": 0, "collapsed": 0, "released": 0}
+        self.stadium_counts: dict[str, dict[str, int]] = {}     # stadium → dropped / collapsed
+        self._lock = threading.Lock()
+        self._started = False
+
+    @classmethod
+    def from_env(cls, on_flag: Optional[Callable[[str, str, bool], None]] = None) -> "IngressLimiter":
+        raw = os.getenv("RATE_LIMITS")
+        texts = [p for p in raw.split(";") if p.strip()] if raw is not None else DEFAULT_LIMITS
+        return cls([RateLimit.parse(t) for t in texts], on_flag=on_flag)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._rules)
+
+    def start(self) -> None:
+        if not self._started:
+            self._started = True
+            threading.Thread(target=self._release_loop, name="rate-limit", daemon=True).start()
+
+    def _limits_for(self, stadium: str, device: str, metric: str) -> list[tuple]:
+        out = []
+        for scope, owner in (("device", (stadium, device)), ("stadium", (stadium,))):
+            limit = self._rules.get((scope, metric)) or self._rules.get((scope, "*"))
+            if limit is not None:
+                out.append((limit, (scope, *owner, limit.metric)))
+        return out
+
+    def _take(self, limits: list[tuple], now: float) -> Optional[RateLimit]:
+        """Take one token from every bucket, or none; returns the first limit that refused."""
+        buckets = []
+        for limit, key in limits:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = _Bucket(limit.burst, now)
+            if b.refill(limit, now) < 1.0:
+                return limit
+            buckets.append(b)
+        for b in buckets:
+            b.tokens -= 1.0
+        return None
+
+    # ---------- ingest side (MQTT callback thread) ----------
+    def submit(self, stadium: str, device: str, metric: str, deliver: Deliver, now: Optional[float] = None) -> str:
+        """Deliver now, hold as the latest value, or drop. Returns passed | collapsed | dropped."""
+        now = now if now is not None else time.monotonic()
+        limits = self._limits_for(stadium, device, metric)
+        key = (stadium, device, metric)
+        newly_flagged = False
+        with self._lock:
+            held = self._pending.get(key)
+            # a newer message replaces a held one, so an old value can't land after it
+            refused = held[2] if held else self._take(limits, now)
+            if refused is None:
+                self.counts["passed"] += 1
+                outcome = "passed"
+            else:
+                outcome = "collapsed" if refused.action == "collapse" else "dropped"
+                self.counts[outcome] += 1
+                per_stadium = self.stadium_counts.setdefault(stadium, {"dropped": 0, "collapsed": 0})
+                per_stadium[outcome] += 1
+                if outcome == "collapsed":
+                    self._pending[key] = (deliver, limits, refused)
+                if refused.scope == "device":
+                    flag = self._flagged.get((stadium, device))
+                    if flag is None:
+                        flag = self._flagged[(stadium, device)] = {"dropped": 0, "collapsed": 0, "since": time.time()}
+                        newly_flagged = True
+                    flag[outcome] += 1
+                    flag["last"] = now
+        if outcome == "passed":
+            deliver()
+        if newly_flagged:
+            print(f"Rate limit: {stadium}/{device} over its limit ({refused.source})")
+            self._notify(stadium, device, True)
+        return outcome
+
+    def _notify(self, stadium: str, device: str, flagged: bool) -> None:
+        if self.on_flag:
+            try:
+                self.on_flag(stadium, device, flagged)
+            except Exception as e:
+                print(f"Rate limit flag handler failed: {e}")
+
+    # ---------- release of collapsed messages / flag expiry ----------
+    def release(self, now: Optional[float] = None) -> int:
+        now = now if now is not None else time.monotonic()
+        ready: list[Deliver] = []
+        cleared: list[tuple] = []
+        with self._lock:
+            for key, (deliver, limits, _) in list(self._pending.items()):
+                if self._take(limits, now) is None:
+                    del self._pending[key]
+                    ready.append(deliver)
+            self.counts["released"] += len(ready)
+            for dev, flag in list(self._flagged.items()):
+                if now - flag["last"] >= self.flag_s:
+                    del self._flagged[dev]
+                    cleared.append(dev)
+        for deliver in ready:
+            try:
+                deliver()
+            except Exception as e:
+                print(f"Rate limit release failed: {e}")
+        for stadium, device in cleared:
+            print(f"Rate limit: {stadium}/{device} back under its limit")
+            self._notify(stadium, device, False)
+        return len(ready)
+
+    def _release_loop(self) -> None:
+        while True:
+            time.sleep(self.tick_s)
+            self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counts,
+                "pending": len(self._pending),
+                "by_stadium": {s: dict(c) for s, c in self.stadium_counts.items()},
+                "flagged": [
+                    {"stadium": s, "device": d, "dropped": f["dropped"], "collapsed": f["collapsed"], "since": f["since"]}
+                    for (s, d), f in self._flagged.items()
+                ],
+                "limits": [l.source for l in self._rules.values()],
+            }
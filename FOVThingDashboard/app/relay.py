@@ -1,10 +1,14 @@
 """
 Ultra-light in-memory relay tracker.
-No DB – we only need current state for the dashboard.
+No DB – we only need current state for the dashboard. Liveness flips go
+to `listeners`; relay_history.py persists them as up/down intervals.
 """
 
 import os
 from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from response_cache import StateVersions
 
 
 class RelayManager:
@@ -12,14 +16,29 @@ class RelayManager:
         # allow override via env var RELAY_OFFLINE_GRACE_S, default 90s
         self._timeout = timeout_s or int(os.getenv("RELAY_OFFLINE_GRACE_S", "90"))
         self.relays: dict[str, dict] = {}     # relay-id → state dict
+        self.versions = StateVersions()        # bumped whenever a relay's state changes
+        # fn(rid, stadium, alive, since) on every liveness flip (and first sighting)
+        self.listeners: list[Callable[[str, Optional[str], bool, datetime], None]] = []
+
+    def _notify(self, rid: str, stadium: Optional[str], alive: bool, since: datetime):
+        for fn in self.listeners:
+            try:
+                fn(rid, stadium, alive, since)
+            except Exception as e:
+                print(f"relay listener failed for {rid}: {e}")
 
     # ---------- update from each heartbeat --------------------------------
-    def upsert(self, rid: str, pkt: dict):
+    def upsert(self, rid: str, pkt: dict, stadium: Optional[str] = None):
         st = self.relays.get(rid, {})
+        was_alive = st.get("alive")
         st.update(pkt)
         st["last_seen"] = datetime.utcnow()
         st["alive"] = True
+        st["stadium"] = stadium                # tag for filtering
         self.relays[rid] = st
+        self.versions.bump(stadium)
+        if not was_alive:
+            self._notify(rid, stadium, True, st["last_seen"])
 
     # ---------- called periodically to flip 'alive' -----------------------
     def refresh(self):
@@ -31,4 +50,10 @@ class RelayManager:
                     last_seen = datetime.fromisoformat(last_seen.replace("Z", ""))
                 except Exception:
                     last_seen = None
-            st["alive"] = bool(last_seen) and (last_seen > cut)
+            alive = bool(last_seen) and (last_seen > cut)
+            if st.get("alive") != alive:
+                st["alive"] = alive
+                self.versions.bump(st.get("stadium"))
+                # a dead relay has been down since its last heartbeat, not since we noticed
+                since = last_seen if (not alive and last_seen) else datetime.utcnow()
+                self._notify(rid, st.get("stadium"), alive, since)
@@ -0,0 +1,309 @@
+"""
+Relay uptime timeline.
+
+RelayManager only holds current state, so every restart used to lose relay
+history. Liveness is now kept as up/down intervals - one `relay_intervals`
+row per state change, not one per heartbeat:
+
+    relay  stadium  state  start                end                  recovered
+    cd-01  marvel   up     2026-10-01 09:00:00  2026-10-01 13:41:10
+    cd-01  marvel   down   2026-10-01 13:41:10  2026-10-01 13:52:30  1
+
+The open interval's `end` is checkpointed every RELAY_CHECKPOINT_S. After
+a restart it ends at the last checkpoint, and the gap until the next
+heartbeat counts as unknown (neither up nor down).
+
+In memory each relay keeps its closed intervals in time order with prefix
+sums (up seconds, down seconds, outages, recovered outages and their
+repair time), so a window query is a few bisects plus trimming the two
+intervals at its edges: O(log n) whatever the window.
+
+API workers (persist=False) only replay what the ingest process decides,
+so whenever they (re)connect to the state bus they reload the timeline
+from the DB: an ingest restart has closed the old open intervals at
+their last checkpoint, and the worker must not keep extending them.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Optional
+
+from database import RelayInterval
+
+UP, DOWN = "up", "down"
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(dt: datetime) -> float:
+    return (dt - _EPOCH).total_seconds()        # naive UTC, like the rest of the DB
+
+
+def _dt(ts: float) -> datetime:
+    return datetime.utcfromtimestamp(ts)
+
+
+def _iso(ts: float) -> str:
+    return _dt(ts).isoformat() + "Z"
+
+
+class _Open:
+    __slots__ = ("start", "state", "row_id")
+
+    def __init__(self, start: float, state: str, row_id: Optional[int]):
+        self.start, self.state, self.row_id = start, state, row_id
+
+
+class _Timeline:
+    """One relay: closed intervals in time order + prefix sums over them."""
+
+    def __init__(self, stadium: Optional[str]):
+        self.stadium = stadium
+        self.starts: list[float] = []
+        self.ends: list[float] = []
+        self.down: list[bool] = []
+        # cum_*[i] covers intervals [0, i)
+        self.cum_up = [0.0]
+        self.cum_down = [0.0]
+        self.cum_outages = [0]
+        self.cum_repaired = [0]
+        self.cum_repair_s = [0.0]
+        self.open: Optional[_Open] = None
+
+    def append(self, start: float, end: float, down: bool, recovered: bool) -> None:
+        length = end - start
+        repaired = down and recovered
+        self.starts.append(start)
+        self.ends.append(end)
+        self.down.append(down)
+        self.cum_up.append(self.cum_up[-1] + (0.0 if down else length))
+        self.cum_down.append(self.cum_down[-1] + (length if down else 0.0))
+        self.cum_outages.append(self.cum_outages[-1] + down)
+        self.cum_repaired.append(self.cum_repaired[-1] + repaired)
+        self.cum_repair_s.append(self.cum_repair_s[-1] + (length if repaired else 0.0))
+
+    def last_end(self) -> float:
+        return self.ends[-1] if self.ends else float("-inf")
+
+    def window(self, ws: float, we: float, now: float) -> dict:
+        """Raw sums over [ws, we)."""
+        out = {"up_s": 0.0, "down_s": 0.0, "outages": 0, "repaired": 0, "repair_s": 0.0}
+        i0 = bisect_right(self.ends, ws)        # first interval ending inside the window
+        i1 = bisect_left(self.starts, we)       # intervals starting before the window ends
+        if i0 < i1:
+            out["up_s"] = self.cum_up[i1] - self.cum_up[i0]
+            out["down_s"] = self.cum_down[i1] - self.cum_down[i0]
+            out["outages"] = self.cum_outages[i1] - self.cum_outages[i0]
+            # the edge intervals may stick out of the window
+            for i in {i0, i1 - 1}:
+                cut = max(0.0, ws - self.starts[i]) + max(0.0, self.ends[i] - we)
+                out["down_s" if self.down[i] else "up_s"] -= cut
+        # MTTR: outages that were repaired inside the window, at full length
+        j0, j1 = bisect_right(self.ends, ws), bisect_right(self.ends, we)
+        out["repaired"] = self.cum_repaired[j1] - self.cum_repaired[j0]
+        out["repair_s"] = self.cum_repair_s[j1] - self.cum_repair_s[j0]
+
+        op = self.open
+        if op and op.start < we and now > ws:
+            length = max(0.0, min(now, we) - max(op.start, ws))
+            out["down_s" if op.state == DOWN else "up_s"] += length
+            out["outages"] += op.state == DOWN
+        return out
+
+    def intervals(self, ws: float, we: float, now: float, limit: int) -> list[dict]:
+        """Intervals overlapping [ws, we), clipped to it; the newest `limit`."""
+        i0 = max(bisect_right(self.ends, ws), bisect_left(self.starts, we) - limit)
+        i1 = bisect_left(self.starts, we)
+        spans = [
+            (max(self.starts[i], ws), min(self.ends[i], we), DOWN if self.down[i] else UP, False)
+            for i in range(i0, i1)
+        ]
+        op = self.open
+        if op and op.start < we and now > ws:
+            spans.append((max(op.start, ws), min(now, we), op.state, True))
+        return [
+            {"state": state, "start": _iso(a), "end": _iso(b), "open": is_open}
+            for a, b, state, is_open in spans[-limit:]
+        ]
+
+
+def _report(sums: dict, ws: float, we: float) -> dict:
+    observed = sums["up_s"] + sums["down_s"]
+    return {
+        "start": _iso(ws),
+        "end": _iso(we),
+        "uptime_percent": round(100.0 * sums["up_s"] / observed, 3) if observed else None,
+        "up_s": round(sums["up_s"], 1),
+        "down_s": round(sums["down_s"], 1),
+        "unknown_s": round(max(0.0, (we - ws) - observed), 1),
+        "outages": sums["outages"],
+        "mttr_s": round(sums["repair_s"] / sums["repaired"], 1) if sums["repaired"] else None,
+    }
+
+
+class RelayTimeline:
+    def __init__(self, session_factory, persist: bool = True, checkpoint_s: Optional[float] = None):
+        """
+        persist=False (api role): history is read from the DB once, then
+        kept current from state-bus relay events without writing anything.
+        """
+        self._session_factory = session_factory
+        self.persist = persist
+        self.checkpoint_s = checkpoint_s or float(os.getenv("RELAY_CHECKPOINT_S", "300"))
+        self._relays: dict[str, _Timeline] = {}
+        self._lock = threading.Lock()           # in-memory timelines; never held over DB I/O
+        self._write_lock = threading.Lock()     # one state change / checkpoint at a time
+        self._last_checkpoint = 0.0
+        self._load()
+
+    # ---------- startup ----------
+    def _load(self) -> None:
+        relays: dict[str, _Timeline] = {}
+        with self._session_factory() as session:
+            rows = (
+                session.query(RelayInterval)
+                .order_by(RelayInterval.relay_id, RelayInterval.start, RelayInterval.id)
+                .all()
+            )
+            dangling = []
+            for r in rows:
+                tl = relays.setdefault(r.relay_id, _Timeline(r.stadium))
+                tl.stadium = r.stadium or tl.stadium
+                if r.open and not self.persist:
+                    # the ingest process is still extending this one
+                    tl.open = _Open(_epoch(r.start), r.state, None)
+                    continue
+                tl.append(_epoch(r.start), _epoch(r.end), r.state == DOWN, r.recovered)
+                if r.open:
+                    dangling.append(r.id)
+            if dangling:
+                # left open by the previous run: they end at their last checkpoint
+                session.query(RelayInterval).filter(RelayInterval.id.in_(dangling)).update(
+                    {"open": False}, synchronize_session=False
+                )
+                session.commit()
+        with self._lock:
+            self._relays = relays
+        if relays:
+            n = sum(len(tl.starts) + (tl.open is not None) for tl in relays.values())
+            print(f"Relay timeline: {n} intervals for {len(relays)} relays")
+
+    def resync(self) -> None:
+        """api role, on every bus (re)connect: start over from what the ingest process stored."""
+        if not self.persist:
+            self._load()
+
+    # ---------- writes (only on state changes) ----------
+    def record(self, rid: str, stadium: Optional[str], alive: bool, at: Optional[datetime] = None) -> None:
+        """Relay `rid` is up/down since `at`; no-op if that's already its state."""
+        state = UP if alive else DOWN
+        at_s = _epoch(at) if at else time.time()
+        # changes are serialised by _write_lock, so the new row's id is set before the next
+        # change of this relay looks for it; SLA queries only wait for the in-memory part
+        with self._write_lock:
+            with self._lock:
+                tl = self._relays.setdefault(rid, _Timeline(stadium))
+                tl.stadium = stadium or tl.stadium
+                op = tl.open
+                if op and op.state == state:
+                    return
+                # intervals never overlap, whatever the clocks say
+                at_s = max(at_s, op.start if op else tl.last_end())
+                recovered = bool(op) and op.state == DOWN and alive
+                if op:
+                    tl.append(op.start, at_s, op.state == DOWN, recovered)
+                new = tl.open = _Open(at_s, state, None)
+                stadium = tl.stadium
+            if not self.persist:
+                return
+            if op:
+                self._close_row(op.row_id, at_s, recovered)
+            row_id = self._open_row(rid, stadium, state, at_s)
+            with self._lock:
+                new.row_id = row_id
+
+    def _open_row(self, rid: str, stadium: Optional[str], state: str, at_s: float) -> int:
+        with self._session_factory() as session:
+            row = RelayInterval(relay_id=rid, stadium=stadium, state=state, start=_dt(at_s), end=_dt(at_s))
+            session.add(row)
+            session.commit()
+            return row.id
+
+    def _close_row(self, row_id: Optional[int], at_s: float, recovered: bool) -> None:
+        if row_id is None:
+            return
+        with self._session_factory() as session:
+            session.query(RelayInterval).filter(RelayInterval.id == row_id).update(
+                {"end": _dt(at_s), "open": False, "recovered": recovered}, synchronize_session=False
+            )
+            session.commit()
+
+    def checkpoint(self, force: bool = False) -> None:
+        """Push the open intervals' end forward (called from the status loop)."""
+        now = time.time()
+        if not self.persist or (not force and now - self._last_checkpoint < self.checkpoint_s):
+            return
+        self._last_checkpoint = now
+        with self._write_lock:
+            with self._lock:
+                ids = [tl.open.row_id for tl in self._relays.values() if tl.open and tl.open.row_id]
+            if not ids:
+                return
+            with self._session_factory() as session:
+                # open only: one closed since the ids were read keeps its real end
+                session.query(RelayInterval).filter(
+                    RelayInterval.id.in_(ids), RelayInterval.open.is_(True)
+                ).update({"end": _dt(now)}, synchronize_session=False)
+                session.commit()
+
+    # ---------- queries ----------
+    def relays(self, stadium: Optional[str] = None) -> list[str]:
+        with self._lock:
+            return sorted(
+                rid for rid, tl in self._relays.items()
+                if stadium is None or tl.stadium == stadium
+            )
+
+    def stadium_of(self, rid: str) -> Optional[str]:
+        tl = self._relays.get(rid)
+        return tl.stadium if tl else None
+
+    def sla(
+        self,
+        rid: str,
+        start: datetime,
+        end: Optional[datetime] = None,
+        timeline_limit: int = 0,
+    ) -> Optional[dict]:
+        """Uptime %, outages and MTTR for one relay over [start, end); None if never seen."""
+        now = time.time()
+        ws, we = _epoch(start), min(_epoch(end), now) if end else now
+        with self._lock:
+            tl = self._relays.get(rid)
+            if tl is None:
+                return None
+            out = {"relay": rid, "stadium": tl.stadium, **_report(tl.window(ws, we, now), ws, we)}
+            if timeline_limit:
+                out["intervals"] = tl.intervals(ws, we, now, timeline_limit)
+        return out
+
+    def stadium_sla(self, stadium: str, start: datetime, end: Optional[datetime] = None) -> dict:
+        """Per-relay SLA for a stadium plus the totals across its relays."""
+        now = time.time()
+        ws, we = _epoch(start), min(_epoch(end), now) if end else now
+        total = {"up_s": 0.0, "down_s": 0.0, "outages": 0, "repaired": 0, "repair_s": 0.0}
+        relays = {}
+        with self._lock:
+            for rid, tl in self._relays.items():
+                if tl.stadium != stadium:
+                    continue
+                sums = tl.window(ws, we, now)
+                for k in total:
+                    total[k] += sums[k]
+                relays[rid] = _report(sums, ws, we)
+        out = {"stadium": stadium, **_report(total, ws, we), "relays": relays}
+        # relay-seconds don't add up to wall-clock time
+        out["unknown_s"] = round(max(0.0, len(relays) * (we - ws) - total["up_s"] - total["down_s"]), 1)
+        return out
@@ -0,0 +1,120 @@
+"""
+Response caching for the polling REST endpoints.
+
+* `StateVersions` - per-stadium change counters bumped by the managers on
+  every mutation ("*" counts everything, for admin scope).
+* `ResponseCache` - keeps one serialised JSON body + ETag per (endpoint,
+  scope), rebuilt only when the scope's version moved; answers
+  If-None-Match with 304.
+* `LRUCache` - small bounded map for immutable history pages.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+ALL = "*"
+
+
+class StateVersions:
+    def __init__(self):
+        self._v: dict[str, int] = {ALL: 0}
+        self._lock = threading.Lock()
+
+    def bump(self, stadium: Optional[str] = None) -> None:
+        with self._lock:
+            self._v[ALL] += 1
+            if stadium:
+                self._v[stadium] = self._v.get(stadium, 0) + 1
+
+    def get(self, scope: Optional[str] = None) -> int:
+        return self._v.get(scope or ALL, 0)
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=10).hexdigest() + '"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # tolerate weak validators added by proxies (nginx gzip turns "x" into W/"x")
+    candidates = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in candidates
+
+
+def json_bytes(payload: Any) -> bytes:
+    return json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+
+
+def conditional_response(request: Request, body: bytes, etag: str, cache_control: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization, Cookie"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    def __init__(self):
+        self._entries: dict[Hashable, tuple[int, bytes, str]] = {}   # key → (version, body, etag)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0, "not_modified": 0}
+
+    def respond(
+        self,
+        request: Request,
+        key: Hashable,
+        version: int,
+        build: Callable[[], Any],
+        cache_control: str = "private, no-cache",
+    ) -> Response:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            body = json_bytes(build())
+            entry = (version, body, etag_for(body))
+            with self._lock:
+                self._entries[key] = entry
+            self.stats["builds"] += 1
+        else:
+            self.stats["hits"] += 1
+
+        resp = conditional_response(request, entry[1], entry[2], cache_control)
+        if resp.status_code == 304:
+            self.stats["not_modified"] += 1
+        return resp
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,236 @@
+"""
+Incremental threshold rules evaluated as each metric arrives.
+
+Rules are plain strings so they can live in .env:
+
+    battery < 15 for 2m clear 20
+    temperature > 80 clear 75
+    ota == in_progress for 15m
+
+`for` requires the condition to hold for that long before firing. It is
+checked on each new sample, and when a rule goes pending it also arms a
+deadline that `check_deadlines()` (run from the status loop) fires - a
+device stuck `in_progress` usually stops sending `ota` at all. `clear` is the hysteresis threshold the
+value must cross back over before the alert resets; without it the alert
+clears as soon as the condition is false.
+
+Rules are indexed by metric, so a battery message only touches battery rules.
+"""
+
+import json
+import operator
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+DEFAULT_RULES = [
+    "battery < 15 for 2m clear 20",
+    "temperature > 80 clear 75",
+    "ota == in_progress for 15m",
+]
+
+_OPS: dict[str, Callable] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+_RULE_RE = re.compile(
+    r"^\s*(?P<metric>\w+)\s*(?P<op><=|>=|==|!=|<|>)\s*(?P<value>\S+)"
+    r"(?:\s+for\s+(?P<for>\d+(?:\.\d+)?[smh]?))?"
+    r"(?:\s+clear\s+(?P<clear>\S+))?\s*$"
+)
+
+Value = Union[float, str]
+
+
+def duration_s(text: Optional[str]) -> float:
+    if not text:
+        return 0.0
+    unit = text[-1]
+    if unit in "smh":
+        return float(text[:-1]) * {"s": 1, "m": 60, "h": 3600}[unit]
+    return float(text)
+
+
+def _coerce(value) -> Value:
+    """Numbers become floats; OTA-style JSON bodies reduce to their status."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict) and "status" in parsed:
+            return str(parsed["status"])
+    except (json.JSONDecodeError, TypeError):
+        pass
+    return text
+
+
+@dataclass(frozen=True)
+class Rule:
+    metric: str
+    op: str
+    threshold: Value
+    for_s: float = 0.0
+    clear: Optional[Value] = None
+    source: str = ""
+
+    @classmethod
+    def parse(cls, text: str) -> "Rule":
+        m = _RULE_RE.match(text)
+        if not m:
+            raise ValueError(f"Invalid rule: {text!r}")
+        clear = m.group("clear")
+        return cls(
+            metric=m.group("metric"),
+            op=m.group("op"),
+            threshold=_coerce(m.group("value")),
+            for_s=duration_s(m.group("for")),
+            clear=_coerce(clear) if clear is not None else None,
+            source=text.strip(),
+        )
+
+    def _compare(self, value: Value, threshold: Value) -> bool:
+        if isinstance(value, str) != isinstance(threshold, str):
+            return False
+        return _OPS[self.op](value, threshold)
+
+    def matches(self, value: Value) -> bool:
+        return self._compare(value, self.threshold)
+
+    def still_active(self, value: Value) -> bool:
+        """While firing: stay active until the value crosses the clear level."""
+        if self.clear is None:
+            return self.matches(value)
+        return self._compare(value, self.clear)
+
+
+@dataclass
+class RuleEvent:
+    rule: Rule
+    device: str
+    stadium: Optional[str]
+    value: Value
+    state: str          # "fired" | "cleared"
+    ts: float
+
+    def to_dict(self) -> dict:
+        return {
+            "rule": self.rule.source,
+            "metric": self.rule.metric,
+            "device": self.device,
+            "stadium": self.stadium,
+            "value": self.value,
+            "state": self.state,
+            "ts": self.ts,
+        }
+
+
+class RuleEngine:
+    def __init__(self, rules: list[Rule], on_event: Optional[Callable[[RuleEvent], None]] = None):
+        self.on_event = on_event
+        self._by_metric: dict[str, list[Rule]] = {}
+        for rule in rules:
+            self._by_metric.setdefault(rule.metric, []).append(rule)
+        # (stadium, device, rule) → [pending_since | None, firing, last value]
+        self._state: dict[tuple, list] = {}
+        # (stadium, device, rule) → time its `for` runs out, while pending
+        self._deadlines: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, on_event: Optional[Callable[[RuleEvent], None]] = None) -> "RuleEngine":
+        raw = os.getenv("ALERT_RULES")
+        texts = [r for r in raw.split(";") if r.strip()] if raw is not None else DEFAULT_RULES
+        return cls([Rule.parse(t) for t in texts], on_event=on_event)
+
+    def active(self) -> list[dict]:
+        """Currently firing (stadium, device, rule) triples."""
+        with self._lock:
+            return [
+                {"stadium": st, "device": dev, "rule": rule.source}
+                for (st, dev, rule), (_, firing, _) in self._state.items()
+                if firing
+            ]
+
+    def evaluate(
+        self,
+        device: str,
+        stadium: Optional[str],
+        metric: str,
+        value,
+        now: Optional[float] = None,
+    ) -> list[RuleEvent]:
+        rules = self._by_metric.get(metric)
+        if not rules:
+            return []
+        now = now if now is not None else time.time()
+        v = _coerce(value)
+        events: list[RuleEvent] = []
+
+        with self._lock:
+            for rule in rules:
+                key = (stadium, device, rule)
+                state = self._state.get(key)
+                if state is None:
+                    state = self._state[key] = [None, False, v]
+                state[2] = v
+
+                if state[1]:
+                    if not rule.still_active(v):
+                        state[0], state[1] = None, False
+                        events.append(RuleEvent(rule, device, stadium, v, "cleared", now))
+                    continue
+
+                if not rule.matches(v):
+                    state[0] = None
+                    self._deadlines.pop(key, None)
+                    continue
+                if state[0] is None:
+                    state[0] = now
+                    if rule.for_s > 0:
+                        self._deadlines[key] = now + rule.for_s
+                if now - state[0] >= rule.for_s:
+                    state[1] = True
+                    self._deadlines.pop(key, None)
+                    events.append(RuleEvent(rule, device, stadium, v, "fired", now))
+
+        self._emit(events)
+        return events
+
+    def check_deadlines(self, now: Optional[float] = None) -> list[RuleEvent]:
+        """Fire pending rules whose `for` ran out without a new sample."""
+        now = now if now is not None else time.time()
+        events: list[RuleEvent] = []
+        with self._lock:
+            for key, deadline in list(self._deadlines.items()):
+                if deadline > now:
+                    continue
+                del self._deadlines[key]
+                state = self._state.get(key)
+                if state is None or state[0] is None or state[1]:
+                    continue
+                stadium, device, rule = key
+                state[1] = True
+                events.append(RuleEvent(rule, device, stadium, state[2], "fired", now))
+        self._emit(events)
+        return events
+
+    def _emit(self, events: list[RuleEvent]) -> None:
+        if self.on_event:
+            for ev in events:
+                try:
+                    self.on_event(ev)
+                except Exception as e:
+                    print(f"Rule event handler failed: {e}")
@@ -0,0 +1,180 @@
+"""
+Runtime introspection: event-loop lag probe + background process sampler.
+
+* `LoopLagMonitor` sleeps a fixed interval on the loop and records how late
+  it wakes up into a histogram. A watchdog thread notices when the probe
+  stops waking at all (loop blocked) and logs the loop thread's stack, so
+  the offending call (sync SQLite, smtplib, ...) is named in the log.
+* `ProcessSampler` refreshes CPU/RSS/threads/fds/GC every few seconds and
+  pre-serialises the status document, so /api/status is a cached read.
+"""
+
+import asyncio
+import bisect
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Callable, Optional
+
+try:
+    import psutil
+except ImportError:  # optional
+    psutil = None
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_BUCKET_LABELS = [f"<={b}" for b in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}"]
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_s: Optional[float] = None, stall_threshold_s: Optional[float] = None):
+        self.interval_s = interval_s or float(os.getenv("LOOP_LAG_INTERVAL_S", "0.5"))
+        self.stall_threshold_s = stall_threshold_s or float(os.getenv("LOOP_STALL_THRESHOLD_S", "0.25"))
+        self.counts = [0] * (len(LAG_BUCKETS_MS) + 1)    # last bucket = overflow
+        self.samples = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.stalls = 0
+        self.last_stall: Optional[dict] = None
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._stalled = False
+
+    def start(self) -> None:
+        """Start probe (on the running loop) and watchdog thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        asyncio.create_task(self._probe())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval_s)
+            lag_ms = max(0.0, (loop.time() - t0 - self.interval_s) * 1000.0)
+            self._heartbeat = time.monotonic()
+            self.last_ms = lag_ms
+            self.max_ms = max(self.max_ms, lag_ms)
+            self.counts[bisect.bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+            self.samples += 1
+
+    def _watchdog(self) -> None:
+        limit = self.interval_s + self.stall_threshold_s
+        while True:
+            time.sleep(self.stall_threshold_s / 2)
+            blocked_s = time.monotonic() - self._heartbeat
+            if blocked_s <= limit:
+                self._stalled = False
+                continue
+            if self._stalled:
+                continue  # already reported this stall
+            self._stalled = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            self.last_stall = {
+                "at": datetime.utcnow().isoformat() + "Z",
+                "blocked_ms": round((blocked_s - self.interval_s) * 1000.0, 1),
+                "stack": stack,
+            }
+            print(
+                f"WARNING: event loop blocked for >{self.last_stall['blocked_ms']:.0f} ms; "
+                f"loop thread is at:\n{stack}"
+            )
+
+    def _percentile(self, q: float) -> Optional[float]:
+        """Upper bucket bound containing the q-quantile."""
+        if not self.samples:
+            return None
+        rank = q * self.samples
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return float(LAG_BUCKETS_MS[i]) if i < len(LAG_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        return {
+            "lag_ms": {
+                "last": round(self.last_ms, 2),
+                "max": round(self.max_ms, 2),
+                "p50": self._percentile(0.50),
+                "p99": self._percentile(0.99),
+            },
+            "histogram_ms": dict(zip(_BUCKET_LABELS, self.counts)),
+            "samples": self.samples,
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+        }
+
+
+class ProcessSampler:
+    """
+    Periodically builds the /api/status document off the request path.
+
+    `extra` returns app-level fields (device count, relays, ...) and is
+    called on the loop, once per interval.
+    """
+
+    def __init__(self, extra: Callable[[], dict], interval_s: Optional[float] = None):
+        self.extra = extra
+        self.interval_s = interval_s or float(os.getenv("STATUS_SAMPLE_INTERVAL_S", "5"))
+        self.snapshot: dict = {"status": "starting"}
+        self.body: bytes = json.dumps(self.snapshot).encode()
+        self._proc = psutil.Process() if psutil else None
+        if self._proc:
+            self._proc.cpu_percent(None)   # prime; first call always returns 0.0
+
+    def start(self) -> None:
+        self.refresh()
+        asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Status sampler failed: {e}")
+
+    def _process_stats(self) -> dict:
+        stats: dict = {
+            "gc_counts": gc.get_count(),
+            "gc_collections": [s.get("collections", 0) for s in gc.get_stats()],
+            "threads": threading.active_count(),
+        }
+        if self._proc:
+            with self._proc.oneshot():
+                stats["cpu_percent"] = self._proc.cpu_percent(None)
+                stats["rss_mb"] = round(self._proc.memory_info().rss / (1024 * 1024), 1)
+                stats["threads"] = self._proc.num_threads()
+                if hasattr(self._proc, "num_fds"):
+                    stats["fds"] = self._proc.num_fds()
+        return stats
+
+    def _system_stats(self) -> dict:
+        if not psutil:
+            return {}
+        mem = psutil.virtual_memory()
+        return {
+            "cpu_percent": psutil.cpu_percent(None),
+            "memory_used_percent": mem.percent,
+            "memory_available_mb": mem.available / (1024 * 1024),
+        }
+
+    def refresh(self) -> None:
+        snapshot = {
+            "status": "online",
+            **self.extra(),
+            "system": self._system_stats(),
+            "process": self._process_stats(),
+            "server_time": datetime.utcnow().isoformat(),   # time of this sample
+        }
+        self.snapshot = snapshot
+        self.body = json.dumps(snapshot, default=str).encode()
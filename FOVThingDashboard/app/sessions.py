@@ -0,0 +1,353 @@
+"""
+Match sessions: a stadium + start/end, with a report computed once.
+
+A match report used to mean re-scanning `device_logs` for the window on
+every view. Now a session is a `match_sessions` row; when it closes, its
+summary is computed in one pass over the window's rows and stored as JSON
+next to it, so viewing a past match is a primary-key read.
+
+Sessions come from two places:
+
+* manual - `POST /api/sessions` (optionally with an end, for a match
+  declared after the fact) and `POST /api/sessions/{id}/close`
+* inferred - `infer()` every SESSION_TICK_S (ingest side): a stadium is
+  active while at least max(SESSION_MIN_ONLINE, SESSION_ACTIVE_FRACTION ×
+  devices) are online. Active for SESSION_START_S opens a session (starting
+  when activity began); quiet for SESSION_END_S closes an inferred one
+  (ending when activity stopped). Manual sessions are never auto-closed.
+
+A stadium has at most one open session. Per device the summary holds:
+
+    uptime_pct / disconnects   from gaps between stored rows: latency pings
+                               are stored every minute, so a gap longer than
+                               SESSION_GAP_S means the device was away
+    messages                   stored rows in the window
+    battery_min                lowest reported battery (0 = not reported)
+    temperature_max            highest reported temperature
+    latency_ms                 p50 / p95 / p99 RTT
+    ota                        last OTA state in the window (commands.ota_state)
+
+plus stadium totals. With the ingest journal on, the last rows of the
+window may still be queued when the session closes, so the summary waits
+until the journal has committed everything appended by then. A summary
+that is waiting or failed to compute (DB busy, ...) is retried by the
+next `summarize_pending()`.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from commands import ota_state
+from database import MatchSession
+from device import numeric_metric_value
+from timeseries import parse_ts
+
+MANUAL, INFERRED = "manual", "inferred"
+LATENCY_QS = (50, 95, 99)
+SUMMARY_METRICS = ("battery", "temperature", "latency", "ota", "version")
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() + "Z" if dt else None
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"samples": 0}
+    pct = np.percentile(np.array(values, dtype=np.float64), LATENCY_QS)
+    return {"samples": len(values), **{f"p{q}": round(float(v), 1) for q, v in zip(LATENCY_QS, pct)}}
+
+
+def summarize_rows(rows: Iterable[tuple], devices: Iterable[str], start: float, end: float, gap_s: float) -> dict:
+    """
+    (ts string, device, metric, value) rows of one session → its summary.
+    `devices` are the stadium's devices that existed by the end (silent ones get 0 % uptime).
+    """
+    per: dict[str, dict] = {name: {"ts": [], "battery": [], "temperature": [], "latency": [], "ota": None}
+                            for name in devices}
+    for ts, device, metric, value in rows:
+        d = per.setdefault(device, {"ts": [], "battery": [], "temperature": [], "latency": [], "ota": None})
+        d["ts"].append(str(ts))
+        if metric == "ota":
+            d["ota"] = ota_state(value) or d["ota"]
+        elif metric in ("battery", "temperature", "latency"):
+            v = numeric_metric_value(metric, value)
+            if v is not None and (v != 0 or metric == "latency"):     # 0 = "not reported"
+                d[metric].append(v)
+
+    span = max(end - start, 1e-9)
+    report: dict[str, dict] = {}
+    all_latency: list[float] = []
+    ota_counts = {"success": 0, "error": 0, "in_progress": 0}
+    for name in sorted(per):
+        d = per[name]
+        if d["ts"]:
+            t = np.sort(parse_ts(d["ts"]))
+            gaps = np.diff(t)
+            tail = max(end - t[-1], 0.0)
+            # every row vouches for the device being around for gap_s after it
+            covered = float(np.minimum(gaps, gap_s).sum()) + min(tail, gap_s)
+            disconnects = int((gaps > gap_s).sum()) + int(tail > gap_s)
+            uptime = round(min(100.0, 100.0 * covered / span), 1)
+        else:
+            disconnects, uptime = 0, 0.0
+        all_latency += d["latency"]
+        if d["ota"]:
+            ota_counts[d["ota"]] += 1
+        report[name] = {
+            "uptime_pct": uptime,
+            "disconnects": disconnects,
+            "messages": len(d["ts"]),
+            "battery_min": min(d["battery"]) if d["battery"] else None,
+            "temperature_max": max(d["temperature"]) if d["temperature"] else None,
+            "latency_ms": _percentiles(d["latency"]),
+            "ota": d["ota"],
+        }
+
+    batteries = [r["battery_min"] for r in report.values() if r["battery_min"] is not None]
+    temps = [r["temperature_max"] for r in report.values() if r["temperature_max"] is not None]
+    return {
+        "duration_s": round(end - start),
+        "totals": {
+            "devices": len(report),
+            "seen": sum(1 for r in report.values() if r["messages"]),
+            "uptime_pct_mean": round(float(np.mean([r["uptime_pct"] for r in report.values()])), 1) if report else None,
+            "disconnects": sum(r["disconnects"] for r in report.values()),
+            "messages": sum(r["messages"] for r in report.values()),
+            "battery_min": min(batteries) if batteries else None,
+            "temperature_max": max(temps) if temps else None,
+            "latency_ms": _percentiles(all_latency),
+            "ota": ota_counts,
+        },
+        "devices": report,
+    }
+
+
+class SessionManager:
+    def __init__(self, device_manager, stadiums: Iterable[str], activity: Optional[Callable[[str], dict]] = None):
+        """
+        `activity(slug)` returns the live fleet summary (FleetAggregates.summary)
+        used to infer sessions; without it only manual sessions exist.
+        """
+        self.device_manager = device_manager
+        self.session_factory = device_manager.session_factory
+        self.stadiums = list(stadiums)
+        self.activity = activity
+        self.gap_s = float(os.getenv("SESSION_GAP_S", "150"))
+        self.tick_s = float(os.getenv("SESSION_TICK_S", "60"))
+        self.start_s = float(os.getenv("SESSION_START_S", "600"))
+        self.end_s = float(os.getenv("SESSION_END_S", "1800"))
+        self.min_online = int(os.getenv("SESSION_MIN_ONLINE", "3"))
+        self.active_fraction = float(os.getenv("SESSION_ACTIVE_FRACTION", "0.5"))
+        # slug → [active since, quiet since] (epoch seconds or None)
+        self._activity: dict[str, list] = {}
+        # session id → journal lsn its rows must be committed up to before summarizing
+        self._close_lsn: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    # ---------- views ----------
+    @staticmethod
+    def _view(row: MatchSession, with_summary: bool) -> dict:
+        out = {
+            "id": row.id,
+            "stadium": row.stadium,
+            "label": row.label,
+            "source": row.source,
+            "start": _iso(row.start),
+            "end": _iso(row.end),
+            "open": row.end is None,
+            "summarized_at": _iso(row.summarized_at),
+        }
+        if with_summary:
+            out["summary"] = json.loads(row.summary) if row.summary else None
+        return out
+
+    def get(self, session_id: int) -> Optional[dict]:
+        session = self.session_factory()
+        try:
+            row = session.get(MatchSession, session_id)
+            return self._view(row, with_summary=True) if row else None
+        finally:
+            session.close()
+
+    def recent(self, stadium: str, limit: int = 50, before: Optional[datetime] = None) -> list[dict]:
+        """Newest first, without summaries (idx_match_session_start)."""
+        session = self.session_factory()
+        try:
+            q = session.query(MatchSession).filter(MatchSession.stadium == stadium)
+            if before is not None:
+                q = q.filter(MatchSession.start < before)
+            rows = q.order_by(MatchSession.start.desc()).limit(limit).all()
+            return [self._view(r, with_summary=False) for r in rows]
+        finally:
+            session.close()
+
+    def _open_row(self, session, stadium: str) -> Optional[MatchSession]:
+        return (session.query(MatchSession)
+                .filter(MatchSession.stadium == stadium, MatchSession.end.is_(None))
+                .order_by(MatchSession.start.desc()).first())
+
+    # ---------- lifecycle ----------
+    def open(
+        self,
+        stadium: str,
+        label: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        source: str = MANUAL,
+    ) -> dict:
+        """New session; with `end` it is closed (and summarized) straight away."""
+        start = start or datetime.utcnow()
+        if end is not None and end <= start:
+            raise ValueError("end must be after start")
+        session = self.session_factory()
+        try:
+            if end is None and self._open_row(session, stadium) is not None:
+                raise ValueError(f"stadium {stadium!r} already has an open session")
+            row = MatchSession(stadium=stadium, label=label, source=source, start=start, end=end)
+            session.add(row)
+            session.commit()
+            session_id = row.id
+        finally:
+            session.close()
+        print(f"Session {session_id} ({source}) opened for {stadium} at {_iso(start)}")
+        if end is not None:
+            self.summarize(session_id)
+        return self.get(session_id)
+
+    def close(self, session_id: int, end: Optional[datetime] = None) -> dict:
+        """Close an open session and compute its summary. KeyError / ValueError on bad ids."""
+        session = self.session_factory()
+        try:
+            row = session.get(MatchSession, session_id)
+            if row is None:
+                raise KeyError(session_id)
+            end = end or datetime.utcnow()
+            if end <= row.start:
+                raise ValueError("end must be after start")
+            # conditional UPDATE: a manual close and inference can't both close it
+            closed = (session.query(MatchSession)
+                      .filter(MatchSession.id == session_id, MatchSession.end.is_(None))
+                      .update({MatchSession.end: end}, synchronize_session=False))
+            session.commit()
+        finally:
+            session.close()
+        if not closed:
+            raise ValueError("session is already closed")
+        print(f"Session {session_id} closed at {_iso(end)}")
+        self.summarize(session_id)
+        return self.get(session_id)
+
+    # ---------- summaries ----------
+    def _rows(self, session, stadium: str, start: datetime, end: datetime) -> list[tuple]:
+        # straight on the tables (not the view): device_id IN (the stadium's devices) ×
+        # metric IN (...) × time range is a range scan of idx_device_metric_time per pair
+        stmt = text(
+            "SELECT dl.timestamp, d.name, dl.metric_type, dl.metric_value "
+            "FROM devices d JOIN device_logs dl ON dl.device_id = d.id "
+            "WHERE d.stadium = :stadium AND dl.metric_type IN :metrics "
+            "AND dl.timestamp >= :start AND dl.timestamp <= :end"
+        ).bindparams(bindparam("metrics", expanding=True))
+        rows = session.execute(stmt, {
+            "stadium": stadium, "metrics": list(SUMMARY_METRICS),
+            "start": start.isoformat(sep=" "), "end": end.isoformat(sep=" "),
+        }).all()
+        archive = self.device_manager.archive
+        if archive and archive.covers(start):
+            rows += [(r[1], r[2], r[4], r[5]) for r in archive.scan(stadium=stadium, start_time=start, end_time=end)
+                     if r[4] in SUMMARY_METRICS]
+        return rows
+
+    def _journal_caught_up(self, session_id: int) -> bool:
+        """True once every message journaled before the session closed is in the DB."""
+        journal = self.device_manager.journal
+        if journal is None:
+            # writes are inline: the rows are already there (api workers never get here,
+            # they forward session writes to the ingest process)
+            return True
+        with self._lock:
+            # first look after the close (or after a restart): what was appended by now
+            wait_for = self._close_lsn.setdefault(session_id, journal.appended_lsn)
+        return journal.committed_lsn >= wait_for
+
+    def summarize(self, session_id: int) -> bool:
+        """Compute and store the summary of a closed session (once; later calls are no-ops)."""
+        session = self.session_factory()
+        try:
+            row = session.get(MatchSession, session_id)
+            if row is None or row.end is None or row.summary is not None:
+                return False
+            if not self._journal_caught_up(session_id):
+                return False        # summarize_pending() tries again
+            t0 = time.perf_counter()
+            devices = [name for (name,) in session.execute(
+                text("SELECT name FROM devices WHERE stadium = :stadium AND first_seen <= :end"),
+                {"stadium": row.stadium, "end": row.end.isoformat(sep=" ")},
+            ).all()]
+            rows = self._rows(session, row.stadium, row.start, row.end)
+            start, end = parse_ts([row.start.isoformat(sep=" "), row.end.isoformat(sep=" ")])
+            summary = summarize_rows(rows, devices, float(start), float(end), self.gap_s)
+            row.summary = json.dumps(summary, separators=(",", ":"))
+            row.summarized_at = datetime.utcnow()
+            session.commit()
+            with self._lock:
+                self._close_lsn.pop(session_id, None)
+            print(f"Session {session_id} summarized: {len(rows)} rows, "
+                  f"{len(summary['devices'])} devices in {(time.perf_counter() - t0) * 1000:.0f} ms")
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"Session {session_id} summary failed (will retry): {e}")
+            return False
+        finally:
+            session.close()
+
+    def summarize_pending(self) -> int:
+        session = self.session_factory()
+        try:
+            ids = [r.id for r in session.query(MatchSession.id)
+                   .filter(MatchSession.end.isnot(None), MatchSession.summary.is_(None)).all()]
+        finally:
+            session.close()
+        return sum(self.summarize(i) for i in ids)
+
+    # ---------- inference ----------
+    def _is_active(self, summary: dict) -> bool:
+        devices, online = summary.get("devices", 0), summary.get("online", 0)
+        return devices > 0 and online >= max(self.min_online, self.active_fraction * devices)
+
+    def infer(self, now: Optional[float] = None) -> None:
+        """One inference tick over every stadium (blocking DB work - run it in a thread)."""
+        now = now if now is not None else time.time()
+        for slug in self.stadiums if self.activity is not None else ():
+            active = self._is_active(self.activity(slug))
+            with self._lock:
+                state = self._activity.setdefault(slug, [None, None])
+                if active:
+                    state[0] = state[0] or now
+                    state[1] = None
+                else:
+                    state[0] = None
+                    state[1] = state[1] or now
+                active_since, quiet_since = state
+            session = self.session_factory()
+            try:
+                current = self._open_row(session, slug)
+                current = (current.id, current.source) if current else None
+            finally:
+                session.close()
+            try:
+                if active_since and current is None and now - active_since >= self.start_s:
+                    self.open(slug, label="inferred", start=datetime.utcfromtimestamp(active_since), source=INFERRED)
+                elif quiet_since and current and current[1] == INFERRED and now - quiet_since >= self.end_s:
+                    self.close(current[0], end=datetime.utcfromtimestamp(quiet_since))
+            except (KeyError, ValueError) as e:
+                print(f"Session inference for {slug}: {e}")
+        self.summarize_pending()
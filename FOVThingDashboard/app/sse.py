@@ -0,0 +1,148 @@
+"""
+Server-Sent Events for read-only viewers (control-room wall displays).
+
+A kiosk only reads, so a full WebSocket with its ping/pong loop is more
+than it needs, and plain HTTP streaming passes through nginx and other
+proxies without any upgrade configuration. `GET /api/events` streams the
+same events WS clients get (`{"topic", "message"}` as `data:`).
+
+Every broadcast goes into one `EventRing`: it is serialised once into a
+complete SSE frame and stored in a fixed-size ring under a sequence
+number. Each viewer keeps its own cursor into the ring and writes the
+frames after it that its JWT scope may see - one encode per event, one
+bytes write per viewer.
+
+Event ids are `<boot>-<seq>`. A reconnecting EventSource sends the last
+one as `Last-Event-ID`; if it is from this process and still in the ring,
+the viewer resumes exactly after it. Otherwise (restart, or gone longer
+than the ring covers) it gets a fresh snapshot of current state first.
+A comment line every SSE_KEEPALIVE_S keeps idle proxies from closing the
+stream.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+class _Frame:
+    __slots__ = ("seq", "stadium", "data")
+
+    def __init__(self, seq: int, stadium: Optional[str], data: bytes):
+        self.seq, self.stadium, self.data = seq, stadium, data
+
+
+class EventRing:
+    def __init__(self, capacity: Optional[int] = None, keepalive_s: Optional[float] = None):
+        self.capacity = capacity or int(os.getenv("SSE_BUFFER_SIZE", "4096"))
+        self.keepalive_s = keepalive_s or float(os.getenv("SSE_KEEPALIVE_S", "15"))
+        self.retry_ms = int(os.getenv("SSE_RETRY_MS", "5000"))
+        # per process: uvicorn workers started in the same second must not share it
+        self.boot = f"{os.getpid():x}{uuid.uuid4().hex[:8]}"
+        self._ring: list[Optional[_Frame]] = [None] * self.capacity
+        self.head = 0                       # seq of the newest frame (0 = none yet)
+        self._wake = asyncio.Event()        # replaced on every publish
+        self.viewers = 0
+        self.stats = {"published": 0, "resumed": 0, "snapshots": 0}
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def _frame(self, seq: int, topic: str, message: dict) -> bytes:
+        data = json.dumps({"topic": topic, "message": jsonable_encoder(message)}, separators=(",", ":"))
+        return f"id: {self.event_id(seq)}\ndata: {data}\n\n".encode()
+
+    # ---------- producer (event loop) ----------
+    def publish(self, topic: str, message: dict, stadium: Optional[str] = None) -> None:
+        seq = self.head + 1
+        self.head = seq
+        if not self.viewers:
+            # nobody listening: skip the encode, but leave a hole so a viewer
+            # reconnecting across it gets a snapshot instead of missing this
+            self._ring[seq % self.capacity] = None
+            return
+        self._ring[seq % self.capacity] = _Frame(seq, stadium, self._frame(seq, topic, message))
+        self.stats["published"] += 1
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    def _resume_seq(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Cursor to continue after `last_event_id`, or None if a snapshot is needed."""
+        if not last_event_id:
+            return None
+        boot, _, seq = last_event_id.strip().partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self.head or seq < self.head - self.capacity:
+            return None
+        return seq
+
+    def _after(self, cursor: int) -> Optional[list[_Frame]]:
+        """Frames newer than cursor, oldest first; None if some were overwritten."""
+        frames = []
+        for seq in range(cursor + 1, self.head + 1):
+            f = self._ring[seq % self.capacity]
+            if f is None or f.seq != seq:
+                return None
+            frames.append(f)
+        return frames
+
+    # ---------- one viewer ----------
+    async def stream(
+        self,
+        visible: Callable[[Optional[str]], bool],
+        snapshot: Callable[[], Iterable[tuple[str, dict]]],
+        last_event_id: Optional[str] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        The SSE body for one viewer. `visible(stadium)` applies its JWT
+        scope; `snapshot()` yields (topic, message) of current state.
+        """
+        self.viewers += 1
+        try:
+            yield f"retry: {self.retry_ms}\n\n".encode()
+            cursor = self._resume_seq(last_event_id)
+            if cursor is not None and self._after(cursor) is None:
+                cursor = None           # it missed events that are no longer in the ring
+            if cursor is not None:
+                self.stats["resumed"] += 1
+            while True:
+                if cursor is None:
+                    # fresh start or fell off the ring: current state, tagged with the head id
+                    self.stats["snapshots"] += 1
+                    cursor = self.head
+                    for topic, message in snapshot():
+                        yield self._frame(cursor, topic, message)
+                wake = self._wake
+                frames = self._after(cursor)
+                if frames is None:
+                    cursor = None
+                    continue
+                if frames:
+                    chunk = b"".join(f.data for f in frames if visible(f.stadium))
+                    cursor = frames[-1].seq
+                    if chunk:
+                        yield chunk
+                    continue
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=self.keepalive_s)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+        finally:
+            self.viewers -= 1
+
+    def status(self) -> dict:
+        return {
+            **self.stats,
+            "viewers": self.viewers,
+            "head": self.event_id(self.head),
+            "buffered": min(self.head, self.capacity),
+            "capacity": self.capacity,
+        }
@@ -1,7 +1,9 @@
 # stadiums_config.py
 
-# NOTE: Currently using Sydney (ap-southeast-2) certs only.
-# To add Dublin (eu-west-1), you'd need separate IoT clients with Dublin certs.
+# Each stadium's "region" picks its IoT cert bundle (config.credentials_for):
+# ap-southeast-2 uses the IOT_* paths, eu-west-1 uses ./certs/dublin (or
+# IOT_CERT_DIR_EU_WEST_1). Uncomment Aviva once the Dublin certs are deployed;
+# without them its endpoint shows as failed in /api/ready.
 STADIUMS = {
     # "aviva": {
     #     "name": "Aviva Stadium",
@@ -0,0 +1,158 @@
+"""
+Local pub/sub state bus over a Unix socket, for multi-process deployments.
+
+One ingest process (FOV_ROLE=ingest) owns MQTT, the DB writer and the
+status checks, and runs `StateBusServer`. Any number of stateless API/WS
+workers (FOV_ROLE=api, e.g. `uvicorn main:app --workers 4`) run
+`StateBusClient`, keep a read replica of device/relay state and fan
+events out to their own WebSocket clients.
+
+Wire format: 4-byte big-endian length + JSON object
+    {"topic": str, "message": dict, "stadium": str | null, "metric": str | null}
+
+Each event is serialised once and the same bytes are written to every
+subscriber. A new subscriber first receives a snapshot (the same event
+shape, one per device/relay/active alert), then the live stream. Clients
+reset their replica on every (re)connect, before that snapshot.
+"""
+
+import asyncio
+import json
+import os
+import struct
+from typing import Awaitable, Callable, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+DEFAULT_BUS_PATH = "/tmp/fov-dashboard-bus.sock"
+_HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+MAX_SUBSCRIBER_BUFFER = 8 * 1024 * 1024   # slow subscriber → dropped, reconnects + resnapshots
+
+Event = dict
+SnapshotFn = Callable[[], Iterable[Event]]
+
+
+def bus_path() -> str:
+    return os.getenv("STATE_BUS_PATH", DEFAULT_BUS_PATH)
+
+
+def encode_event(topic: str, message: dict, stadium: Optional[str], metric: Optional[str] = None) -> bytes:
+    body = json.dumps(
+        {"topic": topic, "message": jsonable_encoder(message), "stadium": stadium, "metric": metric},
+        separators=(",", ":"),
+    ).encode()
+    return _HEADER.pack(len(body)) + body
+
+
+class StateBusServer:
+    def __init__(self, snapshot: SnapshotFn, path: Optional[str] = None):
+        self.path = path or bus_path()
+        self.snapshot = snapshot
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats = {"published": 0, "dropped_subscribers": 0}
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)   # stale socket from a previous run
+        self._server = await asyncio.start_unix_server(self._on_connect, path=self.path)
+        print(f"State bus listening on {self.path}")
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._writers)
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # subscribed before the snapshot is drained: events published meanwhile queue up
+        # behind it in the same transport buffer instead of being missed
+        self._writers.add(writer)
+        try:
+            for ev in self.snapshot():
+                writer.write(encode_event(ev["topic"], ev["message"], ev.get("stadium")))
+            await writer.drain()
+        except Exception as e:
+            print(f"State bus snapshot failed: {e}")
+            self._drop(writer)
+            return
+        print(f"State bus subscriber connected ({self.subscribers} total)")
+        try:
+            await reader.read()          # subscribers never send; returns at EOF
+        except ConnectionError:
+            pass
+        finally:
+            self._drop(writer)
+
+    def _drop(self, writer: asyncio.StreamWriter) -> None:
+        if writer in self._writers:
+            self._writers.discard(writer)
+            writer.close()
+            print(f"State bus subscriber gone ({self.subscribers} left)")
+
+    def publish(self, topic: str, message: dict, stadium: Optional[str] = None, metric: Optional[str] = None) -> None:
+        """Write one event to every subscriber. Call on the event loop."""
+        if not self._writers:
+            return
+        frame = encode_event(topic, message, stadium, metric)
+        self.stats["published"] += 1
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                self.stats["dropped_subscribers"] += 1
+                print("State bus subscriber too slow; dropping")
+                self._drop(writer)
+                continue
+            writer.write(frame)
+
+
+class StateBusClient:
+    def __init__(
+        self,
+        on_event: Callable[[Event], Awaitable[None]],
+        path: Optional[str] = None,
+        on_connect: Optional[Callable[[], None]] = None,
+    ):
+        self.path = path or bus_path()
+        self.on_event = on_event
+        # called on every (re)connect, before the snapshot: the replica must forget what the
+        # snapshot no longer contains (alerts that cleared while we were away, ...)
+        self.on_connect = on_connect
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        delay = 0.5
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                print(f"State bus not reachable at {self.path} ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+                continue
+
+            self.connected, delay = True, 0.5
+            print(f"State bus connected: {self.path}")
+            if self.on_connect:
+                try:
+                    self.on_connect()
+                except Exception as e:
+                    print(f"State bus connect handler failed: {e}")
+            try:
+                while True:
+                    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                    if size > MAX_FRAME:
+                        raise ValueError(f"frame too large: {size}")
+                    event = json.loads(await reader.readexactly(size))
+                    try:
+                        await self.on_event(event)
+                    except Exception as e:
+                        print(f"State bus event handler failed: {e}")
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+                print(f"State bus connection lost: {e}")
+            finally:
+                self.connected = False
+                writer.close()
+            await asyncio.sleep(delay)
@@ -0,0 +1,134 @@
+"""
+Per-metric storage policies: which incoming metrics become DeviceLog rows.
+
+Live state, rules and WS updates always see every message; only the
+persisted history is thinned. Policies are plain strings, like rules:
+
+    battery deadband 1 heartbeat 15m       store if |Δ| > 1 since the last stored row
+    temperature deadband 2% heartbeat 15m  relative: |Δ| > 2 % of the last stored value
+    version change heartbeat 24h           store only when the value differs
+    latency always                         every message (also the default)
+
+`heartbeat` stores a row anyway once that long has passed since the last
+stored one, so history still proves the device was alive. Comparison is
+against the last *stored* value, so slow drift can't creep past the
+deadband unrecorded.
+
+`admit` only decides; the caller reports the row with `stored` once it is
+committed (or safely journaled), so a failed write doesn't leave the
+filter comparing against a value that never reached the DB.
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from rules import duration_s
+
+DEFAULT_POLICIES = [
+    "battery deadband 1 heartbeat 15m",
+    "temperature deadband 0.5 heartbeat 15m",
+    "version change heartbeat 24h",
+    # anomaly scores (anomalies.py), written every peer run
+    "battery_score deadband 0.5 heartbeat 1h",
+    "temperature_score deadband 0.5 heartbeat 1h",
+]
+
+_POLICY_RE = re.compile(
+    r"^\s*(?P<metric>\w+)\s+(?P<mode>always|change|deadband)"
+    r"(?:\s+(?P<band>\d+(?:\.\d+)?)(?P<pct>%)?)?"
+    r"(?:\s+heartbeat\s+(?P<hb>\d+(?:\.\d+)?[smh]?))?\s*$"
+)
+
+
+@dataclass(frozen=True)
+class StoragePolicy:
+    metric: str
+    mode: str = "always"                # always | change | deadband
+    band: float = 0.0
+    relative: bool = False
+    heartbeat_s: float = 0.0            # 0 = no heartbeat rows
+    source: str = ""
+
+    @classmethod
+    def parse(cls, text: str) -> "StoragePolicy":
+        m = _POLICY_RE.match(text)
+        if not m or (m.group("mode") == "deadband") != (m.group("band") is not None):
+            raise ValueError(f"Invalid storage policy: {text!r}")
+        return cls(
+            metric=m.group("metric"),
+            mode=m.group("mode"),
+            band=float(m.group("band") or 0),
+            relative=bool(m.group("pct")),
+            heartbeat_s=duration_s(m.group("hb")),
+            source=text.strip(),
+        )
+
+    def changed(self, last: str, value: str) -> bool:
+        if self.mode == "change":
+            return value != last
+        try:
+            a, b = float(last), float(value)
+        except ValueError:
+            return value != last        # non-numeric under a deadband → change-only
+        limit = self.band * abs(a) / 100.0 if self.relative else self.band
+        return abs(b - a) > limit
+
+
+class StorageFilter:
+    def __init__(self, policies: list[StoragePolicy]):
+        self._by_metric = {p.metric: p for p in policies}
+        # (stadium, device, metric) → (last stored value, stored at)
+        self._last: dict[tuple, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.counts: dict[str, dict[str, int]] = {}     # metric → received / stored
+
+    @classmethod
+    def from_env(cls) -> "StorageFilter":
+        raw = os.getenv("STORAGE_POLICIES")
+        texts = [p for p in raw.split(";") if p.strip()] if raw is not None else DEFAULT_POLICIES
+        return cls([StoragePolicy.parse(t) for t in texts])
+
+    def admit(
+        self,
+        device: str,
+        stadium: Optional[str],
+        metric: str,
+        value: str,
+        now: Optional[float] = None,
+    ) -> bool:
+        """Should this (parsed) value be written as a DeviceLog row? Call `stored` once it is."""
+        now = now if now is not None else time.time()
+        policy = self._by_metric.get(metric)
+        with self._lock:
+            self.counts.setdefault(metric, {"received": 0, "stored": 0})["received"] += 1
+            last = self._last.get((stadium, device, metric))
+        return (
+            policy is None or policy.mode == "always" or last is None
+            or policy.changed(last[0], value)
+            or (policy.heartbeat_s > 0 and now - last[1] >= policy.heartbeat_s)
+        )
+
+    def stored(self, device: str, stadium: Optional[str], metric: str, value: str, now: float) -> None:
+        """The admitted row was written: later values are compared against this one."""
+        with self._lock:
+            self.counts.setdefault(metric, {"received": 0, "stored": 0})["stored"] += 1
+            self._last[(stadium, device, metric)] = (value, now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_metric = {m: dict(c) for m, c in self.counts.items()}
+        received = sum(c["received"] for c in per_metric.values())
+        stored = sum(c["stored"] for c in per_metric.values())
+        for c in per_metric.values():
+            c["reduction_percent"] = round(100.0 * (1 - c["stored"] / c["received"]), 1)
+        return {
+            "policies": [p.source for p in self._by_metric.values()],
+            "received": received,
+            "stored": stored,
+            "reduction_percent": round(100.0 * (1 - stored / received), 1) if received else None,
+            "metrics": per_metric,
+        }
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the app's modules are flat (`from journal import ...`), as when uvicorn runs from app/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+from device_index import DeviceIndex, _sort_value, battery_band, decode_cursor, encode_cursor
+
+STADIUMS = ["marvel", "aviva", "kia"]
+FIRMWARE = ["1.0.0", "1.1.0", "1.2.0"]
+
+
+def _device(rng, name, stadium=None):
+    return {
+        "name": name,
+        "stadium": stadium or rng.choice(STADIUMS),
+        "wifiConnected": rng.random() < 0.7,
+        "batteryCharge": rng.choice([0.0, rng.uniform(1, 100)]),
+        "temperature": round(rng.uniform(15, 45), 1),
+        "latencyMs": round(rng.uniform(5, 500), 1),
+        "firmwareVersion": rng.choice(FIRMWARE),
+        "lastMessageTime": f"2026-10-19T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z",
+    }
+
+
+@pytest.fixture
+def fleet():
+    rng = random.Random(7)
+    index, devices = DeviceIndex(), {}
+    for i in range(600):
+        name = f"fov-{i:04d}"
+        devices[name] = _device(rng, name)
+        index.observe(name, None, devices[name])
+    # churn: updates, stadium moves and removals after the initial load
+    for _ in range(400):
+        name = rng.choice(sorted(devices))
+        new = _device(rng, name, stadium=rng.choice([None, devices[name]["stadium"]]))
+        index.observe(name, devices[name], new)
+        devices[name] = new
+    for name in rng.sample(sorted(devices), 50):
+        index.observe(name, devices.pop(name), None)
+    return index, devices
+
+
+def _brute(devices, stadium=None, online=None, battery=None, firmware=None, prefix=None, sort="name"):
+    field = sort.lstrip("-")
+    rows = [
+        (_sort_value(field, d), n) for n, d in devices.items()
+        if (stadium is None or d["stadium"] == stadium)
+        and (online is None or bool(d["wifiConnected"]) == online)
+        and (not battery or battery_band(d["batteryCharge"]) in battery)
+        and (not firmware or d["firmwareVersion"] in firmware)
+        and (not prefix or n.startswith(prefix))
+    ]
+    rows.sort(reverse=sort.startswith("-"))
+    return [n for _, n in rows]
+
+
+def _all_pages(index, limit, **query):
+    names, cursor, total = [], None, None
+    while True:
+        page = index.search(limit=limit, cursor=cursor, **query)
+        total = page["total"]
+        names += [d["name"] for d in page["devices"]]
+        cursor = page["nextCursor"]
+        if cursor is None:
+            return names, total
+
+
+QUERIES = [
+    {},
+    {"sort": "-name"},
+    {"stadium": "marvel"},
+    {"stadium": "aviva", "sort": "batteryCharge"},
+    {"online": True, "sort": "-temperature"},
+    {"battery": ["low", "critical"], "sort": "latencyMs"},
+    {"firmware": ["1.2.0"], "stadium": "kia", "sort": "-lastMessageTime"},
+    {"prefix": "fov-01"},
+    {"prefix": "fov-02", "online": False, "sort": "firmwareVersion"},
+    {"stadium": "marvel", "battery": ["unknown"], "firmware": ["1.0.0"], "sort": "-batteryCharge"},
+    {"stadium": "nowhere"},
+]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("limit", [1, 7, 100])
+def test_pages_match_brute_force(fleet, query, limit):
+    index, devices = fleet
+    expected = _brute(devices, **query)
+    names, total = _all_pages(index, limit, **query)
+    assert names == expected
+    assert total == len(expected)
+
+
+def test_fields_projection(fleet):
+    index, devices = fleet
+    page = index.search(limit=3, fields=["name", "stadium"])
+    assert all(set(d) == {"name", "stadium"} for d in page["devices"])
+
+
+def test_counts_follow_updates(fleet):
+    index, devices = fleet
+    counts = index.counts("stadium")
+    for st in STADIUMS:
+        assert counts.get(st, 0) == sum(d["stadium"] == st for d in devices.values())
+
+
+def test_bad_sort_fields_and_cursor():
+    index = DeviceIndex()
+    with pytest.raises(ValueError):
+        index.search(sort="colour")
+    with pytest.raises(ValueError):
+        index.search(fields=["colour"])
+    with pytest.raises(ValueError):
+        index.search(cursor="not-a-cursor")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12.5, "fov-0001")) == (12.5, "fov-0001")
+
+
+def test_battery_bands():
+    assert [battery_band(v) for v in (95, 80, 50, 20, 5, 0, None, "x")] == [
+        "high", "high", "ok", "low", "critical", "unknown", "unknown", "unknown",
+    ]
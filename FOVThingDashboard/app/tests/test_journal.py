@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from journal import SUFFIX, IngestJournal, _records
+
+
+def _journal(tmp_path, **kw):
+    kw.setdefault("segment_bytes", 64 * 1024)
+    kw.setdefault("fsync_interval_s", 0.01)
+    kw.setdefault("batch_size", 100)
+    return IngestJournal(directory=tmp_path, **kw)
+
+
+def _wait(pred, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not pred():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _record(i):
+    return ("dev", "marvel", "temperature", str(i))
+
+
+def test_commits_every_entry_in_order(tmp_path):
+    j = _journal(tmp_path)
+    j.open(0)
+    got = []
+    j.start(lambda batch: got.extend(lsn for lsn, _ in batch))
+    for i in range(1000):
+        j.append(_record(i))
+    _wait(lambda: j.committed_lsn == 1000)
+    assert got == list(range(1, 1001))
+    assert j.status()["backlog"] == 0
+
+
+def test_failed_batch_is_retried(tmp_path):
+    j = _journal(tmp_path)
+    j.open(0)
+    got, fails = [], [2]
+
+    def apply(batch):
+        if fails[0]:
+            fails[0] -= 1
+            raise RuntimeError("database is locked")
+        got.extend(lsn for lsn, _ in batch)
+
+    j.start(apply)
+    for i in range(10):
+        j.append(_record(i))
+    _wait(lambda: j.committed_lsn == 10)
+    assert got == list(range(1, 11))
+    assert j.stats["write_failures"] == 2
+
+
+def test_replays_uncommitted_entries_after_restart(tmp_path):
+    j = _journal(tmp_path)
+    j.open(0)
+    for i in range(50):
+        j.append(_record(i))
+    j.flush()
+
+    # new process: the DB had committed up to lsn 20
+    again = _journal(tmp_path)
+    replay = again.open(20)
+    assert [lsn for lsn, _ in replay] == list(range(21, 51))
+    assert replay[0][1] == _record(20)
+    assert again.append(_record(50)) == 51
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    j = _journal(tmp_path)
+    j.open(0)
+    for i in range(5):
+        j.append(_record(i))
+    j.flush()
+    seg = sorted(tmp_path.glob(f"*{SUFFIX}"))[-1]
+    data = bytearray(seg.read_bytes())
+    last_end = [end for _, _, end in _records(bytes(data), len(data))][-1]
+    data[last_end - 2] ^= 0xFF          # half-written last record: its CRC no longer matches
+    seg.write_bytes(bytes(data))
+
+    replay = _journal(tmp_path).open(0)
+    assert [lsn for lsn, _ in replay] == [1, 2, 3, 4]
+
+
+def test_empty_segment_is_removed(tmp_path):
+    (tmp_path / f"{7:016d}{SUFFIX}").write_bytes(b"")
+    j = _journal(tmp_path)
+    assert j.open(0) == []
+    assert not (tmp_path / f"{7:016d}{SUFFIX}").exists()
+
+
+def test_segments_roll_and_are_released(tmp_path):
+    j = _journal(tmp_path, segment_bytes=4096)
+    j.open(0)
+    j.start(lambda batch: None)
+    for i in range(2000):
+        j.append(_record(i))
+    _wait(lambda: j.committed_lsn == 2000)
+    j.flush()
+    # everything committed: only the active segment is left
+    assert len(list(tmp_path.glob(f"*{SUFFIX}"))) == 1
+
+
+def test_queue_spills_to_disk_and_reads_back(tmp_path, monkeypatch):
+    monkeypatch.setenv("JOURNAL_MAX_PENDING", "200")
+    j = _journal(tmp_path, segment_bytes=16 * 1024, batch_size=50)
+    j.open(0)
+    gate = threading.Event()
+    got = []
+
+    def apply(batch):
+        gate.wait()
+        got.extend(lsn for lsn, _ in batch)
+
+    j.start(apply)
+    for i in range(3000):
+        j.append(_record(i))
+    status = j.status()
+    assert status["spilled"]
+    assert status["in_memory"] <= 200
+    assert status["backlog"] == 3000
+
+    gate.set()
+    _wait(lambda: j.committed_lsn == 3000)
+    assert got == list(range(1, 3001))
+    assert j.stats["read_back"] > 0
+    assert not j.status()["spilled"]
+
+
+def test_record_larger_than_a_segment_is_refused(tmp_path):
+    j = _journal(tmp_path, segment_bytes=4096)
+    j.open(0)
+    with pytest.raises(ValueError):
+        j.append(("dev", "marvel", "ota", "x" * 5000))
@@ -0,0 +1,102 @@
+import pytest
+
+from ratelimit import IngressLimiter, RateLimit
+
+
+def _limiter(*texts, flags=None):
+    on_flag = (lambda st, dev, flagged: flags.append((st, dev, flagged))) if flags is not None else None
+    return IngressLimiter([RateLimit.parse(t) for t in texts], on_flag=on_flag, flag_s=60, tick_s=0.1)
+
+
+def test_parse():
+    lim = RateLimit.parse("device latency 2/s burst 5 drop")
+    assert (lim.scope, lim.metric, lim.rate, lim.burst, lim.action) == ("device", "latency", 2.0, 5.0, "drop")
+    lim = RateLimit.parse("stadium * 600/m collapse")
+    assert lim.rate == 10.0 and lim.burst == 600.0 and lim.action == "collapse"
+    assert RateLimit.parse("device * 5/10s").rate == 0.5
+
+
+@pytest.mark.parametrize("text", ["device * 0/s", "fleet * 1/s", "device * 1/s burst", "device * 1/s explode"])
+def test_parse_rejects(text):
+    with pytest.raises(ValueError):
+        RateLimit.parse(text)
+
+
+def test_burst_then_drop_then_refill():
+    limiter = _limiter("device * 1/s burst 3 drop")
+    delivered = []
+    outcomes = [limiter.submit("st", "d1", "temperature", lambda: delivered.append(1), now=0.0) for _ in range(5)]
+    assert outcomes == ["passed"] * 3 + ["dropped"] * 2
+    assert len(delivered) == 3
+    # one token back per second
+    assert limiter.submit("st", "d1", "temperature", lambda: delivered.append(1), now=1.0) == "passed"
+    assert limiter.counts["dropped"] == 2
+
+
+def test_metric_rule_overrides_wildcard():
+    limiter = _limiter("device * 100/s burst 100 drop", "device latency 1/s burst 1 drop")
+    assert limiter.submit("st", "d1", "latency", lambda: None, now=0.0) == "passed"
+    assert limiter.submit("st", "d1", "latency", lambda: None, now=0.0) == "dropped"
+    assert limiter.submit("st", "d1", "battery", lambda: None, now=0.0) == "passed"
+
+
+def test_stadium_bucket_is_shared_by_its_devices():
+    limiter = _limiter("stadium * 1/s burst 2 drop")
+    assert limiter.submit("st", "d1", "battery", lambda: None, now=0.0) == "passed"
+    assert limiter.submit("st", "d2", "battery", lambda: None, now=0.0) == "passed"
+    assert limiter.submit("st", "d3", "battery", lambda: None, now=0.0) == "dropped"
+    assert limiter.submit("other", "d1", "battery", lambda: None, now=0.0) == "passed"
+
+
+def test_refused_message_takes_no_tokens_from_other_buckets():
+    limiter = _limiter("device * 1/s burst 1 drop", "stadium * 1/s burst 2 drop")
+    assert limiter.submit("st", "d1", "battery", lambda: None, now=0.0) == "passed"
+    assert limiter.submit("st", "d1", "battery", lambda: None, now=0.0) == "dropped"
+    # d1's refused message must not have used the stadium's second token
+    assert limiter.submit("st", "d2", "battery", lambda: None, now=0.0) == "passed"
+
+
+def test_collapse_keeps_only_the_latest_value():
+    limiter = _limiter("device * 1/s burst 1 collapse")
+    delivered = []
+    for v in range(4):
+        limiter.submit("st", "d1", "temperature", lambda v=v: delivered.append(v), now=0.0)
+    assert delivered == [0]
+    assert limiter.release(now=0.5) == 0
+    assert limiter.release(now=1.0) == 1
+    assert delivered == [0, 3]
+    assert limiter.stats()["pending"] == 0
+
+
+def test_message_after_a_held_one_does_not_overtake_it():
+    limiter = _limiter("device * 1/s burst 1 collapse")
+    delivered = []
+    limiter.submit("st", "d1", "temperature", lambda: delivered.append("a"), now=0.0)
+    limiter.submit("st", "d1", "temperature", lambda: delivered.append("b"), now=0.0)
+    # tokens are back, but "b" is still held: "c" replaces it instead of passing
+    assert limiter.submit("st", "d1", "temperature", lambda: delivered.append("c"), now=5.0) == "collapsed"
+    limiter.release(now=5.0)
+    assert delivered == ["a", "c"]
+
+
+def test_device_flag_set_and_cleared():
+    flags = []
+    limiter = _limiter("device * 1/s burst 1 drop", flags=flags)
+    limiter.submit("st", "d1", "battery", lambda: None, now=0.0)
+    limiter.submit("st", "d1", "battery", lambda: None, now=0.0)
+    limiter.submit("st", "d1", "battery", lambda: None, now=0.0)
+    assert flags == [("st", "d1", True)]
+    assert limiter.stats()["flagged"][0]["dropped"] == 2
+    limiter.release(now=30.0)
+    assert flags == [("st", "d1", True)]
+    limiter.release(now=61.0)
+    assert flags == [("st", "d1", True), ("st", "d1", False)]
+
+
+def test_stadium_limit_does_not_flag_the_device():
+    flags = []
+    limiter = _limiter("stadium * 1/s burst 1 drop", flags=flags)
+    limiter.submit("st", "d1", "battery", lambda: None, now=0.0)
+    limiter.submit("st", "d1", "battery", lambda: None, now=0.0)
+    assert flags == []
+    assert limiter.stats()["by_stadium"]["st"]["dropped"] == 1
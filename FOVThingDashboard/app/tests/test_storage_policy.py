@@ -0,0 +1,106 @@
+import pytest
+
+from storage_policy import DEFAULT_POLICIES, StorageFilter, StoragePolicy
+
+
+def _filter(*texts):
+    return StorageFilter([StoragePolicy.parse(t) for t in texts])
+
+
+def _feed(f, values, metric, step=60.0):
+    """Push values one per `step` seconds; returns the ones that were stored."""
+    kept = []
+    for i, v in enumerate(values):
+        now = i * step
+        if f.admit("d1", "marvel", metric, v, now=now):
+            f.stored("d1", "marvel", metric, v, now)
+            kept.append(v)
+    return kept
+
+
+def test_parse():
+    p = StoragePolicy.parse("temperature deadband 2% heartbeat 15m")
+    assert (p.metric, p.mode, p.band, p.relative, p.heartbeat_s) == ("temperature", "deadband", 2.0, True, 900.0)
+    p = StoragePolicy.parse("version change heartbeat 24h")
+    assert (p.mode, p.heartbeat_s) == ("change", 86400.0)
+    assert StoragePolicy.parse("latency always").mode == "always"
+    for text in DEFAULT_POLICIES:
+        StoragePolicy.parse(text)
+
+
+@pytest.mark.parametrize("text", [
+    "battery deadband",             # deadband needs a band
+    "battery change 5",             # only deadband takes one
+    "battery sometimes",
+    "battery deadband 1 heartbeat soon",
+])
+def test_parse_rejects(text):
+    with pytest.raises(ValueError):
+        StoragePolicy.parse(text)
+
+
+def test_absolute_deadband():
+    f = _filter("battery deadband 1")
+    assert _feed(f, ["80", "80.5", "81", "81.2", "80.4", "79"], "battery") == ["80", "81.2", "79"]
+
+
+def test_relative_deadband():
+    f = _filter("temperature deadband 10%")
+    assert _feed(f, ["20", "21.5", "22.5", "24", "25"], "temperature") == ["20", "22.5", "25"]
+
+
+def test_slow_drift_is_caught_against_the_last_stored_value():
+    f = _filter("battery deadband 1")
+    values = [str(80 + 0.3 * i) for i in range(10)]
+    assert _feed(f, values, "battery") == [values[0], values[4], values[8]]
+
+
+def test_change_mode_and_non_numeric_deadband():
+    f = _filter("version change", "battery deadband 1")
+    assert _feed(f, ["1.0", "1.0", "1.1", "1.1", "1.0"], "version") == ["1.0", "1.1", "1.0"]
+    assert _feed(f, ["80", "n/a", "n/a", "80"], "battery") == ["80", "n/a", "80"]
+
+
+def test_heartbeat_stores_an_unchanged_value():
+    f = _filter("version change heartbeat 5m")
+    assert _feed(f, ["1.0"] * 12, "version", step=60.0) == ["1.0", "1.0", "1.0"]
+
+
+def test_unlisted_metric_is_always_stored():
+    f = _filter("battery deadband 1")
+    assert _feed(f, ["5", "5", "5"], "latency") == ["5", "5", "5"]
+
+
+def test_admit_alone_does_not_move_the_reference():
+    f = _filter("battery deadband 1")
+    assert f.admit("d1", "marvel", "battery", "80", now=0)
+    f.stored("d1", "marvel", "battery", "80", 0)
+    # admitted but the write failed: "82" was never stored
+    assert f.admit("d1", "marvel", "battery", "82", now=1)
+    assert f.admit("d1", "marvel", "battery", "81.5", now=2)
+
+
+def test_series_are_kept_apart():
+    f = _filter("battery deadband 1")
+    for device, stadium in [("d1", "marvel"), ("d1", "aviva"), ("d2", "marvel")]:
+        assert f.admit(device, stadium, "battery", "80", now=0)
+        f.stored(device, stadium, "battery", "80", 0)
+    assert not f.admit("d1", "aviva", "battery", "80.5", now=1)
+
+
+def test_stats():
+    f = _filter("battery deadband 1")
+    _feed(f, ["80", "80", "80", "90"], "battery")
+    stats = f.stats()
+    assert (stats["received"], stats["stored"], stats["reduction_percent"]) == (4, 2, 50.0)
+    assert stats["metrics"]["battery"]["reduction_percent"] == 50.0
+    assert _filter().stats()["reduction_percent"] is None
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("STORAGE_POLICIES", "battery deadband 5; ;latency always")
+    assert StorageFilter.from_env().stats()["policies"] == ["battery deadband 5", "latency always"]
+    monkeypatch.setenv("STORAGE_POLICIES", "")
+    assert StorageFilter.from_env().stats()["policies"] == []
+    monkeypatch.delenv("STORAGE_POLICIES")
+    assert StorageFilter.from_env().stats()["policies"] == DEFAULT_POLICIES
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from timeseries import align, downsample, format_ts, lttb, minmax, parse_ts
+
+
+def _series(n=5000, seed=1):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(0.5, 1.5, n)) + 1.7e9
+    y = np.sin(np.arange(n) / 50.0) * 10 + rng.normal(0, 1, n)
+    return x, y
+
+
+def test_timestamps_round_trip():
+    stamps = ["2026-09-09 07:53:27.152794", "2026-09-09 07:53:28.000000", "2026-10-19 00:00:00.000001"]
+    secs = parse_ts(stamps)
+    assert secs[1] - secs[0] == pytest.approx(0.847206)
+    assert format_ts(secs) == stamps
+
+
+@pytest.mark.parametrize("fn", [lttb, minmax])
+@pytest.mark.parametrize("n_out", [3, 10, 101, 1000])
+def test_keeps_ends_and_stays_within_budget(fn, n_out):
+    x, y = _series()
+    idx = fn(x, y, n_out)
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert len(idx) <= n_out
+    assert np.all(np.diff(idx) > 0)
+
+
+@pytest.mark.parametrize("fn", [lttb, minmax])
+def test_short_series_is_returned_whole(fn):
+    x, y = _series(50)
+    assert list(fn(x, y, 50)) == list(range(50))
+    assert list(fn(x, y, 500)) == list(range(50))
+
+
+def test_minmax_never_hides_a_spike():
+    x, y = _series()
+    y[3217] = 1e6
+    y[1234] = -1e6
+    idx = minmax(x, y, 20)
+    assert 3217 in idx and 1234 in idx
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[600] = 50.0
+    assert 600 in lttb(x, y, 20)
+
+
+def test_downsample_method():
+    x, y = _series()
+    assert list(downsample(x, y, 100)) == list(lttb(x, y, 100))
+    assert list(downsample(x, y, 100, "minmax")) == list(minmax(x, y, 100))
+    with pytest.raises(ValueError):
+        downsample(x, y, 100, "average")
+
+
+def _samples():
+    # two series on a 10 s grid starting at t=100; bin 2 is empty for column 1
+    x = np.array([101.0, 105.0, 109.0, 112.0, 103.0, 115.0, 125.0, 95.0, 170.0])
+    y = np.array([1.0, 5.0, 3.0, 7.0, 10.0, 20.0, 40.0, 99.0, 99.0])
+    col = np.array([0, 0, 0, 0, 1, 1, 1, 0, 1])
+    return x, y, col
+
+
+@pytest.mark.parametrize("agg, expected", [
+    ("mean", [[3.0, 10.0], [7.0, 20.0], [np.nan, 40.0]]),
+    ("min", [[1.0, 10.0], [7.0, 20.0], [np.nan, 40.0]]),
+    ("max", [[5.0, 10.0], [7.0, 20.0], [np.nan, 40.0]]),
+    ("last", [[3.0, 10.0], [7.0, 20.0], [np.nan, 40.0]]),
+])
+def test_align(agg, expected):
+    x, y, col = _samples()
+    out = align(x, y, col, n_cols=2, start=100.0, step=10.0, n_bins=3, agg=agg)
+    # samples before the start (95) and after the last bin (170) are dropped
+    np.testing.assert_array_equal(out, np.array(expected))
+
+
+def test_align_empty_and_bad_agg():
+    out = align(np.array([1.0]), np.array([1.0]), np.array([0]), n_cols=2, start=100.0, step=1.0, n_bins=4)
+    assert out.shape == (4, 2) and np.isnan(out).all()
+    with pytest.raises(ValueError):
+        align(np.array([]), np.array([]), np.array([], dtype=np.int64), 1, 0.0, 1.0, 1, agg="median")
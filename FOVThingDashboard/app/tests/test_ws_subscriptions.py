@@ -0,0 +1,78 @@
+import itertools
+import random
+
+from ws_subscriptions import WILDCARD, SubscriptionIndex, event_address
+
+STADIUMS = ["marvel", "aviva", WILDCARD]
+DEVICES = ["fov-1", "fov-2", "relay:r1", WILDCARD]
+METRICS = ["battery", "temperature", WILDCARD]
+
+
+def _matches(pattern, stadium, device, metric):
+    s, d, m = pattern
+    return (
+        (s == WILDCARD or s == stadium)
+        and (d == WILDCARD or d == device)
+        and (metric is None or m == WILDCARD or m == metric)
+    )
+
+
+def test_match_agrees_with_brute_force():
+    rng = random.Random(5)
+    index, subs = SubscriptionIndex(), {}
+    sockets = [object() for _ in range(30)]
+    for ws in sockets:
+        subs[ws] = set()
+        for _ in range(rng.randint(1, 4)):
+            p = (rng.choice(STADIUMS), rng.choice(DEVICES), rng.choice(METRICS))
+            index.add(ws, p)
+            subs[ws].add(p)
+    for ws in rng.sample(sockets, 8):
+        p = rng.choice(sorted(subs[ws]))
+        assert index.remove(ws, p)
+        subs[ws].discard(p)
+    for ws in rng.sample(sockets, 4):
+        index.remove_socket(ws)
+        subs[ws] = set()
+
+    events = itertools.product(["marvel", "aviva", None], DEVICES[:-1], METRICS[:-1] + [None])
+    for stadium, device, metric in events:
+        expected = {ws for ws, ps in subs.items() if any(_matches(p, stadium, device, metric) for p in ps)}
+        assert index.match(stadium, device, metric) == expected, (stadium, device, metric)
+
+
+def test_event_without_metric_reaches_every_metric_of_the_device():
+    index, ws = SubscriptionIndex(), object()
+    index.add(ws, ("marvel", "fov-1", "battery"))
+    assert index.match("marvel", "fov-1") == {ws}
+    assert index.match("marvel", "fov-1", "temperature") == set()
+    assert index.match("marvel", "fov-2") == set()
+
+
+def test_remove_prunes_the_trie():
+    index, ws = SubscriptionIndex(), object()
+    index.add(ws, ("marvel", "fov-1", "battery"))
+    index.add(ws, ("marvel", "fov-1", "temperature"))
+    assert not index.remove(ws, ("marvel", "fov-1", "latency"))
+    assert index.remove(ws, ("marvel", "fov-1", "battery"))
+    assert index.remove(ws, ("marvel", "fov-1", "temperature"))
+    assert index._trie == {}
+    assert index.patterns(ws) == []
+
+
+def test_remove_socket():
+    index, a, b = SubscriptionIndex(), object(), object()
+    index.add(a, ("*", "*", "*"))
+    index.add(a, ("marvel", "fov-1", "*"))
+    index.add(b, ("marvel", "fov-1", "*"))
+    index.remove_socket(a)
+    assert index.match("marvel", "fov-1") == {b}
+    assert index.stats() == {"sockets": 1, "patterns": 1}
+    index.remove_socket(a)      # twice is harmless
+
+
+def test_event_address():
+    assert event_address("alert:fov-1") == "fov-1"
+    assert event_address("anomaly:fov-1") == "fov-1"
+    assert event_address("relay:r1") == "relay:r1"
+    assert event_address("fov-1") == "fov-1"
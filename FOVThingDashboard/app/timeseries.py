@@ -0,0 +1,139 @@
+"""
+Time-series helpers for chart endpoints (NumPy).
+
+`downsample(x, y, max_points, method)` returns the *indices* of the points
+to keep, so callers can slice whatever columns they hold:
+
+* "lttb"   - Largest-Triangle-Three-Buckets: per bucket, keeps the point
+             forming the largest triangle with the previously kept point
+             and the next bucket's mean. Best visual fidelity for lines.
+* "minmax" - min and max of every bucket (fully vectorised); never hides
+             a spike, good for spiky metrics such as latency.
+
+x must be increasing (e.g. epoch seconds), y numeric, both 1-D float arrays.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def parse_ts(values) -> np.ndarray:
+    """SQLite/ISO timestamp strings → float epoch seconds (vectorised)."""
+    return np.array(values, dtype="datetime64[us]").astype(np.int64) / 1e6
+
+
+def format_ts(seconds: np.ndarray) -> list[str]:
+    """Float epoch seconds → "YYYY-MM-DD HH:MM:SS.ffffff" (the DB's own format)."""
+    stamps = np.datetime_as_string(np.round(seconds * 1e6).astype("datetime64[us]"), unit="us")
+    return [s.replace("T", " ") for s in stamps]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets over the interior points; first and last are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    csx = np.concatenate(([0.0], np.cumsum(x)))
+    csy = np.concatenate(([0.0], np.cumsum(y)))
+    widths = ends - starts
+    avg_x = (csx[ends] - csx[starts]) / widths
+    avg_y = (csy[ends] - csy[starts]) / widths
+    # "next" point for the last bucket is the final sample
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def _first_per_bucket(mask: np.ndarray, bucket_of: np.ndarray) -> np.ndarray:
+    idx = np.flatnonzero(mask)
+    _, first = np.unique(bucket_of[idx], return_index=True)
+    return idx[first]
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(x)
+    if n_out < 4:
+        # no room for a bucket's min *and* max next to the two ends
+        return lttb(x, y, n_out)
+    n_buckets = (n_out - 2) // 2
+    if n_out >= n or n_buckets >= n:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket_of = np.repeat(np.arange(n_buckets), np.diff(edges))
+    lows = np.minimum.reduceat(y, edges[:-1])
+    highs = np.maximum.reduceat(y, edges[:-1])
+    keep = np.concatenate((
+        [0, n - 1],
+        _first_per_bucket(y == lows[bucket_of], bucket_of),
+        _first_per_bucket(y == highs[bucket_of], bucket_of),
+    ))
+    return np.unique(keep)   # sorted, de-duplicated (flat buckets give min == max)
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int, method: Optional[str] = "lttb") -> np.ndarray:
+    if method == "minmax":
+        return minmax(x, y, max_points)
+    if method in (None, "lttb"):
+        return lttb(x, y, max_points)
+    raise ValueError(f"method must be one of {METHODS}")
+
+
+AGGREGATES = ("mean", "min", "max", "last")
+
+
+def align(
+    x: np.ndarray,
+    y: np.ndarray,
+    col: np.ndarray,
+    n_cols: int,
+    start: float,
+    step: float,
+    n_bins: int,
+    agg: str = "mean",
+) -> np.ndarray:
+    """
+    Resample scattered samples of several series onto one time grid.
+
+    x: epoch seconds, y: values, col: series index (0..n_cols-1) per sample.
+    Returns an (n_bins × n_cols) matrix, NaN where a bin had no sample.
+    """
+    if agg not in AGGREGATES:
+        raise ValueError(f"agg must be one of {AGGREGATES}")
+    out = np.full(n_bins * n_cols, np.nan)
+    bins = np.floor((x - start) / step).astype(np.int64)
+    ok = (bins >= 0) & (bins < n_bins)
+    cell = bins[ok] * n_cols + col[ok]
+    y = y[ok]
+    if not len(cell):
+        return out.reshape(n_bins, n_cols)
+
+    if agg == "mean":
+        sums = np.bincount(cell, weights=y, minlength=n_bins * n_cols)
+        counts = np.bincount(cell, minlength=n_bins * n_cols)
+        hit = counts > 0
+        out[hit] = sums[hit] / counts[hit]
+    elif agg == "min":
+        np.fmin.at(out, cell, y)
+    elif agg == "max":
+        np.fmax.at(out, cell, y)
+    else:  # last: samples arrive oldest first → first hit in the reversed order
+        cells, idx = np.unique(cell[::-1], return_index=True)
+        out[cells] = y[::-1][idx]
+    return out.reshape(n_bins, n_cols)
@@ -1,30 +1,102 @@
 # websockets_manager.py
+import json
 from typing import Dict, Optional
 from fastapi import WebSocket
 from fastapi.encoders import jsonable_encoder
 
+from ws_encoding import DEFAULT_ENCODING, FrameEncoder, send_encoded
+from ws_subscriptions import WILDCARD, SubscriptionIndex, event_address, pattern_dict
+
 class WebSocketManager:
-    # Track sockets AND per-socket context (stadium / admin)
-    clients: Dict[WebSocket, Dict[str, object]] = {}  # {ws: {"stadium": Optional[str], "is_admin": bool}}
+    # Track sockets AND per-socket context (stadium / admin / wire encoding)
+    clients: Dict[WebSocket, Dict[str, object]] = {}  # {ws: {"stadium": Optional[str], "is_admin": bool, "encoding": str}}
+    # (stadium, device, metric) patterns → sockets; see ws_subscriptions.py
+    subscriptions = SubscriptionIndex()
 
     @classmethod
-    async def connect(cls, websocket: WebSocket, stadium: Optional[str], is_admin: bool):
+    async def connect(cls, websocket: WebSocket, stadium: Optional[str], is_admin: bool, encoding: str = DEFAULT_ENCODING):
         await websocket.accept()
-        cls.clients[websocket] = {"stadium": stadium, "is_admin": is_admin}
+        cls.clients[websocket] = {"stadium": stadium, "is_admin": is_admin, "encoding": encoding}
+        # until the client says otherwise it gets everything it may see
+        cls.subscriptions.add(websocket, (WILDCARD if is_admin else stadium, WILDCARD, WILDCARD))
 
     @classmethod
     async def disconnect(cls, websocket: WebSocket):
         cls.clients.pop(websocket, None)
+        cls.subscriptions.remove_socket(websocket)
+
+    @classmethod
+    async def send(cls, websocket: WebSocket, topic: str, message: dict):
+        """Send one frame to one socket in its negotiated encoding."""
+        ctx = cls.clients.get(websocket, {})
+        frame = FrameEncoder({"topic": topic, "message": jsonable_encoder(message)})
+        await send_encoded(websocket, frame.get(ctx.get("encoding", DEFAULT_ENCODING)))
+
+    @classmethod
+    def _pattern(cls, ctx: dict, msg: dict) -> tuple:
+        """Pattern from a subscribe/unsubscribe message, confined to the socket's JWT scope."""
+        stadium = str(msg.get("stadium") or WILDCARD)
+        if not ctx.get("is_admin"):
+            if stadium not in (WILDCARD, ctx.get("stadium")):
+                raise PermissionError(f"not allowed to subscribe to stadium {stadium!r}")
+            stadium = ctx.get("stadium")
+        return stadium, str(msg.get("device") or WILDCARD), str(msg.get("metric") or WILDCARD)
+
+    @classmethod
+    async def handle_message(cls, websocket: WebSocket, text: str) -> bool:
+        """
+        Client → server subscription ops (JSON text frames):
+            {"op": "subscribe",   "stadium": "kia", "device": "tab-1", "metric": "battery"}
+            {"op": "unsubscribe", ...same fields...}   or   {"op": "unsubscribe", "all": true}
+            {"op": "subscriptions"}
+        Omitted fields mean "*". Each op is answered with `ws:subscriptions`
+        (the socket's current patterns) or `ws:error`. Returns False if
+        `text` was not an op, so the caller can treat it as a keepalive.
+        """
+        try:
+            msg = json.loads(text)
+        except ValueError:
+            return False
+        if not isinstance(msg, dict) or "op" not in msg:
+            return False
+        ctx = cls.clients.get(websocket)
+        if ctx is None:
+            return True
+        op = msg["op"]
+        try:
+            if op == "subscribe":
+                cls.subscriptions.add(websocket, cls._pattern(ctx, msg))
+            elif op == "unsubscribe":
+                if msg.get("all"):
+                    cls.subscriptions.remove_socket(websocket)
+                else:
+                    cls.subscriptions.remove(websocket, cls._pattern(ctx, msg))
+            elif op != "subscriptions":
+                raise ValueError(f"unknown op {op!r}")
+        except (PermissionError, ValueError) as e:
+            await cls.send(websocket, "ws:error", {"op": op, "error": str(e)})
+            return True
+        await cls.send(websocket, "ws:subscriptions", {
+            "subscriptions": [pattern_dict(p) for p in cls.subscriptions.patterns(websocket)],
+        })
+        return True
 
     @classmethod
-    async def notify_clients(cls, topic: str, message: dict, stadium: Optional[str] = None):
-        """Broadcast only to admin OR sockets whose ctx.stadium matches the event stadium."""
-        safe_message = jsonable_encoder(message)
+    async def notify_clients(cls, topic: str, message: dict, stadium: Optional[str] = None, metric: Optional[str] = None):
+        """Send to the sockets subscribed to this (stadium, device, metric); admins may see any stadium."""
+        targets = cls.subscriptions.match(stadium, event_address(topic), metric)
+        if not targets:
+            return
+        # encoded at most once per encoding, however many sockets receive it
+        frame = FrameEncoder({"topic": topic, "message": jsonable_encoder(message)})
         to_drop = []
-        for ws, ctx in list(cls.clients.items()):
+        for ws in targets:
+            ctx = cls.clients.get(ws)
+            if ctx is None:
+                continue
             try:
                 if ctx.get("is_admin") or (stadium is not None and ctx.get("stadium") == stadium):
-                    await ws.send_json({"topic": topic, "message": safe_message})
+                    await send_encoded(ws, frame.get(ctx.get("encoding", DEFAULT_ENCODING)))
             except Exception as e:
                 print(f"WS send failed; dropping client: {e}")
                 to_drop.append(ws)
@@ -37,8 +109,8 @@ class WebSocketManager:
         await cls.connect(websocket, stadium=stadium, is_admin=is_admin)
         try:
             while True:
-                # keepalive / ignore incoming
-                await websocket.receive_text()
+                # subscription ops; anything else is keepalive
+                await cls.handle_message(websocket, await websocket.receive_text())
         except Exception as e:
             print(f"WebSocket error: {e}")
         finally:
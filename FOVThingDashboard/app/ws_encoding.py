@@ -0,0 +1,79 @@
+"""
+WebSocket frame encodings, negotiated per client with `/ws?encoding=...`.
+
+    json     text frames (default, what the React client speaks)
+    msgpack  binary frames, needs `msgpack`
+    cbor     binary frames, needs `cbor2`
+
+Compression is orthogonal: permessage-deflate is negotiated by the browser
+and uvicorn's `websockets` implementation (on by default, see
+WS_PER_MESSAGE_DEFLATE) and applies to any of the above.
+
+`FrameEncoder` encodes a frame at most once per encoding, so a broadcast to
+200 sockets costs one `json.dumps` (plus one `packb` if any client asked
+for msgpack) instead of one per socket.
+"""
+
+import json
+from typing import Callable, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # optional
+    cbor2 = None
+
+DEFAULT_ENCODING = "json"
+
+Encoded = Union[str, bytes]
+
+
+def _json(frame: dict) -> str:
+    return json.dumps(frame, separators=(",", ":"))
+
+
+ENCODERS: dict[str, Callable[[dict], Encoded]] = {"json": _json}
+if msgpack is not None:
+    ENCODERS["msgpack"] = lambda frame: msgpack.packb(frame, use_bin_type=True)
+if cbor2 is not None:
+    ENCODERS["cbor"] = cbor2.dumps
+
+
+def negotiate(requested: Optional[str]) -> str:
+    """Return a supported encoding name, falling back to JSON."""
+    name = (requested or DEFAULT_ENCODING).strip().lower()
+    if name not in ENCODERS:
+        if name != DEFAULT_ENCODING:
+            print(f"WS encoding '{name}' unavailable, using {DEFAULT_ENCODING}")
+        return DEFAULT_ENCODING
+    return name
+
+
+def encode(frame: dict, encoding: str) -> Encoded:
+    return ENCODERS[encoding](frame)
+
+
+class FrameEncoder:
+    """Lazily encodes one already-jsonable frame, memoised per encoding."""
+    __slots__ = ("frame", "_cache")
+
+    def __init__(self, frame: dict):
+        self.frame = frame
+        self._cache: dict[str, Encoded] = {}
+
+    def get(self, encoding: str) -> Encoded:
+        data = self._cache.get(encoding)
+        if data is None:
+            data = self._cache[encoding] = encode(self.frame, encoding)
+        return data
+
+
+async def send_encoded(ws, data: Encoded) -> None:
+    if isinstance(data, bytes):
+        await ws.send_bytes(data)
+    else:
+        await ws.send_text(data)
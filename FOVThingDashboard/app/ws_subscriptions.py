@@ -0,0 +1,96 @@
+"""
+Per-socket WebSocket subscriptions, indexed for fan-out.
+
+A subscription is a (stadium, device, metric) pattern where any part may
+be "*". Events are addressed the same way:
+
+    device update        (stadium, device name, metric that changed or None)
+    alert:<device>       (stadium, device name, None)
+    anomaly:<device>     (stadium, device name, None)
+    relay:<id>           (stadium, "relay:<id>", None)
+    summary:<slug>       (slug, "summary:<slug>", None)
+
+An event without a metric (connectivity flips, alerts, bus snapshots)
+goes to every subscription on that device, whatever its metric.
+
+Patterns live in a trie stadium → device → metric → sockets, so finding
+the sockets for an event is at most four dict lookups (exact or "*" at the
+stadium and device levels) instead of a pass over every client.
+"""
+
+from typing import Any, Optional
+
+WILDCARD = "*"
+
+Pattern = tuple[str, str, str]
+
+
+def event_address(topic: str) -> str:
+    """The 'device' part of an event's address."""
+    return topic.split(":", 1)[1] if topic.startswith(("alert:", "anomaly:")) else topic
+
+
+def pattern_dict(p: Pattern) -> dict:
+    return {"stadium": p[0], "device": p[1], "metric": p[2]}
+
+
+class SubscriptionIndex:
+    def __init__(self):
+        self._trie: dict[str, dict[str, dict[str, set]]] = {}
+        self._by_socket: dict[Any, set[Pattern]] = {}
+
+    def add(self, ws, pattern: Pattern) -> None:
+        stadium, device, metric = pattern
+        self._trie.setdefault(stadium, {}).setdefault(device, {}).setdefault(metric, set()).add(ws)
+        self._by_socket.setdefault(ws, set()).add(pattern)
+
+    def remove(self, ws, pattern: Pattern) -> bool:
+        patterns = self._by_socket.get(ws)
+        if not patterns or pattern not in patterns:
+            return False
+        patterns.discard(pattern)
+        stadium, device, metric = pattern
+        devices = self._trie[stadium]
+        metrics = devices[device]
+        metrics[metric].discard(ws)
+        # prune empty branches so the trie only holds live patterns
+        if not metrics[metric]:
+            del metrics[metric]
+            if not metrics:
+                del devices[device]
+                if not devices:
+                    del self._trie[stadium]
+        return True
+
+    def remove_socket(self, ws) -> None:
+        for pattern in list(self._by_socket.get(ws, ())):
+            self.remove(ws, pattern)
+        self._by_socket.pop(ws, None)
+
+    def patterns(self, ws) -> list[Pattern]:
+        return sorted(self._by_socket.get(ws, ()))
+
+    def match(self, stadium: Optional[str], device: str, metric: Optional[str] = None) -> set:
+        out: set = set()
+        stadiums = (stadium, WILDCARD) if stadium is not None else (WILDCARD,)
+        for s in stadiums:
+            devices = self._trie.get(s)
+            if not devices:
+                continue
+            for d in (device, WILDCARD):
+                metrics = devices.get(d)
+                if not metrics:
+                    continue
+                if metric is None:
+                    for sockets in metrics.values():
+                        out |= sockets
+                else:
+                    out |= metrics.get(metric, set())
+                    out |= metrics.get(WILDCARD, set())
+        return out
+
+    def stats(self) -> dict:
+        return {
+            "sockets": len(self._by_socket),
+            "patterns": sum(len(p) for p in self._by_socket.values()),
+        }
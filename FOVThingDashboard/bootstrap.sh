@@ -218,7 +218,8 @@ Type=simple
 User=www-data
 WorkingDirectory=$APP_DIR
 Environment="PATH=$APP_DIR/venv/bin"
-ExecStart=$APP_DIR/venv/bin/uvicorn main:app --host 127.0.0.1 --port 8000
+Environment="WS_PER_MESSAGE_DEFLATE=1"
+ExecStart=$APP_DIR/venv/bin/uvicorn main:app --host 127.0.0.1 --port 8000 --ws-per-message-deflate \${WS_PER_MESSAGE_DEFLATE}
 Restart=always
 RestartSec=10
 StandardOutput=journal
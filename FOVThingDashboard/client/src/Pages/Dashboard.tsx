@@ -20,6 +20,7 @@ interface Device {
   firstSeen: string;
   latencyMs?: number;
   stadium?: string;
+  rateLimited?: boolean;
 }
 
 type Filter = "all" | "online" | "offline";
@@ -101,6 +102,28 @@ const Dashboard: React.FC<Props> = ({ token, onUnauthorized }) => {
           return;
         }
 
+        if (data.topic?.startsWith("alert:")) {
+          const a = data.message;
+          if (a.state === "fired") {
+            toast.warn(`${a.device}: ${a.rule} (${a.metric}=${a.value})`, { autoClose: 60_000 });
+          }
+          return;
+        }
+
+        if (data.topic?.startsWith("anomaly:")) {
+          const a = data.message;
+          if (a.state === "fired") {
+            toast.info(`${a.device}: ${a.kind.replace(/_/g, " ")} (score ${a.score})`, { autoClose: 60_000 });
+          }
+          return;
+        }
+
+        // fleet summary (also at /api/stadiums/{slug}/summary) - not a device
+        if (data.topic?.startsWith("summary:")) return;
+
+        // replies to subscribe/unsubscribe ops - not a device
+        if (data.topic?.startsWith("ws:")) return;
+
         setDevices(prevDevices => {
           const prev = prevDevices[data.topic];
           const next = { ...prev, ...data.message };
@@ -121,6 +144,11 @@ const Dashboard: React.FC<Props> = ({ token, onUnauthorized }) => {
             if (id) { toast.dismiss(id); delete offlineToastIds.current[next.name]; }
           }
 
+          // flood protection kicked in (see ratelimit.py)
+          if (next.rateLimited && !prev?.rateLimited) {
+            toast.warning(`${next.name} is publishing too fast - messages are being limited`);
+          }
+
           return { ...prevDevices, [data.topic]: next };
         });
       } catch (error) {
@@ -326,6 +354,7 @@ return (
                       temperature={device.temperature}
                       firmwareVersion={device.firmwareVersion}
                       latencyMs={device.latencyMs}
+                      rateLimited={device.rateLimited}
                     />
                   </div>
                 ))}
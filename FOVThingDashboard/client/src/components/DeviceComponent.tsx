@@ -17,6 +17,7 @@ interface DeviceProps {
     temperature?: number;
     firmwareVersion?: string;
     latencyMs?: number;
+    rateLimited?: boolean;
 }
 
 function DeviceComponent({
@@ -26,6 +27,7 @@ function DeviceComponent({
     temperature,
     firmwareVersion,
     latencyMs = -1,
+    rateLimited = false,
 }: DeviceProps) {
     const [isModalOpen, setIsModalOpen] = useState(false);
     const [history, setHistory] = useState<HistoryEntry[]>([]);
@@ -88,7 +90,17 @@ function DeviceComponent({
                 className="bg-card text-card-foreground rounded-lg shadow-md p-4 flex flex-col space-y-4 cursor-pointer hover:shadow-lg transition-shadow"
                 onClick={handleClick}
             >
-                <h3 className="text-sm font-semibold">{name}</h3>
+                <div className="flex items-center justify-between">
+                    <h3 className="text-sm font-semibold">{name}</h3>
+                    {rateLimited && (
+                        <span
+                            className="text-xs font-medium text-red-700 bg-red-100 rounded-full px-2 py-0.5"
+                            title="Publishing faster than its rate limit; extra messages are dropped or collapsed"
+                        >
+                            Rate limited
+                        </span>
+                    )}
+                </div>
                 <div className="flex items-center space-x-2">
                     <WifiIcon className={`h-5 w-5 ${wifiConnected ? 'text-green-500' : 'text-red-500'}`} />
                     <span>{wifiConnected ? 'Connected' : 'Disconnected'}</span>